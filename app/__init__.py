@@ -14,6 +14,10 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Opciones del motor de BD (pool de conexiones fuera de SQLite)
+    from app import basedatos
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = basedatos.opciones_motor(app.config)
+
     # Inicializar las extensiones con la aplicación
     db.init_app(app)
     login_manager.init_app(app)
@@ -25,8 +29,15 @@ def create_app(config_class=Config):
 
 
     # Importar y registrar rutas y modelos
-    from app import routes, models
+    from app import routes, models, kardex, tareas, reportes_pdf, importacion  # registran sus tareas
+    from app import esquema, cache, respuestas, imagenes
     app.register_blueprint(routes.bp) 
+    cache.iniciar(app)
+    respuestas.registrar(app)
+    kardex.registrar_comandos(app)
+    basedatos.registrar_comandos(app)
+    esquema.registrar_comandos(app)
+    imagenes.registrar_comandos(app)
 
     # Función que Flask-Login usa para recargar el objeto de usuario desde la sesión
     @login_manager.user_loader
@@ -37,6 +48,26 @@ def create_app(config_class=Config):
 
     # Inicializar la base de datos (crea las tablas si no existen)
     with app.app_context():
-        db.create_all() 
+        # PRAGMA de SQLite (WAL, busy_timeout, caché...) en cada conexión nueva
+        basedatos.configurar(db.engine, app.config)
+
+        esquema.crear_tablas()
+
+        # Migraciones pendientes (columnas e índices nuevos en tablas que ya existían)
+        esquema.actualizar()
+
+        # Índice de búsqueda de texto completo (FTS5) para productos
+        from app import busqueda
+        app.extensions['busqueda_fts'] = busqueda.crear_indice()
+
+        # Pool de tareas en segundo plano (reportes PDF)
+        tareas.iniciar(app)
+
+        # Caché en disco de los archivos de reportes y contador de versión de los datos
+        from app import artefactos
+        artefactos.iniciar(app)
+
+        # Pool de procesamiento de fotos (reducción, recompresión y miniaturas)
+        imagenes.iniciar(app)
     
     return app
\ No newline at end of file
@@ -0,0 +1,162 @@
+# app/artefactos.py
+# Caché en disco de los archivos de reportes (Excel y PDF).
+# Exportar dos veces el mismo reporte sin que los datos hayan cambiado ya no lo
+# genera de nuevo: cada archivo se guarda con un nombre que es el hash de
+# (tipo de reporte, filtros, versión de los datos). La versión es un contador
+# en la BD (VersionDatos) que avanza en cada commit que escribe productos,
+# movimientos o usuarios, así que un cambio hace que la próxima exportación
+# tenga otra clave y se genere; los archivos viejos se van descartando por
+# tamaño (LRU por fecha de último uso) hasta ARTEFACTOS_MAXIMO_MB.
+# La clave es también el ETag de la respuesta: con If-None-Match el navegador
+# recibe un 304 sin que se lea ni se envíe el archivo.
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from flask import current_app, request, send_file, Response
+from sqlalchemy import event, update, insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import tablas_escritas
+from app.models import VersionDatos
+
+# Tablas cuyos cambios invalidan los reportes guardados
+TABLAS_VERSIONADAS = {'producto', 'ingreso', 'salida', 'usuario'}
+
+_lock_recorte = threading.Lock()
+
+
+# === --- Versión de los datos --- ===
+
+def version():
+    return db.session.query(VersionDatos.version).filter(VersionDatos.id == 1).scalar() or 0
+
+
+def version_instantanea():
+    """
+    version() leída dentro de una transacción de lectura de la sesión: hasta el
+    próximo commit o rollback, las consultas que generan el reporte ven los
+    mismos datos que esa versión aunque otro proceso confirme cambios.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        # El nivel solo se puede elegir antes de la primera consulta de la transacción
+        if not db.session.in_transaction():
+            db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        return version()
+    conexion = db.session.connection()
+    # pysqlite no abre la transacción con un SELECT (solo antes de escribir): sin
+    # este BEGIN cada consulta leería los últimos datos confirmados (WAL)
+    if not conexion.connection.dbapi_connection.in_transaction:
+        conexion.exec_driver_sql('BEGIN')
+    return version()
+
+
+@event.listens_for(Session, 'before_commit')
+def _avanzar_version(session):
+    # El flush anota las tablas de los cambios pendientes (app/cache.py)
+    session.flush()
+    if not tablas_escritas(session) & TABLAS_VERSIONADAS:
+        return
+    tabla = VersionDatos.__table__
+    session.connection().execute(update(tabla).where(tabla.c.id == 1).values(version=tabla.c.version + 1))
+
+
+def iniciar(app):
+    """Crea el directorio de artefactos y la fila del contador. Requiere contexto de aplicación."""
+    os.makedirs(directorio(app), exist_ok=True)
+    if db.session.get(VersionDatos, 1) is None:
+        db.session.execute(insert(VersionDatos.__table__).values(id=1, version=0))
+        db.session.commit()
+
+
+# === --- Archivos en disco --- ===
+
+def directorio(app=None):
+    app = app or current_app
+    return app.config.get('ARTEFACTOS_DIRECTORIO') or os.path.join(app.instance_path, 'artefactos')
+
+
+def clave(tipo, parametros, version_datos):
+    crudo = json.dumps([tipo, parametros, version_datos], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+
+def buscar(clave_archivo, extension):
+    """Ruta del artefacto guardado o None. Marca el archivo como recién usado (LRU)."""
+    ruta = os.path.join(directorio(), clave_archivo + extension)
+    try:
+        os.utime(ruta)
+    except FileNotFoundError:
+        return None
+    return ruta
+
+
+def guardar(clave_archivo, extension, escribir):
+    """
+    Genera el artefacto con escribir(ruta_temporal) y lo publica de forma
+    atómica. Si escribir devuelve False (reporte vacío) no se guarda nada y
+    devuelve None; si no, la ruta final.
+    """
+    ruta = os.path.join(directorio(), clave_archivo + extension)
+    temporal = f'{ruta}.{uuid.uuid4().hex}.tmp'
+    try:
+        if escribir(temporal) is False:
+            return None
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    recortar()
+    return ruta
+
+
+def recortar(maximo=None):
+    """Borra los artefactos usados hace más tiempo hasta que el total entre en el límite."""
+    if maximo is None:
+        maximo = current_app.config['ARTEFACTOS_MAXIMO_MB'] * 1024 * 1024
+    with _lock_recorte:
+        archivos = []
+        with os.scandir(directorio()) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                    datos = entrada.stat()
+                    archivos.append((datos.st_mtime, datos.st_size, entrada.path))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= maximo:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass  # Otro proceso ya lo borró
+            total -= tamano
+
+
+# === --- Respuestas HTTP --- ===
+
+def enviar(tipo, parametros, nombre_descarga, mimetype, escribir):
+    """
+    Respuesta de descarga del reporte: 304 si el navegador ya tiene esta
+    versión, el artefacto guardado si existe o uno recién generado con
+    escribir(ruta). None si escribir devolvió False (sin datos).
+    """
+    extension = os.path.splitext(nombre_descarga)[1]
+    etag = clave(tipo, parametros, version_instantanea())
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+    else:
+        ruta = buscar(etag, extension) or guardar(etag, extension, escribir)
+        if ruta is None:
+            return None
+        # Se abre aquí: si el recorte lo borra mientras se envía, el archivo abierto sigue siendo legible
+        respuesta = send_file(open(ruta, 'rb'), download_name=nombre_descarga, mimetype=mimetype,
+                              as_attachment=True, etag=False)
+    respuesta.set_etag(etag)
+    # Cada descarga se revalida (puede haber datos nuevos), pero sin transferir el archivo si no cambió
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
@@ -0,0 +1,109 @@
+# app/basedatos.py
+# Ajustes del motor de base de datos.
+# SQLite: cada conexión nueva recibe los PRAGMA de producción (evento 'connect'
+# de SQLAlchemy). Con journal_mode=WAL los lectores (reportes largos) ya no
+# bloquean a quien registra salidas, y busy_timeout hace que un escritor espere
+# al otro en vez de fallar con "database is locked".
+# PostgreSQL u otro servidor (DATABASE_URL): opciones del pool de conexiones.
+# Cada valor se puede cambiar en config.py; None deja el valor por defecto.
+
+import click
+from sqlalchemy import event
+
+from app import db
+
+# Clave de configuración -> PRAGMA de SQLite
+PRAGMAS = [
+    ('SQLITE_JOURNAL_MODE', 'journal_mode'),
+    ('SQLITE_SYNCHRONOUS', 'synchronous'),
+    ('SQLITE_BUSY_TIMEOUT', 'busy_timeout'),
+    ('SQLITE_CACHE_SIZE', 'cache_size'),
+    ('SQLITE_MMAP_SIZE', 'mmap_size'),
+    ('SQLITE_TEMP_STORE', 'temp_store'),
+]
+
+# Clave de configuración -> argumento de create_engine (solo fuera de SQLite)
+OPCIONES_POOL = [
+    ('DB_POOL_SIZE', 'pool_size'),
+    ('DB_MAX_OVERFLOW', 'max_overflow'),
+    ('DB_POOL_PRE_PING', 'pool_pre_ping'),
+    ('DB_POOL_RECYCLE', 'pool_recycle'),
+]
+
+
+def es_sqlite(uri):
+    return (uri or '').startswith('sqlite')
+
+
+def opciones_motor(config):
+    """
+    Opciones de create_engine según la URI. Se combinan con
+    SQLALCHEMY_ENGINE_OPTIONS (lo definido ahí tiene prioridad).
+    """
+    opciones = {}
+    if not es_sqlite(config.get('SQLALCHEMY_DATABASE_URI')):
+        opciones = {argumento: config[clave] for clave, argumento in OPCIONES_POOL if config.get(clave) is not None}
+    opciones.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return opciones
+
+
+def _sentencias_pragma(config):
+    return [f'PRAGMA {pragma} = {config[clave]}' for clave, pragma in PRAGMAS if config.get(clave) is not None]
+
+
+def configurar(engine, config):
+    """Registra los PRAGMA en cada conexión nueva del motor (solo SQLite)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    sentencias = _sentencias_pragma(config)
+
+    @event.listens_for(engine, 'connect')
+    def _aplicar_pragmas(conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        try:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
+        finally:
+            cursor.close()
+
+
+def pragmas_actuales(conexion):
+    """Valores vigentes de los PRAGMA configurados (para diagnóstico)."""
+    return {pragma: conexion.exec_driver_sql(f'PRAGMA {pragma}').scalar() for _, pragma in PRAGMAS}
+
+
+class ContadorConsultas:
+    """
+    Cuenta las sentencias SQL que ejecuta el motor dentro de un bloque 'with'
+    (detección de consultas N+1 en reportes, ver tests/test_consultas.py).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sentencias = []
+
+    def _registrar(self, conexion, cursor, sentencia, parametros, contexto, executemany):
+        self.sentencias.append(sentencia)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._registrar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._registrar)
+
+    @property
+    def total(self):
+        return len(self.sentencias)
+
+
+def registrar_comandos(app):
+    @app.cli.command('db-pragmas')
+    def comando_pragmas():
+        """Muestra los PRAGMA vigentes de la conexión SQLite."""
+        if db.engine.dialect.name != 'sqlite':
+            click.echo(f'Motor {db.engine.dialect.name}: opciones de pool {opciones_motor(app.config)}')
+            return
+        with db.engine.connect() as conexion:
+            for pragma, valor in pragmas_actuales(conexion).items():
+                click.echo(f'{pragma} = {valor}')
@@ -0,0 +1,130 @@
+# app/busqueda.py
+# Motor de búsqueda de productos.
+# En SQLite se mantiene una tabla virtual FTS5 (tokenizador 'trigram') sobre
+# codigo y nombre, sincronizada con 'producto' mediante triggers. El trigram
+# permite encontrar fragmentos de códigos (ej: "57-0" dentro de "TB-57-012")
+# usando el índice invertido en lugar de recorrer toda la tabla con LIKE '%...%'.
+# Si la BD no es SQLite o no soporta FTS5, se usa el ILIKE de siempre.
+
+from flask import current_app
+from sqlalchemy import text, select, literal_column, table
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Producto
+
+TABLA_FTS = 'producto_fts'
+
+_SQL_TABLA = (
+    f"CREATE VIRTUAL TABLE {TABLA_FTS} USING fts5("
+    "codigo, nombre, content='producto', content_rowid='id', tokenize='trigram')"
+)
+
+_SQL_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON producto BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, codigo, nombre) VALUES (new.id, new.codigo, new.nombre);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON producto BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, codigo, nombre) VALUES ('delete', old.id, old.codigo, old.nombre);
+    END""",
+    # Solo se dispara si cambia el texto indexado (no en cada movimiento de stock)
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF codigo, nombre ON producto BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, codigo, nombre) VALUES ('delete', old.id, old.codigo, old.nombre);
+        INSERT INTO {TABLA_FTS}(rowid, codigo, nombre) VALUES (new.id, new.codigo, new.nombre);
+    END""",
+]
+
+# El tokenizador trigram necesita al menos 3 caracteres por término
+LONGITUD_MINIMA = 3
+
+# El autocompletado solo une con 'producto' los N candidatos más relevantes del
+# índice. FTS5 resuelve 'ORDER BY rank LIMIT N' dentro de la tabla virtual
+# (bm25 con un montículo de N), así que con términos muy comunes no se
+# materializan todas las coincidencias ni se pierden las mejores.
+CANDIDATOS_AUTOCOMPLETADO = 500
+
+
+def crear_indice():
+    """
+    Crea (si no existe) la tabla FTS5 y sus triggers. Al crearla por primera vez
+    se indexan los productos existentes con 'rebuild'.
+    Devuelve True si la búsqueda FTS quedó disponible.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as conn:
+            existe = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nombre"),
+                {'nombre': TABLA_FTS}
+            ).first()
+            if not existe:
+                conn.execute(text(_SQL_TABLA))
+                conn.execute(text(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')"))
+            for sql in _SQL_TRIGGERS:
+                conn.execute(text(sql))
+    except OperationalError as e:
+        # SQLite compilado sin FTS5 o sin el tokenizador trigram (< 3.34)
+        current_app.logger.warning(f"Búsqueda FTS5 no disponible, se usará ILIKE: {e}")
+        return False
+    return True
+
+
+def disponible():
+    return current_app.extensions.get('busqueda_fts', False)
+
+
+def _expresion_fts(termino):
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura: cada palabra
+    se entrecomilla (los operadores de FTS5 quedan como texto literal) y todas
+    deben aparecer. Devuelve None si algún término es demasiado corto.
+    """
+    palabras = (termino or '').split()
+    if not palabras or any(len(p) < LONGITUD_MINIMA for p in palabras):
+        return None
+    return ' '.join('"' + p.replace('"', '""') + '"' for p in palabras)
+
+
+def subconsulta(termino, candidatos=None):
+    """
+    Subconsulta (producto_id, rango) con los productos que coinciden con el
+    término, o None si no se puede usar FTS (en ese caso usar filtro_ilike).
+    El rango es bm25: valores menores = más relevante.
+    """
+    expresion = _expresion_fts(termino)
+    if expresion is None or not disponible():
+        return None
+    fts = table(TABLA_FTS)
+    consulta = select(
+        literal_column(f'{TABLA_FTS}.rowid').label('producto_id'),
+        literal_column(f'{TABLA_FTS}.rank').label('rango'),
+    ).select_from(fts).where(
+        text(f'{TABLA_FTS} MATCH :expresion_fts').bindparams(expresion_fts=expresion)
+    )
+    if candidatos:
+        # Sin ORDER BY el LIMIT cortaría en orden de rowid, no de relevancia
+        consulta = consulta.order_by(literal_column(f'{TABLA_FTS}.rank')).limit(candidatos)
+    return consulta.subquery('coincidencias')
+
+
+def filtro_ilike(termino):
+    return (Producto.nombre.ilike(f'%{termino}%')) | (Producto.codigo.ilike(f'%{termino}%'))
+
+
+def sugerencias(termino, limite=10, subalmacen=None):
+    """Resultados para el autocompletado: los más relevantes primero (opcionalmente de un subalmacén)."""
+    columnas = (Producto.id, Producto.codigo, Producto.nombre, Producto.subalmacen, Producto.cantidad, Producto.unidad)
+    coincidencias = subconsulta(termino, candidatos=None if subalmacen else CANDIDATOS_AUTOCOMPLETADO)
+    if coincidencias is not None:
+        consulta = db.session.query(*columnas) \
+            .join(coincidencias, coincidencias.c.producto_id == Producto.id) \
+            .order_by(coincidencias.c.rango)
+    else:
+        # Términos cortos: basta con un prefijo, que se corta al llegar al límite
+        consulta = db.session.query(*columnas).filter(
+            (Producto.codigo.ilike(f'{termino}%')) | (Producto.nombre.ilike(f'{termino}%'))
+        ).order_by(Producto.codigo)
+    if subalmacen:
+        consulta = consulta.filter(Producto.subalmacen == subalmacen)
+    return consulta.limit(limite).all()
@@ -0,0 +1,171 @@
+# app/cache.py
+# Caché en memoria de resúmenes calculados (totales por subalmacén, alertas,
+# resúmenes de reportes y rankings).
+# La mayoría de las visitas son refrescos del panel que no cambian nada: el
+# resultado de cada función marcada con @en_cache se guarda por sus argumentos
+# (LRU con vencimiento) junto con las tablas de las que depende.
+# La invalidación es exacta: los eventos de la sesión anotan qué tablas
+# (producto, ingreso, salida) se escribieron en la transacción, por el ORM
+# (flush) o con sentencias INSERT / UPDATE / DELETE, y al confirmarse
+# (after_commit) se descartan solo las entradas que dependen de esas tablas.
+# Una transacción revertida no invalida nada.
+# Solo se ven las escrituras que pasan por la sesión: un flush del ORM o
+# db.session.execute(insert / update / delete). Las sentencias enviadas con
+# session.connection().execute(...), db.engine.begin() / connect() o
+# exec_driver_sql no disparan do_orm_execute: si en la misma transacción no
+# hay un flush de esas tablas, la caché sigue sirviendo el valor anterior
+# hasta que venza (CACHE_RESUMENES_TTL). Quien escriba así debe llamar a
+# actual().invalidar({'tabla', ...}) después del commit. (Las escrituras
+# con la conexión dentro de un after_flush, como stock.actualizar_alertas y
+# los cortes del kardex, ya quedan cubiertas por el flush que las origina.)
+# Cada proceso tiene su propia caché: con varios procesos (gunicorn -w N) un
+# cambio hecho en otro proceso se ve como máximo CACHE_RESUMENES_TTL segundos
+# después. Los valores guardados se comparten entre solicitudes y no se deben
+# modificar (listas de filas, dicts de totales).
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class CacheResumenes:
+    """LRU con vencimiento (TTL) y etiquetas de tabla por entrada. Segura entre hilos."""
+
+    def __init__(self, maximo=256, ttl=300):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # clave -> (vence, tablas, valor)
+        self._lock = threading.Lock()
+        self._generacion = 0  # Avanza con cada invalidación
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave, tablas, calcular):
+        """Valor guardado en 'clave' o, si no está o venció, el resultado de calcular()."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[2]
+            self.fallos += 1
+            generacion = self._generacion
+        # Se calcula fuera del lock: dos solicitudes simultáneas pueden calcular lo mismo
+        valor = calcular()
+        with self._lock:
+            if generacion != self._generacion:
+                # Hubo un commit mientras se calculaba: el valor puede ser anterior a él
+                return valor
+            self._entradas[clave] = (ahora + self.ttl, frozenset(tablas), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self, tablas):
+        """Descarta las entradas que dependen de alguna de esas tablas."""
+        with self._lock:
+            self._generacion += 1
+            claves = [clave for clave, (_, dependencias, _) in self._entradas.items() if dependencias & tablas]
+            for clave in claves:
+                del self._entradas[clave]
+            self.invalidaciones += len(claves)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'activa': True,
+                'entradas': len(self._entradas),
+                'maximo': self.maximo,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else None,
+                'invalidaciones': self.invalidaciones,
+            }
+
+
+def iniciar(app):
+    """Crea la caché de la aplicación (CACHE_RESUMENES_MAXIMO = 0 la desactiva)."""
+    maximo = app.config['CACHE_RESUMENES_MAXIMO']
+    if maximo:
+        app.extensions['cache_resumenes'] = CacheResumenes(maximo, app.config['CACHE_RESUMENES_TTL'])
+
+
+def actual():
+    """Caché de la aplicación activa, o None (desactivada o fuera de contexto)."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('cache_resumenes')
+
+
+def en_cache(*modelos):
+    """
+    Guarda el resultado de la función por sus argumentos hasta que se confirme
+    un cambio en las tablas de esos modelos.
+    """
+    tablas = frozenset(modelo.__table__.name for modelo in modelos)
+
+    def decorador(funcion):
+        nombre = f'{funcion.__module__}.{funcion.__qualname__}'
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            cache = actual()
+            if cache is None:
+                return funcion(*args, **kwargs)
+            clave = (nombre, args, tuple(sorted(kwargs.items())))
+            return cache.obtener(clave, tablas, lambda: funcion(*args, **kwargs))
+
+        envoltura.tablas = tablas
+        return envoltura
+    return decorador
+
+
+# === --- Invalidación por eventos de la sesión --- ===
+
+def tablas_escritas(session):
+    """Tablas escritas (hasta el último flush) en la transacción en curso de la sesión."""
+    return session.info.get('cache_tablas', set())
+
+
+def _anotar(session, tabla):
+    session.info.setdefault('cache_tablas', set()).add(tabla)
+
+
+@event.listens_for(Session, 'after_flush')
+def _tablas_del_flush(session, flush_context):
+    for obj in list(session.new) + list(session.deleted):
+        _anotar(session, obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            _anotar(session, obj.__table__.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _tablas_de_la_sentencia(estado):
+    # UPDATE / INSERT / DELETE ejecutados con session.execute (stock.py, importación)
+    if estado.is_update or estado.is_insert or estado.is_delete:
+        _anotar(estado.session, estado.statement.table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar(session):
+    tablas = session.info.pop('cache_tablas', None)
+    cache = actual()
+    if tablas and cache is not None:
+        cache.invalidar(tablas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar(session):
+    session.info.pop('cache_tablas', None)
+
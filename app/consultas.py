@@ -0,0 +1,121 @@
+# app/consultas.py
+# Consultas del inventario principal (listado, totales y alertas).
+# Todo se resuelve con agregados SQL y paginación por cursor para no
+# cargar la tabla completa de productos en memoria en cada visita.
+# Los totales y las alertas del panel se guardan en la caché de resúmenes
+# (app/cache.py) hasta el próximo cambio confirmado en producto.
+
+from sqlalchemy import func
+
+from app import db
+from app import busqueda as busqueda_fts
+from app.cache import en_cache
+from app.models import Producto
+from app.paginacion import paginar
+
+# Columnas por las que se puede ordenar el inventario: (expresión SQL, valor en Python).
+# Las numéricas usan COALESCE para que el cursor nunca compare contra NULL.
+COLUMNAS_ORDEN = {
+    'codigo': (Producto.codigo, lambda p: p.codigo),
+    'nombre': (Producto.nombre, lambda p: p.nombre),
+    'cantidad': (func.coalesce(Producto.cantidad, 0.0), lambda p: p.cantidad or 0.0),
+    'precio': (func.coalesce(Producto.precio, 0.0), lambda p: p.precio or 0.0),
+    'subalmacen': (Producto.subalmacen, lambda p: p.subalmacen),
+}
+
+
+def _filtrar(consulta, busqueda):
+    """Aplica la búsqueda (FTS5 si está disponible, ILIKE si no)."""
+    if not busqueda:
+        return consulta, None
+    coincidencias = busqueda_fts.subconsulta(busqueda)
+    if coincidencias is None:
+        return consulta.filter(busqueda_fts.filtro_ilike(busqueda)), None
+    return consulta.join(coincidencias, coincidencias.c.producto_id == Producto.id), coincidencias
+
+
+def listar_productos(busqueda=None, orden='codigo', descendente=False, despues=None, antes=None, por_pagina=50):
+    """
+    Devuelve una Pagina de productos ordenada por la columna indicada.
+    Con búsqueda FTS se puede ordenar también por 'relevancia' (bm25).
+    """
+    if orden == 'relevancia':
+        consulta, coincidencias = _filtrar(db.session.query(Producto), busqueda)
+        if coincidencias is not None:
+            pagina = paginar(
+                consulta.add_columns(coincidencias.c.rango),
+                orden=[(coincidencias.c.rango, False), (Producto.id, False)],
+                clave=lambda fila: (fila.rango, fila.Producto.id),
+                por_pagina=por_pagina,
+                despues=despues,
+                antes=antes,
+            )
+            pagina.items = [fila.Producto for fila in pagina.items]
+            return pagina
+        orden = 'codigo'
+
+    if orden not in COLUMNAS_ORDEN:
+        orden = 'codigo'
+    expresion, valor = COLUMNAS_ORDEN[orden]
+    consulta, _ = _filtrar(Producto.query, busqueda)
+
+    return paginar(
+        consulta,
+        orden=[(expresion, descendente), (Producto.id, descendente)],
+        clave=lambda p: (valor(p), p.id),
+        por_pagina=por_pagina,
+        despues=despues,
+        antes=antes,
+    )
+
+
+def contar_productos(busqueda=None):
+    consulta, _ = _filtrar(db.session.query(func.count(Producto.id)), busqueda)
+    return consulta.scalar() or 0
+
+
+@en_cache(Producto)
+def totales_por_subalmacen():
+    """SUM(precio * cantidad) GROUP BY subalmacen -> {subalmacen: total} (exacto: punto fijo)"""
+    filas = db.session.query(
+        Producto.subalmacen,
+        func.sum(Producto.precio * Producto.cantidad)
+    ).group_by(Producto.subalmacen).all()
+    return {subalmacen: total or 0.0 for subalmacen, total in filas}
+
+
+@en_cache(Producto)
+def productos_en_alerta(limite=None):
+    """
+    Productos con cantidad <= stock_minimo (los más críticos primero). Lee la
+    marca materializada Producto.en_alerta con su índice parcial (app/stock.py).
+    Devuelve filas (id, codigo, nombre, cantidad, stock_minimo), no objetos de
+    la sesión, para poder guardarlas en la caché.
+    """
+    consulta = db.session.query(Producto.id, Producto.codigo, Producto.nombre,
+                                Producto.cantidad, Producto.stock_minimo) \
+        .filter(Producto.en_alerta) \
+        .order_by((Producto.cantidad - Producto.stock_minimo).asc(), Producto.id)
+    if limite:
+        consulta = consulta.limit(limite)
+    return consulta.all()
+
+
+@en_cache(Producto)
+def contar_alertas():
+    return db.session.query(func.count(Producto.id)) \
+        .filter(Producto.en_alerta).scalar() or 0
+
+
+def cambios_de_alerta(desde=None, limite=500):
+    """
+    Productos cuya marca de alerta cambió después de 'desde' (UTC), del cambio
+    más antiguo al más reciente (índice de alerta_cambio). Sin 'desde' devuelve
+    los que están en alerta ahora.
+    """
+    consulta = Producto.query
+    if desde is None:
+        consulta = consulta.filter(Producto.en_alerta)
+    else:
+        consulta = consulta.filter(Producto.alerta_cambio > desde)
+    return consulta.order_by(Producto.alerta_cambio, Producto.id).limit(limite).all()
@@ -0,0 +1,355 @@
+# app/esquema.py
+# Migraciones del esquema y verificación de planes de consulta.
+# db.create_all() crea las tablas que faltan (con sus índices) pero no modifica
+# las existentes: columnas e índices nuevos de una BD anterior se agregan aquí
+# con migraciones numeradas. La tabla 'esquema_version' registra las ya
+# aplicadas. Cada migración se ejecuta con la BD bloqueada para escritura y
+# volviendo a leer esa tabla dentro del bloqueo, así dos procesos que arrancan
+# a la vez no aplican la misma migración dos veces (la 3 reescribe valores y
+# no es idempotente en SQLite). Todas comprueban el esquema antes de cambiarlo,
+# así también se pueden aplicar sobre una BD recién creada por create_all().
+# 'flask db-explicar' ejecuta EXPLAIN QUERY PLAN (SQLite) sobre las consultas
+# de reportes y kardex y falla si alguna recorre una tabla completa sin que
+# ese recorrido esté declarado como intencional.
+
+import re
+import sys
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import Table, Column, Integer, String, DateTime, Float, MetaData, event, inspect, select, func, text
+
+from app import db
+from app.tipos import DECIMALES_CANTIDAD, DECIMALES_PRECIO, escalar
+
+_metadatos = MetaData()
+versiones = Table(
+    'esquema_version', _metadatos,
+    Column('version', Integer, primary_key=True),
+    Column('descripcion', String(255), nullable=False),
+    Column('aplicada_en', DateTime, nullable=False),
+)
+
+# version -> (descripción, función(conexión))
+MIGRACIONES = {}
+
+
+def migracion(version, descripcion):
+    """Registra una migración. Las versiones se aplican en orden creciente."""
+    def decorador(funcion):
+        MIGRACIONES[version] = (descripcion, funcion)
+        return funcion
+    return decorador
+
+
+def _columnas(conexion, tabla):
+    return {c['name'] for c in inspect(conexion).get_columns(tabla)}
+
+
+@migracion(1, 'Columna salida.documento_id (documentos de salida de varias líneas)')
+def _documento_salida(conexion):
+    if 'documento_id' not in _columnas(conexion, 'salida'):
+        conexion.execute(text('ALTER TABLE salida ADD COLUMN documento_id INTEGER REFERENCES documento_salida (id)'))
+    conexion.execute(text('CREATE INDEX IF NOT EXISTS ix_salida_documento_id ON salida (documento_id)'))
+
+
+# Índices de reportes y kardex: (nombre, tabla, columnas). Coinciden con los de app/models.py.
+_INDICES_MOVIMIENTOS = [
+    ('ix_salida_producto_fecha', 'salida', 'producto_id, fecha_salida'),
+    ('ix_salida_fecha', 'salida', 'fecha_salida'),
+    ('ix_salida_funcionario_fecha', 'salida', 'nombre_funcionario, fecha_salida'),
+    ('ix_salida_usuario_fecha', 'salida', 'usuario_id, fecha_salida'),
+    ('ix_ingreso_producto_fecha', 'ingreso', 'producto_id, fecha_ingreso'),
+    ('ix_ingreso_fecha', 'ingreso', 'fecha_ingreso'),
+    ('ix_ingreso_usuario_fecha', 'ingreso', 'usuario_id, fecha_ingreso'),
+    ('ix_producto_subalmacen_codigo', 'producto', 'subalmacen, codigo'),
+]
+
+
+@migracion(2, 'Índices de salidas, ingresos y producto para reportes y kardex')
+def _indices_movimientos(conexion):
+    for nombre, tabla, columnas in _INDICES_MOVIMIENTOS:
+        conexion.execute(text(f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columnas})'))
+    if conexion.dialect.name == 'sqlite':
+        # Estadísticas para que el planificador elija bien entre los índices
+        conexion.execute(text('ANALYZE'))
+
+
+# Columnas que pasan de Float a punto fijo (app/tipos.py): (tabla, columna, decimales)
+_COLUMNAS_FIJAS = [
+    ('producto', 'cantidad', DECIMALES_CANTIDAD),
+    ('producto', 'precio', DECIMALES_PRECIO),
+    ('producto', 'stock_minimo', DECIMALES_CANTIDAD),
+    ('salida', 'cantidad_salida', DECIMALES_CANTIDAD),
+    ('salida', 'precio_en_bs', DECIMALES_PRECIO),
+    ('ingreso', 'cantidad_agregada', DECIMALES_CANTIDAD),
+    ('saldo_producto', 'cantidad', DECIMALES_CANTIDAD),
+]
+
+
+@migracion(3, 'Cantidades y precios en punto fijo (milésimas de unidad y centavos)')
+def _punto_fijo(conexion):
+    # En SQLite la columna sigue declarada FLOAT después de convertirla: aplicarla
+    # de nuevo multiplicaría otra vez los valores. Solo se ejecuta una vez
+    # porque actualizar() la aplica con la BD bloqueada y revisa esquema_version.
+    tipos = {}
+    for tabla, columna, decimales in _COLUMNAS_FIJAS:
+        if tabla not in tipos:
+            tipos[tabla] = {c['name']: c['type'] for c in inspect(conexion).get_columns(tabla)}
+        # Solo las columnas que siguen en Float (una BD creada con create_all ya es entera)
+        if not isinstance(tipos[tabla].get(columna), Float):
+            continue
+        if conexion.dialect.name == 'sqlite':
+            # SQLite no cambia el tipo de una columna: se reescriben los valores
+            # con el mismo redondeo de Fijo (ROUND(x * 100) de SQLite no coincide
+            # en los empates: 1.005 * 100 = 100.49999...). Con afinidad REAL el
+            # entero se conserva exacto (hasta 2**53)
+            filas = conexion.execute(text(f'SELECT rowid, {columna} FROM {tabla} WHERE {columna} IS NOT NULL')).all()
+            if filas:
+                conexion.execute(text(f'UPDATE {tabla} SET {columna} = :valor WHERE rowid = :fila'),
+                                 [{'fila': fila, 'valor': escalar(valor, decimales)} for fila, valor in filas])
+        else:
+            # numeric: redondeo del decimal, con la mitad lejos de cero
+            conexion.execute(text(f'ALTER TABLE {tabla} ALTER COLUMN {columna} TYPE BIGINT '
+                                  f'USING ROUND({columna}::numeric * {10 ** decimales})'))
+
+
+@migracion(4, 'Marca de alerta de stock materializada (producto.en_alerta) con índice parcial')
+def _alerta_materializada(conexion):
+    columnas = _columnas(conexion, 'producto')
+    if 'en_alerta' not in columnas:
+        conexion.execute(text('ALTER TABLE producto ADD COLUMN en_alerta BOOLEAN'))
+    if 'alerta_cambio' not in columnas:
+        conexion.execute(text('ALTER TABLE producto ADD COLUMN alerta_cambio DATETIME'))
+    # Misma condición que el índice de app/models.py (SQLite guarda los booleanos como 0/1)
+    if conexion.dialect.name == 'sqlite':
+        condicion, falso = 'en_alerta = 1', '0'
+    else:
+        condicion, falso = 'en_alerta', 'FALSE'
+    conexion.execute(text(f'CREATE INDEX IF NOT EXISTS ix_producto_en_alerta ON producto (id) '
+                          f'WHERE {condicion}'))
+    conexion.execute(text('CREATE INDEX IF NOT EXISTS ix_producto_alerta_cambio ON producto (alerta_cambio)'))
+    conexion.execute(
+        text(f'UPDATE producto SET en_alerta = COALESCE(cantidad <= stock_minimo, {falso}), alerta_cambio = :ahora '
+             f'WHERE en_alerta IS NULL'),
+        {'ahora': datetime.utcnow()},
+    )
+
+
+@migracion(5, 'Propietario y latido de las tareas en segundo plano (varios procesos)')
+def _latido_tareas(conexion):
+    columnas = _columnas(conexion, 'tarea')
+    if 'propietario' not in columnas:
+        conexion.execute(text('ALTER TABLE tarea ADD COLUMN propietario VARCHAR(100)'))
+    if 'latido' not in columnas:
+        conexion.execute(text('ALTER TABLE tarea ADD COLUMN latido DATETIME'))
+
+
+# Índices que cambiaron de columnas: (nombre, tabla, columnas, condición del índice parcial).
+# Coinciden con los de app/models.py; se reconstruyen si en la BD tienen otras columnas.
+_INDICES_CUBRIENTES = [
+    ('ix_salida_producto_fecha', 'salida', ['producto_id', 'fecha_salida', 'id', 'cantidad_salida', 'precio_en_bs'], None),
+    ('ix_salida_funcionario_fecha', 'salida',
+     ['nombre_funcionario', 'fecha_salida', 'id', 'cantidad_salida', 'precio_en_bs'], None),
+    ('ix_ingreso_producto_fecha', 'ingreso', ['producto_id', 'fecha_ingreso', 'id', 'cantidad_agregada'], None),
+    ('ix_producto_en_alerta', 'producto', ['alerta_cambio', 'id'], 'en_alerta'),
+]
+
+
+@migracion(6, 'Índices cubrientes para resúmenes y ranking; índice de alertas por fecha de cambio')
+def _indices_cubrientes(conexion):
+    sqlite = conexion.dialect.name == 'sqlite'
+    for nombre, tabla, columnas, condicion in _INDICES_CUBRIENTES:
+        actuales = {i['name']: i['column_names'] for i in inspect(conexion).get_indexes(tabla)}
+        if actuales.get(nombre) == columnas:
+            continue
+        conexion.execute(text(f'DROP INDEX IF EXISTS {nombre}'))
+        if condicion and sqlite:
+            condicion += ' = 1'  # Misma condición que app/models.py (booleanos 0/1)
+        donde = f' WHERE {condicion}' if condicion else ''
+        conexion.execute(text(f'CREATE INDEX {nombre} ON {tabla} ({", ".join(columnas)}){donde}'))
+    if sqlite:
+        conexion.execute(text('ANALYZE'))
+
+
+def version_actual(conexion):
+    versiones.create(conexion, checkfirst=True)
+    return conexion.execute(select(func.max(versiones.c.version))).scalar() or 0
+
+
+def _bloquear(conexion):
+    """Bloqueo de escritura de la BD (SQLite) o de esquema_version hasta el fin de la transacción."""
+    if conexion.dialect.name == 'sqlite':
+        # pysqlite no abre la transacción hasta la primera escritura: se abre aquí tomando el bloqueo
+        conexion.exec_driver_sql('BEGIN IMMEDIATE')
+    else:
+        conexion.execute(text('LOCK TABLE esquema_version IN EXCLUSIVE MODE'))
+
+
+def crear_tablas():
+    """
+    db.create_all() más la tabla esquema_version, con la BD bloqueada en SQLite:
+    dos procesos que arrancan a la vez no intentan crear la misma tabla.
+    """
+    with db.engine.begin() as conexion:
+        if conexion.dialect.name == 'sqlite':
+            conexion.exec_driver_sql('BEGIN IMMEDIATE')
+        db.metadata.create_all(conexion)
+        _metadatos.create_all(conexion)
+
+
+def actualizar():
+    """
+    Aplica las migraciones pendientes, cada una en su transacción y con la BD
+    bloqueada. Devuelve las versiones aplicadas por este proceso.
+    """
+    aplicadas = []
+    with db.engine.begin() as conexion:
+        actual = version_actual(conexion)
+    for version in sorted(v for v in MIGRACIONES if v > actual):
+        descripcion, funcion = MIGRACIONES[version]
+        with db.engine.begin() as conexion:
+            _bloquear(conexion)
+            if version_actual(conexion) >= version:
+                continue  # Otro proceso la aplicó mientras tanto
+            funcion(conexion)
+            conexion.execute(versiones.insert().values(
+                version=version, descripcion=descripcion, aplicada_en=datetime.utcnow()
+            ))
+        aplicadas.append(version)
+    return aplicadas
+
+
+# === --- Verificación de planes de consulta (EXPLAIN QUERY PLAN) --- ===
+# Se ejecutan las funciones reales de reportes, consultas y kardex (sin la caché
+# de resúmenes) y se revisa el plan de cada sentencia que envían a la BD. Sobre
+# las tablas vigiladas solo se acepta SEARCH: un "SCAN <tabla>", con o sin
+# índice, recorre la tabla o el índice completo. Cada consulta declara los
+# recorridos que son intencionales (un resumen de todo el historial sobre un
+# índice cubriente, el índice parcial de alertas).
+
+TABLAS_VIGILADAS = {'producto', 'salida', 'ingreso', 'usuario', 'saldo_producto'}
+_RECORRIDO = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: |$)')
+
+
+def _sin_cache(funcion):
+    return getattr(funcion, '__wrapped__', funcion)
+
+
+def _consultas_vigiladas():
+    """{nombre: (función sin argumentos que ejecuta la consulta, recorridos permitidos)}."""
+    from app import consultas, kardex, reportes
+    from app.paginacion import codificar_cursor
+
+    hasta = datetime.utcnow()
+    desde = hasta - timedelta(days=30)
+    cursor = codificar_cursor((desde, 1))
+    resumen_funcionarios = 'SCAN salida USING COVERING INDEX ix_salida_funcionario_fecha'
+    resumen_salidas = 'SCAN salida USING COVERING INDEX ix_salida_producto_fecha'
+    resumen_ingresos = 'SCAN ingreso USING COVERING INDEX ix_ingreso_producto_fecha'
+    alertas = 'SCAN producto USING INDEX ix_producto_en_alerta'
+    # Historial sin filtro de fecha: cada rama recorre su índice de fecha en orden
+    # y el LIMIT de la página la detiene
+    por_fecha = {'SCAN salida USING INDEX ix_salida_fecha', 'SCAN ingreso USING INDEX ix_ingreso_fecha'}
+    return {
+        'Resumen de salidas por funcionario': (
+            lambda: _sin_cache(reportes.resumen_salidas_por_funcionario)(), {resumen_funcionarios}),
+        'Resumen de un funcionario': (
+            lambda: _sin_cache(reportes.resumen_salidas_por_funcionario)('X'), set()),
+        'Resumen de salidas por producto': (
+            lambda: _sin_cache(reportes.resumen_salidas_por_producto)(), {resumen_salidas}),
+        'Resumen de salidas de un producto': (
+            lambda: _sin_cache(reportes.resumen_salidas_por_producto)(1), set()),
+        'Resumen de ingresos por producto': (
+            lambda: _sin_cache(reportes.resumen_ingresos_por_producto)(), {resumen_ingresos}),
+        'Resumen de ingresos de un producto': (
+            lambda: _sin_cache(reportes.resumen_ingresos_por_producto)(1), set()),
+        'Salidas de un funcionario': (lambda: reportes.lineas_salidas(funcionario='X'), set()),
+        'Salidas de un funcionario (página siguiente)': (
+            lambda: reportes.lineas_salidas(funcionario='X', despues=cursor), set()),
+        'Salidas de un producto (página siguiente)': (
+            lambda: reportes.lineas_salidas(producto_id=1, despues=cursor), set()),
+        'Ingresos de un producto (página siguiente)': (
+            lambda: reportes.lineas_ingresos(1, despues=cursor), set()),
+        'Ranking de salidas del periodo': (
+            lambda: _sin_cache(reportes.ranking)('salidas', 'valor', 10, desde, hasta), set()),
+        'Ranking de ingresos de un subalmacén': (
+            lambda: _sin_cache(reportes.ranking)('ingresos', 'cantidad', 10, subalmacen='SCPE'), {resumen_ingresos}),
+        'Productos en alerta': (lambda: _sin_cache(consultas.productos_en_alerta)(10), {alertas}),
+        'Cambios de alerta': (lambda: consultas.cambios_de_alerta(desde), set()),
+        'Productos en alerta (sin fecha)': (lambda: consultas.cambios_de_alerta(), {alertas}),
+        'Productos de un subalmacén': (lambda: reportes.productos_por_subalmacen(['SCPE']), set()),
+        'Historial (primera página)': (lambda: kardex.pagina_movimientos({}), por_fecha),
+        'Historial por fechas': (lambda: kardex.pagina_movimientos({'desde': desde, 'hasta': hasta}), set()),
+        'Historial por usuario': (lambda: kardex.pagina_movimientos({'usuario_id': 1}), set()),
+        'Historial por subalmacén': (lambda: kardex.pagina_movimientos({'subalmacen': 'SCPE'}), por_fecha),
+        'Kardex de un producto': (lambda: kardex.kardex_producto(1, desde, hasta), set()),
+    }
+
+
+def plan(conexion, sentencia, parametros=()):
+    """Líneas de EXPLAIN QUERY PLAN de una sentencia SQL (solo SQLite)."""
+    filas = conexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {sentencia}', parametros).all()
+    return [fila[-1] for fila in filas]
+
+
+def recorridos_completos(lineas, permitidos=()):
+    """Líneas del plan que recorren completa una tabla vigilada y no están permitidas."""
+    fallas = []
+    for linea in lineas:
+        coincidencia = _RECORRIDO.match(linea)
+        if coincidencia and coincidencia.group(1) in TABLAS_VIGILADAS and linea not in permitidos:
+            fallas.append(linea)
+    return fallas
+
+
+def _sentencias(funcion):
+    """[(sql, parámetros)] de las sentencias que ejecuta 'funcion'."""
+    sentencias = []
+
+    def registrar(conexion, cursor, sentencia, parametros, contexto, executemany):
+        sentencias.append((sentencia, parametros))
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        funcion()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+        db.session.rollback()
+    return sentencias
+
+
+def verificar_planes():
+    """[(nombre, líneas del plan, recorridos completos no permitidos)] de cada consulta vigilada."""
+    resultados = []
+    for nombre, (funcion, permitidos) in _consultas_vigiladas().items():
+        sentencias = _sentencias(funcion)
+        with db.engine.connect() as conexion:
+            lineas = [linea for sentencia, parametros in sentencias for linea in plan(conexion, sentencia, parametros)]
+        resultados.append((nombre, lineas, recorridos_completos(lineas, permitidos)))
+    return resultados
+
+
+def registrar_comandos(app):
+    @app.cli.command('db-migrar')
+    def comando_migrar():
+        """Aplica las migraciones de esquema pendientes."""
+        aplicadas = actualizar()
+        with db.engine.connect() as conexion:
+            click.echo(f'Migraciones aplicadas: {aplicadas or "ninguna"}. Versión actual: {version_actual(conexion)}')
+
+    @app.cli.command('db-explicar')
+    def comando_explicar():
+        """Muestra el plan de las consultas de reportes; falla si alguna recorre una tabla completa."""
+        if db.engine.dialect.name != 'sqlite':
+            click.echo('EXPLAIN QUERY PLAN solo está disponible para SQLite.')
+            return
+        fallas = 0
+        for nombre, lineas, recorridos in verificar_planes():
+            click.echo(f"{'FALLA' if recorridos else 'OK   '} {nombre}")
+            for linea in lineas:
+                click.echo(f'        {linea}')
+            fallas += bool(recorridos)
+        if fallas:
+            click.echo(f'{fallas} consultas recorren tablas completas.')
+            sys.exit(1)
@@ -0,0 +1,325 @@
+# app/exportacion.py
+# Exportaciones tabulares (Excel, CSV y Parquet) en flujo.
+# Cada reporte define sus columnas y una consulta que devuelve tuplas por lotes
+# (yield_per). Las filas se escriben a medida que llegan de la BD:
+# - Excel: xlsxwriter en modo 'constant_memory' sobre un archivo en disco,
+#   guardado en la caché de reportes (app/artefactos.py) hasta que cambien los datos.
+# - CSV: un generador que la respuesta HTTP va enviando por bloques.
+# - Parquet: lotes columnares de pyarrow (dependencia opcional).
+# La memoria del worker no crece con la cantidad de filas exportadas.
+
+import csv
+import io
+import tempfile
+from itertools import chain, islice
+
+import xlsxwriter
+from flask import send_file, Response, stream_with_context
+from sqlalchemy import case
+
+from app import db
+from app.models import Producto, Salida, Ingreso
+from app import kardex, artefactos
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TAMANO_LOTE = 1000
+
+SUBALMACENES = ['SCPE', 'POZO 57', 'ALMACEN CENTRAL']
+
+
+class Columna:
+    """
+    Columna de un reporte.
+    - campo: nombre de máquina (encabezado en CSV/Parquet).
+    - titulo: encabezado en Excel; None si la columna solo va en CSV/Parquet.
+    - tipo: 'texto', 'numero', 'entero' o 'fecha' (tipo de la columna Parquet).
+    """
+
+    def __init__(self, campo, titulo=None, tipo='texto', ancho=None, formato=None):
+        self.campo = campo
+        self.titulo = titulo
+        self.tipo = tipo
+        self.ancho = ancho
+        self.formato = formato  # Formato numérico de Excel (ej: 'yyyy-mm-dd')
+
+
+class Reporte:
+    """Definición de un reporte tabular: hoja, columnas y origen de las filas."""
+
+    def __init__(self, hoja, columnas, filas):
+        self.hoja = hoja
+        self.columnas = columnas
+        self.filas = filas  # Función(filtros) -> iterable de tuplas (una por columna)
+
+    @property
+    def campos(self):
+        return [c.campo for c in self.columnas]
+
+
+# =================================================================
+# --- ORIGEN DE DATOS DE CADA REPORTE ---
+# =================================================================
+# Filtros comunes para exportaciones incrementales:
+# - 'desde_id': solo filas con id > N (el último id ya exportado).
+# - 'desde_ts': solo filas con fecha > T (el último instante ya exportado),
+#   en UTC sin zona como las columnas de la BD (la ruta lo convierte).
+
+def _incremental(consulta, filtros, columna_id, columna_fecha):
+    if filtros.get('desde_id') is not None:
+        consulta = consulta.filter(columna_id > filtros['desde_id'])
+    if filtros.get('desde_ts') is not None:
+        consulta = consulta.filter(columna_fecha > filtros['desde_ts'])
+    return consulta
+
+
+def _filas_inventario(filtros):
+    consulta = db.session.query(
+        Producto.id, Producto.codigo, Producto.nombre, Producto.cantidad, Producto.precio,
+        Producto.precio * Producto.cantidad, Producto.proveedor, Producto.fecha_ingreso,
+        Producto.stock_minimo, Producto.subalmacen, Producto.unidad, Producto.diametro
+    )
+    consulta = _incremental(consulta, filtros, Producto.id, Producto.fecha_ingreso)
+    return consulta.order_by(Producto.id).yield_per(TAMANO_LOTE)
+
+
+def _filas_ingresos(filtros):
+    consulta = db.session.query(
+        Ingreso.id, Producto.nombre, Producto.codigo, Ingreso.cantidad_agregada, Ingreso.fecha_ingreso
+    ).join(Producto, Producto.id == Ingreso.producto_id)
+    consulta = _incremental(consulta, filtros, Ingreso.id, Ingreso.fecha_ingreso)
+    return consulta.order_by(Ingreso.id).yield_per(TAMANO_LOTE)
+
+
+def _filas_salidas(filtros):
+    consulta = db.session.query(
+        Salida.id, Salida.nombre_funcionario, Salida.codigo_funcionario, Producto.nombre, Producto.codigo,
+        Salida.cantidad_salida, Salida.fecha_salida, Salida.precio_en_bs,
+        Salida.cantidad_salida * Salida.precio_en_bs
+    ).join(Producto, Producto.id == Salida.producto_id)
+    consulta = _incremental(consulta, filtros, Salida.id, Salida.fecha_salida)
+    return consulta.order_by(Salida.id).yield_per(TAMANO_LOTE)
+
+
+def _filas_por_subalmacen(filtros):
+    orden = case({s: i for i, s in enumerate(SUBALMACENES)}, value=Producto.subalmacen)
+    return db.session.query(
+        Producto.subalmacen, Producto.codigo, Producto.nombre, Producto.cantidad,
+        Producto.precio, Producto.precio * Producto.cantidad
+    ).filter(Producto.subalmacen.in_(SUBALMACENES)) \
+     .order_by(orden, Producto.id).yield_per(TAMANO_LOTE)
+
+
+def _filas_historial(filtros):
+    # Los ids de ingresos y salidas son independientes: el kardex solo admite
+    # exportación incremental por fecha ('desde_ts' ya viene en UTC).
+    filtros = dict(filtros)
+    filtros['despues_de'] = filtros.pop('desde_ts', None)
+    for m in kardex.iterar_movimientos(filtros, lote=TAMANO_LOTE):
+        yield (m['fecha'], m['tipo'], m['id'], m['codigo'], m['producto'], m['cantidad'],
+               m['usuario_sistema'], m['detalle'])
+
+
+def _filas_stock_critico(filtros):
+    return db.session.query(
+        Producto.codigo, Producto.nombre, Producto.cantidad, Producto.stock_minimo,
+        Producto.stock_minimo - Producto.cantidad, Producto.proveedor, Producto.subalmacen
+    ).filter(Producto.en_alerta) \
+     .order_by(Producto.id).yield_per(TAMANO_LOTE)
+
+
+INVENTARIO = Reporte('Inventario', [
+    Columna('id', tipo='entero'),
+    Columna('codigo', 'Código', ancho=15), Columna('nombre', 'Nombre', ancho=30),
+    Columna('cantidad', 'Cantidad', 'numero'), Columna('precio', 'Precio', 'numero'),
+    Columna('valor_total', 'Valor Total', 'numero', ancho=12), Columna('proveedor', 'Proveedor', ancho=20),
+    Columna('fecha_ingreso', 'Fecha Ingreso', 'fecha', ancho=12, formato='yyyy-mm-dd'),
+    Columna('stock_minimo', 'Stock Mínimo', 'numero', ancho=12), Columna('subalmacen', 'Subalmacén', ancho=16),
+    Columna('unidad', 'Unidad'), Columna('diametro', 'Diámetro'),
+], _filas_inventario)
+
+INGRESOS = Reporte('Ingresos', [
+    Columna('id', tipo='entero'),
+    Columna('producto', 'Producto', ancho=30), Columna('codigo_producto', 'Código Producto', ancho=15),
+    Columna('cantidad_agregada', 'Cantidad Agregada', 'numero', ancho=16),
+    Columna('fecha_ingreso', 'Fecha Ingreso', 'fecha', ancho=20, formato='yyyy-mm-dd hh:mm:ss'),
+], _filas_ingresos)
+
+SALIDAS = Reporte('Salidas', [
+    Columna('id', tipo='entero'),
+    Columna('funcionario', 'Funcionario', ancho=25), Columna('codigo_funcionario', 'Código Funcionario', ancho=18),
+    Columna('producto', 'Producto', ancho=30), Columna('codigo_producto', 'Código Producto', ancho=15),
+    Columna('cantidad_salida', 'Cantidad Salida', 'numero', ancho=15),
+    Columna('fecha_salida', 'Fecha Salida', 'fecha', ancho=12, formato='yyyy-mm-dd'),
+    Columna('precio_bs', 'Precio Bs.', 'numero'), Columna('valor_total', 'Valor Total', 'numero', ancho=12),
+], _filas_salidas)
+
+POR_SUBALMACEN = Reporte('Por_Subalmacen', [
+    Columna('subalmacen', 'Subalmacén', ancho=16), Columna('codigo', 'Código', ancho=15),
+    Columna('nombre', 'Nombre', ancho=30), Columna('cantidad', 'Cantidad', 'numero'),
+    Columna('precio', 'Precio', 'numero'), Columna('valor_total', 'Valor Total', 'numero', ancho=12),
+], _filas_por_subalmacen)
+
+HISTORIAL = Reporte('Historial_Kardex', [
+    Columna('fecha_bolivia', 'Fecha y Hora (Bolivia)', 'fecha', ancho=20, formato='dd/mm/yyyy hh:mm'),
+    Columna('tipo', 'Tipo', ancho=10), Columna('id', tipo='entero'),
+    Columna('codigo', 'Código', ancho=15), Columna('producto', 'Producto', ancho=30),
+    Columna('cantidad', 'Cantidad', 'numero'), Columna('registrado_por', 'Registrado Por', ancho=25),
+    Columna('detalle', 'Detalle', ancho=25),
+], _filas_historial)
+
+STOCK_CRITICO = Reporte('Stock_Critico', [
+    Columna('codigo', 'Código'), Columna('nombre', 'Nombre', ancho=30),
+    Columna('cantidad', 'Cantidad Actual', 'numero'), Columna('stock_minimo', 'Stock Mínimo', 'numero'),
+    Columna('deficit', 'Déficit', 'numero'), Columna('proveedor', 'Proveedor'),
+    Columna('subalmacen', 'Subalmacén'),
+], _filas_stock_critico)
+
+# Reportes disponibles en CSV/Parquet, por nombre en la URL
+REPORTES_DATOS = {
+    'inventario': INVENTARIO,
+    'reporte_ingresos': INGRESOS,
+    'reporte_salidas': SALIDAS,
+    'historial': HISTORIAL,
+}
+
+
+# =================================================================
+# --- ESCRITURA EN FLUJO ---
+# =================================================================
+
+def _con_filas(reporte, filtros):
+    """Iterador de filas, o None si el reporte no tiene ninguna."""
+    filas = iter(reporte.filas(filtros or {}))
+    primera = next(filas, None)
+    if primera is None:
+        return None
+    return chain([primera], filas)
+
+
+def _lotes(filas, tamano):
+    filas = iter(filas)
+    while True:
+        lote = list(islice(filas, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def escribir_excel(reporte, destino, filas):
+    """
+    Escribe las filas en `destino` (ruta o archivo abierto) fila por fila.
+    Las columnas sin título (ej: ids) no se incluyen en el Excel.
+    Devuelve la cantidad de filas escritas.
+    """
+    libro = xlsxwriter.Workbook(destino, {'constant_memory': True})
+    hoja = libro.add_worksheet(reporte.hoja)
+    formato_encabezado = libro.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+
+    visibles = []  # (índice en la fila, formato)
+    for i, columna in enumerate(reporte.columnas):
+        if columna.titulo is None:
+            continue
+        col = len(visibles)
+        if columna.ancho:
+            hoja.set_column(col, col, columna.ancho)
+        hoja.write(0, col, columna.titulo, formato_encabezado)
+        visibles.append((i, libro.add_format({'num_format': columna.formato}) if columna.formato else None))
+
+    total = 0
+    for total, fila in enumerate(filas, start=1):
+        for col, (i, formato) in enumerate(visibles):
+            valor = fila[i]
+            if valor is None or valor == '':
+                continue
+            if formato is not None:
+                hoja.write(total, col, valor, formato)
+            else:
+                hoja.write(total, col, valor)
+    libro.close()
+    return total
+
+
+def enviar_excel(reporte, nombre_archivo, filtros=None):
+    """
+    Envía el Excel del reporte. Se genera solo si los datos cambiaron desde la
+    última exportación con los mismos filtros (caché de app/artefactos.py).
+    Devuelve None si el reporte no tiene filas (para avisar al usuario).
+    """
+    def escribir(destino):
+        filas = _con_filas(reporte, filtros)
+        if filas is None:
+            return False
+        escribir_excel(reporte, destino, filas)
+
+    return artefactos.enviar(f'excel:{reporte.hoja}', filtros or {}, nombre_archivo, MIMETYPE_XLSX, escribir)
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat(sep=' ')
+    return valor
+
+
+def generar_csv(reporte, filtros=None):
+    """Genera el CSV por bloques de TAMANO_LOTE filas (encabezado incluido)."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(reporte.campos)
+    for lote in _lotes(reporte.filas(filtros or {}), TAMANO_LOTE):
+        escritor.writerows([_valor_csv(v) for v in fila] for fila in lote)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def enviar_csv(reporte, nombre_archivo, filtros=None):
+    """
+    Respuesta CSV en flujo. Un reporte vacío devuelve solo el encabezado
+    (es el resultado normal de una exportación incremental sin novedades).
+    """
+    return Response(
+        stream_with_context(generar_csv(reporte, filtros)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={nombre_archivo}'}
+    )
+
+
+def parquet_disponible():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def escribir_parquet(reporte, destino, filas):
+    """Escribe las filas como Parquet, un row group por lote. Devuelve el total de filas."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {'texto': pa.string(), 'numero': pa.float64(), 'entero': pa.int64(), 'fecha': pa.timestamp('us')}
+    esquema = pa.schema([(c.campo, tipos[c.tipo]) for c in reporte.columnas])
+
+    total = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for lote in _lotes(filas, TAMANO_LOTE):
+            columnas = list(zip(*lote))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=esquema.field(i).type) for i, valores in enumerate(columnas)],
+                schema=esquema
+            ))
+            total += len(lote)
+    return total
+
+
+def enviar_parquet(reporte, nombre_archivo, filtros=None):
+    """Genera el Parquet en un archivo temporal y lo envía (requiere pyarrow)."""
+    archivo = tempfile.TemporaryFile(suffix='.parquet')
+    escribir_parquet(reporte, archivo, reporte.filas(filtros or {}))
+    archivo.seek(0)
+    return send_file(archivo, download_name=nombre_archivo,
+                     mimetype='application/vnd.apache.parquet', as_attachment=True)
@@ -0,0 +1,45 @@
+# app/fechas.py
+# Conversión entre UTC (como se guarda en la BD) y la hora de Bolivia (GMT-4).
+
+from datetime import datetime, timedelta, timezone
+
+DIFERENCIA_BOLIVIA = timedelta(hours=4)
+
+
+def get_bolivia_time(utc_dt):
+    """Convierte una fecha UTC a la hora de Bolivia (GMT-4)"""
+    if not utc_dt: return None
+    return utc_dt - DIFERENCIA_BOLIVIA
+
+
+def bolivia_a_utc(local_dt):
+    """Convierte una fecha en hora de Bolivia a UTC (para filtrar en la BD)"""
+    if not local_dt: return None
+    return local_dt + DIFERENCIA_BOLIVIA
+
+
+def a_utc(fecha):
+    """
+    Fecha de un parámetro a UTC sin zona (como se guarda en la BD): sin zona
+    se toma como hora de Bolivia; con zona ('Z', '+00:00', '-04:00') se convierte.
+    """
+    if not fecha: return None
+    if fecha.tzinfo is None:
+        return bolivia_a_utc(fecha)
+    return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_fecha(valor):
+    """Lee una fecha 'YYYY-MM-DD' de un formulario; None si está vacía o es inválida."""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d') if valor else None
+    except ValueError:
+        return None
+
+
+def parse_fecha_hora(valor):
+    """Lee una fecha u hora ISO ('YYYY-MM-DD' o 'YYYY-MM-DDTHH:MM[:SS]'); None si es inválida."""
+    try:
+        return datetime.fromisoformat(valor) if valor else None
+    except ValueError:
+        return None
@@ -1,7 +1,18 @@
+import math
+
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, FloatField, SelectField, FileField, EmailField
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, FloatField, SelectField, FileField, EmailField, IntegerField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, NumberRange, Optional, Length
+from app import db
 from app.models import Usuario, Producto
+from app.tipos import VALOR_MAXIMO
+
+
+def numero_finito(form, field):
+    """FloatField acepta 'nan' e 'inf', y NumberRange no los rechaza (las comparaciones con NaN son falsas)."""
+    if field.data is not None and not math.isfinite(field.data):
+        raise ValidationError('Ingrese un número válido.')
 
 # --- FORMULARIO DE LOGIN ---
 class LoginForm(FlaskForm):
@@ -68,10 +79,11 @@ class UserEditForm(FlaskForm):
 class ProductoForm(FlaskForm):
     codigo = StringField('Código', validators=[DataRequired(), Length(max=50)])
     nombre = StringField('Nombre', validators=[DataRequired(), Length(max=100)])
-    cantidad = FloatField('Cantidad', validators=[DataRequired(), NumberRange(min=0)])
-    precio = FloatField('Precio (Bs.)', validators=[DataRequired(), NumberRange(min=0)])
+    cantidad = FloatField('Cantidad', validators=[DataRequired(), numero_finito, NumberRange(min=0, max=VALOR_MAXIMO)])
+    precio = FloatField('Precio (Bs.)', validators=[DataRequired(), numero_finito, NumberRange(min=0, max=VALOR_MAXIMO)])
     proveedor = StringField('Proveedor', validators=[Optional(), Length(max=100)])
-    stock_minimo = FloatField('Stock Mínimo', default=10.0, validators=[Optional(), NumberRange(min=0)])
+    stock_minimo = FloatField('Stock Mínimo', default=10.0,
+                              validators=[Optional(), numero_finito, NumberRange(min=0, max=VALOR_MAXIMO)])
     
     # AQUÍ AGREGAMOS 'ALMACEN CENTRAL' A LAS OPCIONES
     subalmacen = SelectField('Subalmacén', choices=[('SCPE', 'SCPE'), ('POZO 57', 'POZO 57'), ('ALMACEN CENTRAL', 'ALMACEN CENTRAL')], validators=[DataRequired()])
@@ -100,13 +112,28 @@ class BusquedaForm(FlaskForm):
     submit = SubmitField('Buscar')
 
 class SalidaForm(FlaskForm):
-    producto_id = SelectField('Producto', coerce=int, validators=[DataRequired()])
-    cantidad_salida = FloatField('Cantidad a Salir', validators=[DataRequired(), NumberRange(min=0.01)])
+    # El producto se elige con el buscador (JSON); aquí solo llega su id, que se
+    # valida con una consulta por clave primaria en lugar de cargar todo el catálogo
+    producto_id = IntegerField('Producto', widget=HiddenInput(),
+                               validators=[DataRequired(message='Seleccione un producto de la lista.')])
+    cantidad_salida = FloatField('Cantidad a Salir',
+                                 validators=[DataRequired(), numero_finito, NumberRange(min=0.01, max=VALOR_MAXIMO)])
     nombre_funcionario = StringField('Nombre del Funcionario', validators=[DataRequired(), Length(max=100)])
     codigo_funcionario = StringField('Código del Funcionario', validators=[DataRequired(), Length(max=50)])
     imagen_salida = FileField('Imagen de Salida (Solo POZO 57)', validators=[Optional()])
     submit = SubmitField('Registrar Salida')
 
+    producto = None  # Producto elegido, cargado al validar
+
+    def validate_producto_id(self, producto_id):
+        self.producto = db.session.get(Producto, producto_id.data)
+        if self.producto is None:
+            raise ValidationError('El producto seleccionado no existe.')
+
 class ImportForm(FlaskForm):
-    file = FileField('Archivo Excel', validators=[DataRequired()])
+    file = FileField('Archivo Excel o CSV', validators=[DataRequired()])
+    modo = SelectField('Si el código ya existe', choices=[
+        ('rechazar', 'No importar la fila (reportar como error)'),
+        ('actualizar', 'Actualizar el producto existente'),
+    ], default='rechazar')
     submit = SubmitField('Importar')
\ No newline at end of file
@@ -0,0 +1,302 @@
+# app/imagenes.py
+# Procesamiento de las fotos de ingresos y salidas (POZO 57).
+# Las fotos llegan del celular con 2 a 5 MB y metadatos EXIF (ubicación GPS,
+# modelo del equipo). En la petición solo se valida la imagen con Pillow y se
+# guarda el archivo recibido como '.pendiente'; un pool de hilos la procesa en
+# segundo plano:
+# - aplica la orientación EXIF y descarta todos los metadatos,
+# - reduce el lado mayor a IMAGENES_LADO_MAXIMO y recomprime (WebP, o JPEG
+#   si Pillow no tiene soporte WebP),
+# - genera miniaturas de cada lado en IMAGENES_MINIATURAS.
+# La ruta guardada en la BD es la de la imagen procesada, y las miniaturas
+# usan el mismo nombre con el sufijo '_<lado>'
+# (uploads/2025/11/07/foto_130005_310087.webp -> ..._310087_160.webp).
+# Cada archivo se escribe en un temporal y se publica con os.replace: como
+# static/uploads se sirve con caché 'immutable' (app/respuestas.py), nunca se
+# debe poder descargar un archivo a medio escribir.
+# Con varios procesos (gunicorn -w N) cada uno vuelve a encolar al arrancar las
+# fotos pendientes: quien procesa una foto primero la reclama renombrando el
+# '.pendiente' a '.procesando~<proceso>' (os.rename es atómico), así cada foto
+# se procesa una sola vez; las reclamadas por un proceso que ya terminó vuelven
+# a quedar pendientes. Si el procesamiento falla el original queda como
+# '.fallida' y las filas que apuntaban a la imagen quedan sin foto.
+# Las fotos subidas antes de este módulo se convierten con 'flask imagenes-migrar'.
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from werkzeug.utils import secure_filename
+
+from app import db, tareas
+
+FORMATOS_ACEPTADOS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF', 'HEIF'}
+PENDIENTE = '.pendiente'
+EN_PROCESO = '.procesando~'  # + propietario del proceso (app/tareas.py, ':' -> '+')
+FALLIDA = '.fallida'
+
+
+class ImagenInvalida(Exception):
+    """El archivo subido no es una imagen que se pueda procesar."""
+
+
+def _formato_salida():
+    """(formato de Pillow, extensión) de las imágenes procesadas."""
+    if features.check('webp'):
+        return 'WEBP', '.webp'
+    return 'JPEG', '.jpg'
+
+
+def directorio_static(app=None):
+    return os.path.join((app or current_app).root_path, 'static')
+
+
+# === --- Validación y encolado (en la petición) --- ===
+
+def validar(file_storage, config):
+    """Verifica que el archivo sea una imagen de un formato aceptado y de un tamaño razonable."""
+    try:
+        with Image.open(file_storage.stream) as imagen:
+            formato = imagen.format
+            ancho, alto = imagen.size
+            imagen.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImagenInvalida(f'El archivo no es una imagen válida ({e}).')
+    finally:
+        file_storage.stream.seek(0)
+    if formato not in FORMATOS_ACEPTADOS:
+        raise ImagenInvalida(f'Formato de imagen no admitido: {formato}.')
+    if ancho * alto > config['IMAGENES_MAX_PIXELES']:
+        raise ImagenInvalida(f'La imagen es demasiado grande ({ancho} x {alto} píxeles).')
+
+
+def guardar(file_storage):
+    """
+    Valida la imagen, la deja pendiente de proceso y devuelve la ruta relativa
+    (dentro de static/) que tendrá la imagen procesada. Lanza ImagenInvalida.
+    """
+    config = current_app.config
+    validar(file_storage, config)
+
+    ahora = datetime.now()
+    nombre_base = os.path.splitext(secure_filename(file_storage.filename or ''))[0] or 'imagen'
+    # Marca de tiempo para unicidad (los nombres nunca se reutilizan: caché immutable)
+    nombre = f"{nombre_base}_{ahora.strftime('%H%M%S_%f')}"
+    relativa = '/'.join(['uploads', ahora.strftime('%Y'), ahora.strftime('%m'), ahora.strftime('%d'), nombre])
+
+    base = os.path.join(directorio_static(), *relativa.split('/'))
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    file_storage.save(base + PENDIENTE)
+    _encolar(base)
+    return relativa + _formato_salida()[1]
+
+
+def _encolar(base):
+    app = current_app._get_current_object()
+    pool = app.extensions.get('imagenes')
+    if pool is None:
+        # IMAGENES_WORKERS = 0: se procesa en la misma petición (todavía no hay filas que la usen)
+        try:
+            procesar(base, app.config)
+        except Exception as e:
+            raise ImagenInvalida(f'No se pudo procesar la imagen ({e}).')
+    else:
+        pool.submit(_procesar_en_segundo_plano, app, base)
+
+
+def _procesar_en_segundo_plano(app, base):
+    try:
+        procesar(base, app.config)
+    except Exception:
+        app.logger.exception(f'Error al procesar la imagen {base}{PENDIENTE}')
+        with app.app_context():
+            try:
+                _quitar_de_la_bd(base, app)
+            finally:
+                db.session.remove()
+
+
+def _quitar_de_la_bd(base, app=None):
+    """Las salidas e ingresos que apuntaban a la imagen de 'base' quedan sin foto."""
+    from app.models import Salida, Ingreso
+
+    relativa = os.path.relpath(base, directorio_static(app)).replace(os.sep, '/') + _formato_salida()[1]
+    for modelo, columna in ((Salida, Salida.imagen_salida), (Ingreso, Ingreso.imagen_ingreso)):
+        db.session.query(modelo).filter(columna == relativa).update({columna: None}, synchronize_session=False)
+    db.session.commit()
+
+
+# === --- Procesamiento (en el pool) --- ===
+
+def _publicar(imagen, ruta, formato, calidad):
+    temporal = f'{ruta}.{uuid.uuid4().hex}.tmp'
+    try:
+        if formato == 'WEBP':
+            imagen.save(temporal, 'WEBP', quality=calidad, method=4)
+        else:
+            imagen.save(temporal, 'JPEG', quality=calidad, optimize=True, progressive=True)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def _normalizar(imagen, formato):
+    """Orientación EXIF aplicada y modo de color que admite el formato de salida."""
+    imagen = ImageOps.exif_transpose(imagen)
+    transparente = imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+    if transparente and formato == 'WEBP':
+        return imagen.convert('RGBA')
+    if transparente:
+        # JPEG no tiene transparencia: fondo blanco
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen.convert('RGBA'), mask=imagen.convert('RGBA').getchannel('A'))
+        return fondo
+    return imagen.convert('RGB')
+
+
+def _salidas(base, config):
+    """Archivos que genera procesar(): la imagen reducida y cada miniatura."""
+    extension = _formato_salida()[1]
+    return [base + extension] + [f'{base}_{lado}{extension}' for lado in config['IMAGENES_MINIATURAS']]
+
+
+def _generar(base, config, origen):
+    formato, extension = _formato_salida()
+    calidad = config['IMAGENES_CALIDAD']
+    with Image.open(origen) as original:
+        original.seek(0)  # GIF / MPO: primer cuadro
+        imagen = _normalizar(original, formato)
+    lado = config['IMAGENES_LADO_MAXIMO']
+    imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+    _publicar(imagen, base + extension, formato, calidad)
+    for lado in sorted(config['IMAGENES_MINIATURAS'], reverse=True):
+        # De la más grande a la más chica, cada una a partir de la anterior
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        _publicar(imagen, f'{base}_{lado}{extension}', formato, calidad)
+
+
+def procesar(base, config, origen=None):
+    """
+    Genera la imagen reducida y sus miniaturas a partir de 'origen' y lo borra.
+    Las imágenes nuevas no llevan EXIF ni otros metadatos: Pillow solo los
+    escribe si se le pasan.
+    Sin 'origen' se reclama base + '.pendiente': devuelve False si otro proceso
+    ya la reclamó. Si falla, el original queda como base + '.fallida', se borra
+    lo que se alcanzó a generar y se relanza la excepción.
+    """
+    if origen is not None:
+        _generar(base, config, origen)
+        if os.path.abspath(origen) != os.path.abspath(base + _formato_salida()[1]):
+            os.remove(origen)
+        return True
+    reclamada = base + EN_PROCESO + tareas.propietario().replace(':', '+')
+    try:
+        os.rename(base + PENDIENTE, reclamada)
+    except FileNotFoundError:
+        return False
+    try:
+        _generar(base, config, reclamada)
+    except Exception:
+        for ruta in _salidas(base, config):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        os.replace(reclamada, base + FALLIDA)
+        raise
+    os.remove(reclamada)
+    return True
+
+
+def iniciar(app):
+    """
+    Crea el pool de procesamiento y la función 'miniatura' de las plantillas.
+    Las imágenes que quedaron pendientes (el proceso se detuvo) se vuelven a encolar.
+    """
+    app.jinja_env.globals['miniatura'] = miniatura
+    if not app.config['IMAGENES_WORKERS']:
+        return
+    pool = ThreadPoolExecutor(max_workers=app.config['IMAGENES_WORKERS'], thread_name_prefix='imagen')
+    app.extensions['imagenes'] = pool
+    for base in pendientes(app):
+        pool.submit(_procesar_en_segundo_plano, app, base)
+
+
+def pendientes(app=None):
+    """
+    Bases de las fotos pendientes de proceso. Las reclamadas por un proceso de
+    este host que ya terminó se devuelven a '.pendiente' (se vuelven a procesar).
+    """
+    bases = []
+    for carpeta, _, archivos in os.walk(os.path.join(directorio_static(app), 'uploads')):
+        for archivo in archivos:
+            ruta = os.path.join(carpeta, archivo)
+            base, _, dueno = ruta.partition(EN_PROCESO)
+            if dueno and not tareas.proceso_vivo(dueno.replace('+', ':')):
+                try:
+                    os.rename(ruta, base + PENDIENTE)
+                except FileNotFoundError:
+                    continue  # Otro proceso la devolvió antes
+                bases.append(base)
+            elif archivo.endswith(PENDIENTE):
+                bases.append(ruta[:-len(PENDIENTE)])
+    return bases
+
+
+# === --- Plantillas --- ===
+
+def miniatura(ruta, lado=None):
+    """
+    URL de la miniatura de 'lado' píxeles (o de la imagen procesada si lado es
+    None) de una imagen guardada; None si todavía no existe (en proceso, o una
+    foto anterior sin convertir).
+    """
+    if not ruta:
+        return None
+    base, extension = os.path.splitext(ruta)
+    relativa = f'{base}_{lado}{extension}' if lado else ruta
+    if not os.path.exists(os.path.join(directorio_static(), *relativa.split('/'))):
+        return None
+    return url_for('static', filename=relativa)
+
+
+# === --- Conversión de las fotos anteriores --- ===
+
+def migrar(avance=None):
+    """
+    Procesa las fotos guardadas tal como se subieron (JPG/PNG originales):
+    genera la versión reducida y las miniaturas, actualiza la ruta en la BD y
+    borra el original. Devuelve (convertidas, faltantes).
+    """
+    from app.models import Salida, Ingreso
+
+    extension = _formato_salida()[1]
+    convertidas = faltantes = 0
+    for modelo, columna in ((Salida, Salida.imagen_salida), (Ingreso, Ingreso.imagen_ingreso)):
+        filas = db.session.query(modelo.id, columna) \
+            .filter(columna.isnot(None), ~columna.endswith(extension)).all()
+        for id_, ruta in filas:
+            origen = os.path.join(directorio_static(), *ruta.split('/'))
+            if not os.path.exists(origen):
+                faltantes += 1
+                continue
+            base = os.path.splitext(origen)[0]
+            procesar(base, current_app.config, origen=origen)
+            db.session.query(modelo).filter(modelo.id == id_) \
+                .update({columna: os.path.splitext(ruta)[0] + extension}, synchronize_session=False)
+            db.session.commit()
+            convertidas += 1
+            if avance:
+                avance(ruta)
+    return convertidas, faltantes
+
+
+def registrar_comandos(app):
+    @app.cli.command('imagenes-migrar')
+    def comando_migrar():
+        """Reduce y recomprime las fotos subidas antes del procesamiento de imágenes."""
+        convertidas, faltantes = migrar(avance=lambda ruta: click.echo(f'  {ruta}'))
+        click.echo(f'Fotos convertidas: {convertidas}. Sin archivo en disco: {faltantes}.')
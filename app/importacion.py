@@ -0,0 +1,321 @@
+# app/importacion.py
+# Importación masiva de productos desde Excel (o CSV).
+# Todo el archivo se valida de una vez con pandas (columnas completas, no fila
+# por fila), los códigos existentes se buscan con consultas IN por lotes y los
+# productos e ingresos se insertan con executemany, en vez de una consulta y
+# un INSERT por cada fila.
+
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import insert, update
+
+from app import db
+from config import Config
+from app.models import Producto, Ingreso
+from app.tipos import VALOR_MAXIMO
+from app import stock
+from app.tareas import registrar
+
+# Encabezado en el Excel -> columna del modelo
+COLUMNAS = {
+    'Código': 'codigo',
+    'Nombre': 'nombre',
+    'Cantidad': 'cantidad',
+    'Precio': 'precio',
+    'Proveedor': 'proveedor',
+    'Stock Mínimo': 'stock_minimo',
+    'Subalmacén': 'subalmacen',
+    'Unidad': 'unidad',
+    'Diámetro': 'diametro',
+}
+REQUERIDAS = ['Código', 'Nombre', 'Cantidad', 'Precio', 'Subalmacén', 'Unidad']
+TEXTO = ['codigo', 'nombre', 'proveedor', 'subalmacen', 'unidad', 'diametro']
+NUMERICAS = ['cantidad', 'precio', 'stock_minimo']
+
+TAMANO_LOTE = 500  # Filas por executemany / parámetros por consulta IN
+FILAS_POR_COMMIT = 2000  # Importación en segundo plano: filas leídas y confirmadas por lote
+
+MODOS = ('rechazar', 'actualizar')
+
+
+class ErrorImportacion(Exception):
+    """Error que invalida todo el archivo (ej: faltan columnas requeridas)."""
+
+
+class ResultadoImportacion:
+    """Resumen de una importación: productos creados/actualizados y errores por fila."""
+
+    def __init__(self):
+        self.creados = 0
+        self.actualizados = 0
+        self.errores = []  # Lista de (fila_excel, mensaje)
+
+    def agregar_errores(self, filas, mensajes):
+        self.errores.extend(zip(filas, mensajes))
+
+
+def _sin_espacios(df):
+    """Encabezados sin espacios alrededor ('Código ' -> 'Código'), igual en todos los lectores."""
+    return df.rename(columns=lambda encabezado: str(encabezado).strip())
+
+
+def leer_excel(archivo):
+    """
+    Lee el Excel con cada celda tal como está (object): los códigos no pasan
+    por float ('0012' no pierde ceros, 12 no se vuelve '12.0') aunque el
+    encabezado tenga espacios. validar() convierte las columnas numéricas.
+    """
+    return _sin_espacios(pd.read_excel(archivo, dtype=object))
+
+
+def _lotes(valores, tamano=TAMANO_LOTE):
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def validar(df, fila_inicial=2, vistos=None):
+    """
+    Normaliza y valida un DataFrame con los encabezados del Excel.
+    Devuelve (validos, errores): un DataFrame con las columnas del modelo y la
+    columna 'fila' (número de fila en el Excel), y una lista de (fila, mensaje).
+    Las filas sin Código o sin Nombre se ignoran, como filas vacías.
+    'vistos' (opcional) es el conjunto de códigos de los lotes anteriores del
+    mismo archivo; se completa con los códigos válidos de este lote.
+    """
+    faltantes = [c for c in REQUERIDAS if c not in df.columns]
+    if faltantes:
+        raise ErrorImportacion(f'Faltan columnas requeridas: {", ".join(faltantes)}.')
+
+    df = df.rename(columns=COLUMNAS).reindex(columns=list(COLUMNAS.values()))
+    df['fila'] = df.index + fila_inicial
+
+    for columna in TEXTO:
+        texto = df[columna].map(_texto, na_action='ignore')  # 12.0 -> '12' (celdas numéricas)
+        df[columna] = texto.where(texto.notna(), '').astype(str).str.strip()
+    df = df[(df['codigo'] != '') & (df['nombre'] != '')]
+
+    # Un mensaje por fila: se conserva el primer problema encontrado
+    mensaje = pd.Series('', index=df.index)
+
+    def marcar(condicion, texto):
+        nonlocal mensaje
+        mensaje = mensaje.mask(condicion & (mensaje == ''), texto)
+
+    for columna in NUMERICAS:
+        original = df[columna]
+        df[columna] = pd.to_numeric(original, errors='coerce')
+        titulo = next(e for e, c in COLUMNAS.items() if c == columna)
+        # 'nan' no se convierte (queda vacío), 'inf' sí: los dos se informan como texto inválido
+        marcar(original.notna() & ~np.isfinite(df[columna]), f'{titulo} no es un número.')
+        marcar(df[columna] < 0, f'{titulo} no puede ser negativo.')
+        marcar(df[columna] > VALOR_MAXIMO, f'{titulo} no puede superar {VALOR_MAXIMO}.')
+    marcar(df['cantidad'].isna(), 'Falta la Cantidad.')
+    marcar(df['precio'].isna(), 'Falta el Precio.')
+
+    marcar(df['subalmacen'] == '', 'Falta el Subalmacén.')
+    marcar(df['unidad'] == '', 'Falta la Unidad.')
+    for columna in TEXTO:
+        largo = Producto.__table__.c[columna].type.length
+        titulo = next(e for e, c in COLUMNAS.items() if c == columna)
+        marcar(df[columna].str.len() > largo, f'{titulo} supera los {largo} caracteres.')
+
+    repetido = df['codigo'].duplicated(keep='first')
+    if vistos:
+        repetido |= df['codigo'].isin(vistos)
+    marcar(repetido, 'Código repetido en el archivo.')
+
+    invalidas = mensaje != ''
+    errores = list(zip(df.loc[invalidas, 'fila'].tolist(), mensaje[invalidas].tolist()))
+    if vistos is not None:
+        vistos.update(df.loc[~invalidas, 'codigo'])
+    return df[~invalidas], errores
+
+
+def codigos_existentes(codigos):
+    """{codigo: (id, cantidad)} de los productos que ya existen, con consultas IN por lotes."""
+    existentes = {}
+    for lote in _lotes(list(codigos)):
+        filas = db.session.query(Producto.codigo, Producto.id, Producto.cantidad) \
+            .filter(Producto.codigo.in_(lote)).all()
+        existentes.update({codigo: (id_, cantidad or 0.0) for codigo, id_, cantidad in filas})
+    return existentes
+
+
+def _vacio(valor):
+    return valor == '' or pd.isna(valor)
+
+
+def _registros(df):
+    """Filas de productos nuevos: los datos opcionales vacíos toman su valor por defecto."""
+    registros = df[list(COLUMNAS.values())].to_dict('records')
+    for r in registros:
+        for columna in ('proveedor', 'diametro'):
+            r[columna] = r[columna] or None
+        if _vacio(r['stock_minimo']):
+            r['stock_minimo'] = Config.STOCK_MINIMO
+    return registros
+
+
+def _cambios(df):
+    """
+    Filas de productos existentes: solo las columnas que el archivo trae con
+    valor en esa fila (una columna ausente o una celda vacía no borra el dato guardado).
+    """
+    return [{columna: valor for columna, valor in r.items() if not _vacio(valor)}
+            for r in df[list(COLUMNAS.values())].to_dict('records')]
+
+
+def guardar(validos, usuario_id, modo, resultado):
+    """
+    Inserta los productos nuevos y, en modo 'actualizar', actualiza por código
+    los existentes. Registra los ingresos correspondientes (stock inicial de los
+    nuevos y aumentos de stock de los actualizados). No hace commit.
+    """
+    existentes = codigos_existentes(validos['codigo'])
+    ya_existe = validos['codigo'].isin(existentes.keys())
+
+    if modo != 'actualizar':
+        repetidos = validos[ya_existe]
+        resultado.agregar_errores(repetidos['fila'].tolist(),
+                                  [f"Código '{c}' repetido." for c in repetidos['codigo']])
+    else:
+        cambios, diferencias, ingresos = [], [], []
+        for r in _cambios(validos[ya_existe]):
+            id_, cantidad_anterior = existentes[r['codigo']]
+            cantidad = r.pop('cantidad')
+            cambios.append({**r, 'id': id_})
+            if cantidad != cantidad_anterior:
+                # El stock se ajusta por diferencia (no se pisan salidas registradas mientras tanto)
+                diferencias.append((id_, cantidad - cantidad_anterior))
+            if cantidad > cantidad_anterior:
+                # Igual que al editar un producto: el aumento de stock es un ingreso
+                ingresos.append({'producto_id': id_, 'cantidad_agregada': cantidad - cantidad_anterior,
+                                 'usuario_id': usuario_id})
+        for lote in _lotes(cambios):
+            db.session.execute(update(Producto), lote)
+            # El stock mínimo pudo cambiar: marca de alerta (app/stock.py)
+            stock.actualizar_alertas([c['id'] for c in lote])
+        for lote in _lotes(diferencias):
+            stock.sumar_lote(lote)
+        for lote in _lotes(ingresos):
+            db.session.execute(insert(Ingreso), lote)
+        resultado.actualizados += len(cambios)
+
+    nuevos = _registros(validos[~ya_existe])
+    for lote in _lotes(nuevos):
+        ids = db.session.execute(insert(Producto).returning(Producto.id, sort_by_parameter_order=True), lote).scalars().all()
+        stock.actualizar_alertas(ids)
+        db.session.execute(insert(Ingreso), [
+            {'producto_id': id_, 'cantidad_agregada': r['cantidad'], 'usuario_id': usuario_id}
+            for id_, r in zip(ids, lote)
+        ])
+    resultado.creados += len(nuevos)
+
+
+def importar(df, usuario_id, modo='rechazar'):
+    """Valida e importa un DataFrame completo en una sola transacción."""
+    resultado = ResultadoImportacion()
+    validos, errores = validar(df)
+    resultado.errores.extend(errores)
+    try:
+        guardar(validos, usuario_id, modo, resultado)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    resultado.errores.sort()
+    return resultado
+
+
+# === --- Importación por lotes en segundo plano (archivos grandes) --- ===
+# El archivo subido se guarda en disco y se lee por partes: el xlsx con
+# openpyxl en modo read_only (fila a fila, sin cargar el libro) y el CSV con
+# el lector por bloques de pandas. Cada lote se valida y se confirma por
+# separado; los errores se escriben en un CSV descargable.
+
+def _texto(valor):
+    # openpyxl devuelve números en celdas de texto (ej: códigos): 12.0 -> '12'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return valor if valor is None or isinstance(valor, str) else str(valor)
+
+
+def _lotes_xlsx(ruta, filas=FILAS_POR_COMMIT):
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja = libro.active
+        total = max((hoja.max_row or 0) - 1, 1)  # max_row puede faltar en libros sin dimensiones
+        iterador = hoja.iter_rows(values_only=True)
+        encabezados = [str(c).strip() if c is not None else '' for c in next(iterador, ())]  # Como _sin_espacios
+        texto = [i for i, e in enumerate(encabezados) if COLUMNAS.get(e) in TEXTO]
+        ancho = len(encabezados)
+        leidas, bloque = 0, []
+        for fila in iterador:
+            fila = list(fila[:ancho]) + [None] * (ancho - len(fila))
+            for i in texto:
+                fila[i] = _texto(fila[i])
+            bloque.append(fila)
+            if len(bloque) == filas:
+                yield pd.DataFrame(bloque, columns=encabezados, index=range(leidas, leidas + len(bloque))), \
+                    min((leidas + len(bloque)) / total, 1.0)
+                leidas += len(bloque)
+                bloque = []
+        if bloque or not leidas:
+            yield pd.DataFrame(bloque, columns=encabezados, index=range(leidas, leidas + len(bloque))), 1.0
+    finally:
+        libro.close()
+
+
+def _lotes_csv(ruta, filas=FILAS_POR_COMMIT):
+    tamano = max(os.path.getsize(ruta), 1)
+    with open(ruta, 'rb') as archivo:
+        # sep=None detecta el separador (',' o ';', habitual en Excel en español)
+        # Todo como texto: el tipo por encabezado fallaría con 'Código ' y validar() convierte los números
+        lector = pd.read_csv(archivo, sep=None, engine='python', chunksize=filas, encoding='utf-8-sig',
+                             encoding_errors='replace', dtype=str)
+        for bloque in lector:
+            yield _sin_espacios(bloque), min(archivo.tell() / tamano, 1.0)
+
+
+def leer_lotes(ruta, formato, filas=FILAS_POR_COMMIT):
+    """Genera (DataFrame, fracción leída) por cada lote de filas del archivo."""
+    lector = _lotes_csv if formato == 'csv' else _lotes_xlsx
+    return lector(ruta, filas)
+
+
+@registrar('importacion', 'errores_importacion.csv', mimetype='text/csv',
+           titulo='Importando productos', descarga_automatica=False)
+def importar_archivo(destino, avance, origen, formato, usuario_id, modo='rechazar'):
+    """
+    Tarea: importa el archivo 'origen' por lotes, confirmando cada uno, y
+    escribe en 'destino' el informe de errores por fila. El archivo subido se
+    elimina al terminar. Devuelve el resumen que se muestra en la tarea.
+    """
+    creados = actualizados = errores = 0
+    vistos = set()
+    try:
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as salida:
+            informe = csv.writer(salida)
+            informe.writerow(['Fila', 'Error'])
+            for df, fraccion in leer_lotes(origen, formato):
+                lote = ResultadoImportacion()
+                validos, lote.errores = validar(df, vistos=vistos)
+                try:
+                    guardar(validos, usuario_id, modo, lote)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                informe.writerows(sorted(lote.errores))
+                creados += lote.creados
+                actualizados += lote.actualizados
+                errores += len(lote.errores)
+                avance(fraccion)
+    finally:
+        if os.path.exists(origen):
+            os.remove(origen)
+    return f'{creados} productos importados, {actualizados} actualizados, {errores} filas con errores.'
@@ -0,0 +1,470 @@
+# app/kardex.py
+# Motor del Historial de Movimientos (Kardex).
+# Ingresos y salidas se combinan con UNION ALL en una sola consulta que ya trae
+# el producto y el usuario (JOIN), filtra y ordena en la base de datos.
+# La paginación es por cursor (fecha, tipo, id) y el ORDER BY ... LIMIT se
+# aplica dentro de cada rama, así cada tabla se recorre por su índice de fecha
+# y solo se leen las filas de la página pedida, aunque haya millones.
+
+import heapq
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, literal, union_all, and_, or_, func, event, insert, update, exists, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Producto, Usuario, Salida, Ingreso, SaldoProducto
+from app.tipos import DECIMALES_CANTIDAD, DECIMALES_PRECIO, producto_exacto
+from app.fechas import get_bolivia_time, bolivia_a_utc, parse_fecha
+from app.paginacion import Pagina, codificar_cursor, decodificar_cursor
+
+# Columnas de cada tabla de movimientos: (modelo, fecha, cantidad)
+_RAMAS = {
+    'ingreso': (Ingreso, Ingreso.fecha_ingreso, Ingreso.cantidad_agregada),
+    'salida': (Salida, Salida.fecha_salida, Salida.cantidad_salida),
+}
+
+
+def _rama(tipo, filtros):
+    """SELECT de una tabla de movimientos con las columnas comunes del kardex."""
+    modelo, fecha, cantidad = _RAMAS[tipo]
+    funcionario = Salida.nombre_funcionario if tipo == 'salida' else literal(None)
+    imagen = Salida.imagen_salida if tipo == 'salida' else Ingreso.imagen_ingreso
+    consulta = select(
+        literal(tipo).label('tipo_raw'),
+        modelo.id.label('id'),
+        fecha.label('fecha'),
+        modelo.producto_id.label('producto_id'),
+        Producto.nombre.label('producto'),
+        Producto.codigo.label('codigo'),
+        Producto.subalmacen.label('subalmacen'),
+        cantidad.label('cantidad'),
+        Usuario.username.label('username'),
+        Usuario.rol.label('rol'),
+        funcionario.label('funcionario'),
+        imagen.label('imagen'),
+    ).join(Producto, Producto.id == modelo.producto_id) \
+     .outerjoin(Usuario, Usuario.id == modelo.usuario_id)
+
+    if filtros.get('desde'):
+        consulta = consulta.where(fecha >= filtros['desde'])
+    if filtros.get('hasta'):
+        consulta = consulta.where(fecha < filtros['hasta'])
+    if filtros.get('despues_de'):
+        # Exportaciones incrementales: estrictamente posterior al último instante exportado
+        consulta = consulta.where(fecha > filtros['despues_de'])
+    if filtros.get('producto_id'):
+        consulta = consulta.where(modelo.producto_id == filtros['producto_id'])
+    if filtros.get('subalmacen'):
+        consulta = consulta.where(Producto.subalmacen == filtros['subalmacen'])
+    if filtros.get('usuario_id'):
+        consulta = consulta.where(modelo.usuario_id == filtros['usuario_id'])
+    return consulta
+
+
+# Parámetros (texto) con los que se filtra el kardex desde la URL o una tarea
+PARAMETROS_FILTRO = ('desde', 'hasta', 'codigo', 'subalmacen', 'usuario', 'tipo')
+
+
+def filtros_desde_args(args):
+    """Convierte los parámetros de texto (fechas en hora de Bolivia) en filtros de consulta."""
+    filtros = {
+        'subalmacen': args.get('subalmacen') or None,
+        'tipo': args.get('tipo') or None,
+    }
+    try:
+        filtros['usuario_id'] = int(args['usuario']) if args.get('usuario') else None
+    except ValueError:
+        filtros['usuario_id'] = None
+    desde = parse_fecha(args.get('desde'))
+    hasta = parse_fecha(args.get('hasta'))
+    filtros['desde'] = bolivia_a_utc(desde)
+    # 'hasta' es inclusivo: se filtra hasta el inicio del día siguiente
+    filtros['hasta'] = bolivia_a_utc(hasta + timedelta(days=1)) if hasta else None
+    if args.get('codigo'):
+        producto = Producto.query.filter_by(codigo=args['codigo']).first()
+        # Un código inexistente no debe devolver todo el historial
+        filtros['producto_id'] = producto.id if producto else -1
+    return filtros
+
+
+def _tipos(filtros):
+    tipo = filtros.get('tipo')
+    return [tipo] if tipo in _RAMAS else list(_RAMAS)
+
+
+def _corte_rama(tipo, cursor, descendente):
+    """
+    Condición keyset (fecha, tipo, id) < cursor (o > si es ascendente) para una
+    rama concreta. Como el tipo es constante en la rama, se reduce a una
+    condición sobre (fecha, id) que puede recorrer el índice de fecha.
+    """
+    modelo, fecha, _ = _RAMAS[tipo]
+    c_fecha, c_tipo, c_id = cursor
+    # Con la misma fecha, ¿las filas de esta rama van después del cursor?
+    incluye_misma_fecha = tipo < c_tipo if descendente else tipo > c_tipo
+
+    if descendente:
+        limite, estricto, mismo_id = fecha <= c_fecha, fecha < c_fecha, modelo.id < c_id
+    else:
+        limite, estricto, mismo_id = fecha >= c_fecha, fecha > c_fecha, modelo.id > c_id
+
+    if tipo == c_tipo:
+        return and_(limite, or_(estricto, and_(fecha == c_fecha, mismo_id)))
+    return limite if incluye_misma_fecha else estricto
+
+
+def _ordenar_rama(consulta, tipo, descendente):
+    modelo, fecha, _ = _RAMAS[tipo]
+    if descendente:
+        return consulta.order_by(fecha.desc(), modelo.id.desc())
+    return consulta.order_by(fecha.asc(), modelo.id.asc())
+
+
+def consulta_movimientos(filtros, cursor=None, descendente=True, limite=None):
+    """
+    UNION ALL de ingresos y salidas, ordenado en la BD por (fecha, tipo, id).
+    Con `limite`, cada rama aplica su propio ORDER BY/LIMIT antes de unirse.
+    """
+    ramas = []
+    for tipo in _tipos(filtros):
+        consulta = _rama(tipo, filtros)
+        if cursor:
+            consulta = consulta.where(_corte_rama(tipo, cursor, descendente))
+        if limite:
+            consulta = select(_ordenar_rama(consulta, tipo, descendente).limit(limite).subquery())
+        ramas.append(consulta)
+
+    movimientos = union_all(*ramas).subquery('movimientos')
+    columnas = (movimientos.c.fecha, movimientos.c.tipo_raw, movimientos.c.id)
+    orden = [c.desc() if descendente else c.asc() for c in columnas]
+    consulta = select(movimientos).order_by(*orden)
+    if limite:
+        consulta = consulta.limit(limite)
+    return consulta
+
+
+def _usuario_display(fila):
+    if fila.username:
+        role = "Admin" if fila.rol == 1 else "Empleado"
+        return f"{fila.username} ({role})"
+    return "Sistema (Registro Histórico)"
+
+
+def a_movimiento(fila):
+    """Convierte una fila del UNION en el diccionario que usan vistas y reportes."""
+    es_salida = fila.tipo_raw == 'salida'
+    return {
+        'id': fila.id,
+        'tipo_raw': fila.tipo_raw,
+        'tipo': 'SALIDA' if es_salida else 'INGRESO',
+        'fecha': get_bolivia_time(fila.fecha),
+        'producto_id': fila.producto_id,
+        'producto': fila.producto,
+        'codigo': fila.codigo,
+        'subalmacen': fila.subalmacen,
+        'cantidad': fila.cantidad,
+        'usuario_sistema': _usuario_display(fila),
+        'imagen': fila.imagen,
+        'detalle': f"Retirado por: {fila.funcionario}" if es_salida else 'Compra / Actualización de Stock',
+        'color': 'danger' if es_salida else 'success',
+        'icono': 'fa-arrow-up' if es_salida else 'fa-arrow-down'
+    }
+
+
+def _clave(fila):
+    return (fila.fecha, fila.tipo_raw, fila.id)
+
+
+def pagina_movimientos(filtros, despues=None, antes=None, por_pagina=100):
+    """Una página del kardex (lo más reciente primero) con cursores de navegación."""
+    cursor = decodificar_cursor(despues)
+    hacia_adelante = True
+    if cursor is None:
+        cursor = decodificar_cursor(antes)
+        hacia_adelante = cursor is None
+    if cursor is not None and len(cursor) != 3:
+        cursor, hacia_adelante = None, True
+
+    filas = db.session.execute(
+        consulta_movimientos(filtros, cursor, descendente=hacia_adelante, limite=por_pagina + 1)
+    ).all()
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if not hacia_adelante:
+        filas.reverse()
+
+    if not filas:
+        return Pagina([])
+
+    primero = codificar_cursor(_clave(filas[0]))
+    ultimo = codificar_cursor(_clave(filas[-1]))
+    items = [a_movimiento(f) for f in filas]
+    if hacia_adelante:
+        return Pagina(items, siguiente=ultimo if hay_mas else None, anterior=primero if cursor else None)
+    return Pagina(items, siguiente=ultimo, anterior=primero if hay_mas else None)
+
+
+def iterar_movimientos(filtros, lote=1000):
+    """
+    Recorre todos los movimientos (lo más reciente primero) para exportaciones.
+    Cada tabla se lee ya ordenada y por lotes (yield_per) y ambas se intercalan
+    con heapq.merge, así no se ordena ni se carga nada completo en memoria.
+    """
+    flujos = []
+    for tipo in _tipos(filtros):
+        consulta = _ordenar_rama(_rama(tipo, filtros), tipo, descendente=True)
+        flujos.append(db.session.execute(consulta.execution_options(yield_per=lote)))
+
+    for fila in heapq.merge(*flujos, key=_clave, reverse=True):
+        yield a_movimiento(fila)
+
+
+# =================================================================
+# --- SALDOS: CORTES PERIÓDICOS Y SALDO CORRIDO ---
+# =================================================================
+# Cada cierre de periodo (mensual por defecto, en hora de Bolivia) se guarda el
+# saldo de cada producto en 'saldo_producto'. Para conocer el stock en una
+# fecha D basta con tomar el último corte <= D y sumar los movimientos desde
+# ese corte: O(movimientos desde el corte) en lugar de O(todo el historial).
+# Los cortes se generan solo con 'flask kardex-cortes' (programado con cron al
+# inicio de cada periodo), nunca al consultar un reporte: sin el corte más
+# reciente los saldos siguen siendo exactos, solo se suman más movimientos.
+
+def _siguiente_corte(fecha_utc, periodo):
+    """Primer inicio de periodo (medianoche de Bolivia) estrictamente posterior a la fecha."""
+    local = get_bolivia_time(fecha_utc)
+    if periodo == 'diario':
+        siguiente = datetime(local.year, local.month, local.day) + timedelta(days=1)
+    else:
+        anio, mes = (local.year + 1, 1) if local.month == 12 else (local.year, local.month + 1)
+        siguiente = datetime(anio, mes, 1)
+    return bolivia_a_utc(siguiente)
+
+
+def ultimo_corte(hasta=None):
+    """Fecha del corte más reciente <= hasta (o None si no hay cortes)."""
+    consulta = db.session.query(func.max(SaldoProducto.fecha_corte))
+    if hasta is not None:
+        consulta = consulta.filter(SaldoProducto.fecha_corte <= hasta)
+    return consulta.scalar()
+
+
+def _netos(desde, hasta, producto_id=None):
+    """{producto_id: ingresos - salidas} de los movimientos con desde <= fecha < hasta."""
+    ramas = []
+    for tipo, signo in (('ingreso', 1), ('salida', -1)):
+        modelo, fecha, cantidad = _RAMAS[tipo]
+        consulta = select(modelo.producto_id.label('producto_id'), (cantidad * signo).label('neto')) \
+            .where(fecha < hasta)
+        if desde is not None:
+            consulta = consulta.where(fecha >= desde)
+        if producto_id is not None:
+            consulta = consulta.where(modelo.producto_id == producto_id)
+        ramas.append(consulta)
+    netos = union_all(*ramas).subquery('netos')
+    filas = db.session.execute(
+        select(netos.c.producto_id, func.sum(netos.c.neto)).group_by(netos.c.producto_id)
+    ).all()
+    return {producto_id: neto or 0.0 for producto_id, neto in filas}
+
+
+def saldo_en_fecha(producto_id, fecha):
+    """Stock de un producto justo antes de `fecha` (UTC), según el kardex."""
+    corte = ultimo_corte(fecha)
+    base = 0.0
+    if corte is not None:
+        base = db.session.query(SaldoProducto.cantidad) \
+            .filter_by(producto_id=producto_id, fecha_corte=corte).scalar() or 0.0
+    return base + _netos(corte, fecha, producto_id).get(producto_id, 0.0)
+
+
+def saldos_en_fecha(fecha):
+    """{producto_id: saldo} de todos los productos justo antes de `fecha` (UTC)."""
+    corte = ultimo_corte(fecha)
+    saldos = {}
+    if corte is not None:
+        saldos = dict(db.session.query(SaldoProducto.producto_id, SaldoProducto.cantidad)
+                      .filter_by(fecha_corte=corte).all())
+    for producto_id, neto in _netos(corte, fecha).items():
+        saldos[producto_id] = saldos.get(producto_id, 0.0) + neto
+    return saldos
+
+
+def inventario_valorado(fecha):
+    """
+    Inventario valorado (al precio actual) justo antes de `fecha`.
+    Devuelve {subalmacen: {'productos': n, 'cantidad': x, 'valor': bs}}.
+    """
+    saldos = saldos_en_fecha(fecha)
+    resumen = {}
+    for producto_id, subalmacen, precio in db.session.query(Producto.id, Producto.subalmacen, Producto.precio):
+        saldo = saldos.get(producto_id, 0.0)
+        if not saldo:
+            continue
+        total = resumen.setdefault(subalmacen, {'productos': 0, 'cantidad': 0.0, 'valor': 0.0})
+        total['productos'] += 1
+        total['cantidad'] += saldo
+        total['valor'] += producto_exacto(saldo, DECIMALES_CANTIDAD, precio or 0.0, DECIMALES_PRECIO)
+    return resumen
+
+
+def generar_cortes(hasta=None):
+    """
+    Genera los cortes pendientes hasta `hasta` (por defecto, ahora), cada uno a
+    partir del anterior más los movimientos del periodo. Devuelve cuántos cortes
+    se calcularon. Si otro proceso genera el mismo corte a la vez, se deja el
+    suyo y se termina.
+    """
+    periodo = current_app.config['KARDEX_PERIODO_CORTE']
+    hasta = hasta or datetime.utcnow()
+    anterior = ultimo_corte()
+
+    if anterior is None:
+        primeras = [db.session.query(func.min(f)).scalar() for _, f, _ in _RAMAS.values()]
+        primeras = [f for f in primeras if f is not None]
+        if not primeras:
+            return 0
+        saldos, corte = {}, _siguiente_corte(min(primeras), periodo)
+    else:
+        saldos = dict(db.session.query(SaldoProducto.producto_id, SaldoProducto.cantidad)
+                      .filter_by(fecha_corte=anterior).all())
+        corte = _siguiente_corte(anterior, periodo)
+
+    generados = 0
+    while corte <= hasta:
+        for producto_id, neto in _netos(anterior, corte).items():
+            saldos[producto_id] = saldos.get(producto_id, 0.0) + neto
+        filas = [{'producto_id': p, 'fecha_corte': corte, 'cantidad': c} for p, c in saldos.items() if c]
+        try:
+            if filas:
+                db.session.execute(insert(SaldoProducto), filas)
+            db.session.commit()
+        except IntegrityError:
+            # uq_saldo_producto_corte: el corte ya fue generado por otro proceso
+            db.session.rollback()
+            break
+        anterior, corte = corte, _siguiente_corte(corte, periodo)
+        generados += 1
+    return generados
+
+
+def kardex_producto(producto_id, desde, hasta, despues=None, por_pagina=100):
+    """
+    Movimientos de un producto en [desde, hasta) en orden cronológico con su
+    saldo corrido. El saldo inicial de la página sale del último corte más los
+    movimientos posteriores, sin recorrer todo el historial.
+    Devuelve (Pagina, saldo_inicial_del_rango).
+    """
+    filtros = {'producto_id': producto_id, 'desde': desde, 'hasta': hasta}
+    saldo_rango = saldo_en_fecha(producto_id, desde)
+
+    cursor = decodificar_cursor(despues)
+    if cursor is not None and len(cursor) != 3:
+        cursor = None
+    if cursor is None:
+        saldo = saldo_rango
+    else:
+        # Saldo justo después del movimiento del cursor
+        c_fecha, c_tipo, c_id = cursor
+        saldo = saldo_en_fecha(producto_id, c_fecha)
+        for fila in db.session.execute(consulta_movimientos(
+                dict(filtros, desde=c_fecha, hasta=c_fecha + timedelta(microseconds=1)))):
+            if (fila.tipo_raw, fila.id) <= (c_tipo, c_id):
+                saldo += fila.cantidad if fila.tipo_raw == 'ingreso' else -fila.cantidad
+
+    filas = db.session.execute(
+        consulta_movimientos(filtros, cursor, descendente=False, limite=por_pagina + 1)
+    ).all()
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+
+    items = []
+    for fila in filas:
+        saldo += fila.cantidad if fila.tipo_raw == 'ingreso' else -fila.cantidad
+        movimiento = a_movimiento(fila)
+        movimiento['saldo'] = saldo
+        items.append(movimiento)
+
+    siguiente = codificar_cursor(_clave(filas[-1])) if hay_mas else None
+    return Pagina(items, siguiente=siguiente), saldo_rango
+
+
+# --- Mantenimiento de cortes ante cambios retroactivos ---
+# Si se crea, edita o elimina un movimiento con fecha anterior a algún corte
+# (ej: editar_salida sobre una salida antigua), se ajustan esos cortes con la
+# diferencia, así siguen siendo exactos sin tener que regenerarlos.
+
+def _valores_movimiento(obj, previos):
+    """(producto_id, fecha, cantidad con signo) actuales o previos al flush."""
+    tipo = 'salida' if isinstance(obj, Salida) else 'ingreso'
+    _, fecha, cantidad = _RAMAS[tipo]
+    estado = inspect(obj)
+    valores = []
+    for atributo in ('producto_id', fecha.key, cantidad.key):
+        if previos:
+            historial = estado.attrs[atributo].history
+            anteriores = historial.deleted or historial.unchanged
+            valores.append(anteriores[0] if anteriores else getattr(obj, atributo))
+        else:
+            valores.append(getattr(obj, atributo))
+    producto_id, momento, valor = valores
+    signo = -1 if tipo == 'salida' else 1
+    return producto_id, momento, (valor or 0.0) * signo
+
+
+def _ajustar_cortes(conexion, producto_id, fecha, delta):
+    tabla = SaldoProducto.__table__
+    conexion.execute(
+        update(tabla)
+        .where(tabla.c.producto_id == producto_id, tabla.c.fecha_corte > fecha)
+        .values(cantidad=tabla.c.cantidad + delta)
+    )
+    # Cortes donde el producto tenía saldo cero (sin fila) pasan a tener el delta
+    cortes = select(tabla.c.fecha_corte).where(tabla.c.fecha_corte > fecha).distinct().subquery()
+    sin_fila = ~exists().where(tabla.c.producto_id == producto_id, tabla.c.fecha_corte == cortes.c.fecha_corte)
+    conexion.execute(
+        insert(tabla).from_select(
+            ['producto_id', 'fecha_corte', 'cantidad'],
+            select(literal(producto_id), cortes.c.fecha_corte, literal(delta, tabla.c.cantidad.type))
+            .where(sin_fila)
+        )
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _actualizar_cortes(session, flush_context):
+    productos_eliminados = {p.id for p in session.deleted if isinstance(p, Producto)}
+    cambios = []
+    for obj in session.new:
+        if isinstance(obj, (Ingreso, Salida)):
+            cambios.append(_valores_movimiento(obj, previos=False))
+    for obj in session.deleted:
+        if isinstance(obj, (Ingreso, Salida)):
+            producto_id, fecha, valor = _valores_movimiento(obj, previos=True)
+            cambios.append((producto_id, fecha, -valor))
+    for obj in session.dirty:
+        if isinstance(obj, (Ingreso, Salida)) and session.is_modified(obj):
+            producto_id, fecha, valor = _valores_movimiento(obj, previos=True)
+            cambios.append((producto_id, fecha, -valor))
+            cambios.append(_valores_movimiento(obj, previos=False))
+
+    cambios = [c for c in cambios if c[1] is not None and c[2] and c[0] not in productos_eliminados]
+    if not cambios:
+        return
+    conexion = session.connection()
+    corte = conexion.execute(select(func.max(SaldoProducto.fecha_corte))).scalar()
+    for producto_id, fecha, delta in cambios:
+        if corte is not None and fecha < corte:
+            _ajustar_cortes(conexion, producto_id, fecha, delta)
+
+
+def registrar_comandos(app):
+    @app.cli.command('kardex-cortes')
+    def comando_cortes():
+        """Genera los cortes de saldo del kardex pendientes hasta hoy."""
+        generados = generar_cortes()
+        click.echo(f'Cortes generados: {generados}')
@@ -1,4 +1,5 @@
 from app import db
+from app.tipos import Cantidad, Precio, DECIMALES_CANTIDAD, DECIMALES_PRECIO, producto_exacto
 from datetime import datetime
 from config import Config
 from flask_login import UserMixin 
@@ -26,57 +27,113 @@ class Usuario(UserMixin, db.Model):
 
 class Producto(db.Model):
     """Modelo de la tabla 'producto'."""
+    # Índices según los accesos de reportes y kardex (se crean en BD existentes con app/esquema.py)
+    __table_args__ = (
+        db.Index('ix_producto_subalmacen_codigo', 'subalmacen', 'codigo'),
+        # Índice parcial: solo los productos en alerta (stock crítico y alertas del inventario),
+        # en el orden de cambios_de_alerta
+        db.Index('ix_producto_en_alerta', 'alerta_cambio', 'id',
+                 sqlite_where=db.text('en_alerta = 1'), postgresql_where=db.text('en_alerta')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(50), unique=True, nullable=False)
-    nombre = db.Column(db.String(100), nullable=False)
-    cantidad = db.Column(db.Float, default=0.0)
-    precio = db.Column(db.Float, default=0.0)
+    nombre = db.Column(db.String(100), nullable=False, index=True)
+    # Punto fijo (app/tipos.py): milésimas de unidad y centavos guardados como enteros
+    cantidad = db.Column(Cantidad(), default=0.0)
+    precio = db.Column(Precio(), default=0.0)
     proveedor = db.Column(db.String(100))
     fecha_ingreso = db.Column(db.DateTime, default=datetime.utcnow)
-    stock_minimo = db.Column(db.Float, default=Config.STOCK_MINIMO)
+    stock_minimo = db.Column(Cantidad(), default=Config.STOCK_MINIMO)
     subalmacen = db.Column(db.String(50), nullable=False)
     unidad = db.Column(db.String(50), nullable=False)
     diametro = db.Column(db.String(50))
+    # Marca materializada de cantidad <= stock_minimo y fecha de su último cambio (app/stock.py)
+    en_alerta = db.Column(db.Boolean)
+    alerta_cambio = db.Column(db.DateTime, index=True)
 
     # Relaciones con cascada para evitar errores al eliminar
     salidas = db.relationship('Salida', backref='producto', lazy=True, cascade="all, delete-orphan")
     ingresos = db.relationship('Ingreso', backref='producto', lazy=True, cascade="all, delete-orphan")
+    saldos = db.relationship('SaldoProducto', backref='producto', lazy=True, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'<Producto {self.nombre}>'
 
     def necesita_alerta(self):
-        return self.cantidad <= self.stock_minimo
+        if self.en_alerta is not None:
+            return self.en_alerta
+        return self.stock_minimo is not None and self.cantidad <= self.stock_minimo
 
     @property
     def total_value(self):
-        return self.precio * self.cantidad
+        return producto_exacto(self.precio, DECIMALES_PRECIO, self.cantidad, DECIMALES_CANTIDAD)
 
 
 class Salida(db.Model):
     """Modelo para registrar salidas de productos."""
+    __table_args__ = (
+        # (producto | funcionario, fecha) con cantidad y precio: los resúmenes se leen solo del índice
+        db.Index('ix_salida_producto_fecha', 'producto_id', 'fecha_salida', 'id', 'cantidad_salida', 'precio_en_bs'),
+        db.Index('ix_salida_fecha', 'fecha_salida'),
+        db.Index('ix_salida_funcionario_fecha', 'nombre_funcionario', 'fecha_salida', 'id', 'cantidad_salida', 'precio_en_bs'),
+        db.Index('ix_salida_usuario_fecha', 'usuario_id', 'fecha_salida'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
-    cantidad_salida = db.Column(db.Float, nullable=False)
+    cantidad_salida = db.Column(Cantidad(), nullable=False)
     nombre_funcionario = db.Column(db.String(100), nullable=False)
     codigo_funcionario = db.Column(db.String(50), nullable=False)
     fecha_salida = db.Column(db.DateTime, default=datetime.utcnow)
-    precio_en_bs = db.Column(db.Float, nullable=False)
+    precio_en_bs = db.Column(Precio(), nullable=False)
     imagen_salida = db.Column(db.String(255), nullable=True)
     
     # NUEVO: Usuario del sistema que registró la salida
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
     usuario = db.relationship('Usuario', backref='salidas_registradas')
 
+    # Documento de salida de varias líneas al que pertenece (None si se registró sola)
+    documento_id = db.Column(db.Integer, db.ForeignKey('documento_salida.id'), index=True)
+
     def __repr__(self):
         return f'<Salida {self.producto.nombre}>'
 
 
+class DocumentoSalida(db.Model):
+    """
+    Salida de varios productos en un solo registro (ej: lista de materiales de
+    una intervención de pozo). La cabecera guarda los datos comunes y cada
+    línea es una Salida normal, así el kardex y los reportes no cambian.
+    """
+    __tablename__ = 'documento_salida'
+
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    nombre_funcionario = db.Column(db.String(100), nullable=False)
+    codigo_funcionario = db.Column(db.String(50), nullable=False)
+    observacion = db.Column(db.String(255))
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
+    usuario = db.relationship('Usuario')
+    lineas = db.relationship('Salida', backref='documento', lazy=True, order_by='Salida.id')
+
+    def __repr__(self):
+        return f'<DocumentoSalida {self.id}>'
+
+
 class Ingreso(db.Model):
     """Modelo para registrar ingresos/actualizaciones de productos."""
+    __table_args__ = (
+        # Con la cantidad: resumen y ranking de ingresos se leen solo del índice
+        db.Index('ix_ingreso_producto_fecha', 'producto_id', 'fecha_ingreso', 'id', 'cantidad_agregada'),
+        db.Index('ix_ingreso_fecha', 'fecha_ingreso'),
+        db.Index('ix_ingreso_usuario_fecha', 'usuario_id', 'fecha_ingreso'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
-    cantidad_agregada = db.Column(db.Float, nullable=False)
+    cantidad_agregada = db.Column(Cantidad(), nullable=False)
     fecha_ingreso = db.Column(db.DateTime, default=datetime.utcnow)
     imagen_ingreso = db.Column(db.String(255), nullable=True)
     
@@ -85,4 +142,73 @@ class Ingreso(db.Model):
     usuario = db.relationship('Usuario', backref='ingresos_registrados')
 
     def __repr__(self):
-        return f'<Ingreso {self.producto.nombre}>'
\ No newline at end of file
+        return f'<Ingreso {self.producto.nombre}>'
+
+
+class SaldoProducto(db.Model):
+    """
+    Corte periódico del saldo de un producto (checkpoint del kardex).
+    'cantidad' es el stock resultante de todos los movimientos con fecha
+    anterior a 'fecha_corte' (UTC). Solo se guardan saldos distintos de cero.
+    """
+    __tablename__ = 'saldo_producto'
+    __table_args__ = (db.UniqueConstraint('producto_id', 'fecha_corte', name='uq_saldo_producto_corte'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
+    fecha_corte = db.Column(db.DateTime, nullable=False, index=True)
+    cantidad = db.Column(Cantidad(), nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<SaldoProducto {self.producto_id} @ {self.fecha_corte}>'
+
+
+class Tarea(db.Model):
+    """
+    Trabajo en segundo plano (ej: generación de un PDF pesado).
+    'clave' identifica la solicitud (tipo + parámetros): mientras una tarea está
+    pendiente o en proceso no puede existir otra con la misma clave, así las
+    solicitudes idénticas simultáneas comparten un solo trabajo.
+    Una tarea activa cuyo propietario dejó de enviar latidos se da por perdida.
+    """
+    __table_args__ = (
+        db.Index('uq_tarea_activa', 'clave', unique=True,
+                 sqlite_where=db.text("estado IN ('pendiente', 'en_proceso')"),
+                 postgresql_where=db.text("estado IN ('pendiente', 'en_proceso')")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    clave = db.Column(db.String(64), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_proceso, terminada, error
+    progreso = db.Column(db.Float, nullable=False, default=0.0)  # 0.0 a 1.0
+    mensaje = db.Column(db.String(255))
+    archivo = db.Column(db.String(255))  # Ruta del resultado en disco
+    creada_en = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    terminada_en = db.Column(db.DateTime)
+    # Proceso que la ejecuta ('host:pid:token') y su último latido (app/tareas.py)
+    propietario = db.Column(db.String(100))
+    latido = db.Column(db.DateTime)
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
+    usuario = db.relationship('Usuario')
+
+    @property
+    def activa(self):
+        return self.estado in ('pendiente', 'en_proceso')
+
+    def __repr__(self):
+        return f'<Tarea {self.id} {self.tipo} {self.estado}>'
+
+
+class VersionDatos(db.Model):
+    """
+    Contador de cambios confirmados en los datos de los reportes (productos,
+    ingresos, salidas y usuarios). Una sola fila; la avanza app/artefactos.py
+    en la misma transacción del cambio.
+    """
+    __tablename__ = 'version_datos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,120 @@
+# app/paginacion.py
+# Paginación por cursor (keyset) para listados grandes.
+# En lugar de OFFSET (que obliga a la BD a recorrer todas las filas anteriores),
+# cada página recuerda los valores de orden de su primera y última fila y la
+# siguiente consulta continúa con un WHERE (col, id) > (valor, id) que usa índices.
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class Pagina:
+    """Resultado de una consulta paginada por cursor."""
+
+    def __init__(self, items, siguiente=None, anterior=None):
+        self.items = items
+        self.siguiente = siguiente  # Cursor para la página siguiente (o None)
+        self.anterior = anterior    # Cursor para la página anterior (o None)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _a_json(valor):
+    if isinstance(valor, datetime):
+        return {'$dt': valor.isoformat()}
+    return valor
+
+
+def _desde_json(valor):
+    if isinstance(valor, dict) and '$dt' in valor:
+        return datetime.fromisoformat(valor['$dt'])
+    return valor
+
+
+def codificar_cursor(valores):
+    """Convierte la tupla de valores de orden en un token seguro para URL."""
+    crudo = json.dumps([_a_json(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve la lista de valores del cursor, o None si el token no es válido."""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+        if not isinstance(valores, list):
+            return None
+        # Un '$dt' que no es una fecha ISO también hace inválido el cursor
+        return [_desde_json(v) for v in valores]
+    except (ValueError, TypeError):
+        return None
+
+
+def _condicion_keyset(orden, valores, hacia_adelante):
+    """
+    Construye la condición lexicográfica (c1, c2, ...) > (v1, v2, ...)
+    respetando el sentido (ASC/DESC) de cada columna. Se antepone la cota
+    redundante c1 >= v1 (o <=) para que el índice se recorra como rango desde
+    el cursor: del OR solo no se deduce un límite para la primera columna.
+    """
+    terminos = []
+    for i, (expresion, descendente) in enumerate(orden):
+        menor = descendente if hacia_adelante else not descendente
+        corte = expresion < valores[i] if menor else expresion > valores[i]
+        previos = [orden[j][0] == valores[j] for j in range(i)]
+        terminos.append(and_(*previos, corte) if previos else corte)
+    primera, descendente = orden[0]
+    menor = descendente if hacia_adelante else not descendente
+    cota = primera <= valores[0] if menor else primera >= valores[0]
+    return and_(cota, or_(*terminos))
+
+
+def paginar(consulta, orden, clave, por_pagina, despues=None, antes=None):
+    """
+    Pagina una consulta SQLAlchemy por cursor.
+
+    - orden: lista de tuplas (expresion, descendente). La combinación debe ser
+      única (terminar en la clave primaria) y ninguna expresión puede ser NULL.
+    - clave: función que recibe un item del resultado y devuelve la tupla de
+      valores de orden correspondiente a `orden`.
+    - despues / antes: cursores recibidos de una página previa.
+    """
+    valores_despues = decodificar_cursor(despues)
+    valores_antes = None if valores_despues else decodificar_cursor(antes)
+    hacia_adelante = valores_antes is None
+    cursor = valores_despues if hacia_adelante else valores_antes
+
+    if cursor is not None and len(cursor) == len(orden):
+        consulta = consulta.filter(_condicion_keyset(orden, cursor, hacia_adelante))
+    else:
+        cursor = None
+
+    if hacia_adelante:
+        criterios = [e.desc() if d else e.asc() for e, d in orden]
+    else:
+        criterios = [e.asc() if d else e.desc() for e, d in orden]
+
+    items = consulta.order_by(*criterios).limit(por_pagina + 1).all()
+    hay_mas = len(items) > por_pagina
+    items = items[:por_pagina]
+
+    if not hacia_adelante:
+        items.reverse()
+
+    if not items:
+        return Pagina(items)
+
+    primero = codificar_cursor(clave(items[0]))
+    ultimo = codificar_cursor(clave(items[-1]))
+    if hacia_adelante:
+        return Pagina(items, siguiente=ultimo if hay_mas else None, anterior=primero if cursor else None)
+    return Pagina(items, siguiente=ultimo, anterior=primero if hay_mas else None)
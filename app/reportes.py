@@ -0,0 +1,260 @@
+# app/reportes.py
+# Consultas de los reportes HTML y PDF (repositorio compartido).
+# - Resúmenes: una fila por grupo (funcionario o producto) con cantidad de
+#   líneas, suma de cantidad, suma de valor y primera/última fecha, calculados
+#   con GROUP BY en la BD. La página de resumen no trae ninguna línea.
+# - Detalle de un grupo: sus líneas paginadas por cursor (app/paginacion.py),
+#   sobre los índices (funcionario, fecha) y (producto, fecha).
+# - Listados completos (PDF): todas las líneas en una consulta, ordenadas por
+#   grupo y agrupadas con groupby.
+# Cada consulta trae solo las columnas que se muestran, con el nombre del
+# producto y del usuario ya unidos (JOIN): recorrer las filas no dispara ningún
+# SELECT extra por relación perezosa (salida.producto, salida.usuario).
+# Resúmenes y rankings se guardan en la caché de resúmenes (app/cache.py)
+# hasta que se confirme un cambio en las tablas que leen.
+
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import select, func
+
+from app import db
+from app.models import Producto, Salida, Ingreso, Usuario
+from app.exportacion import SUBALMACENES
+from app.cache import en_cache
+from app.paginacion import paginar
+
+
+def _agrupar(filas, campo):
+    """{valor de 'campo': [filas]} conservando el orden de la consulta."""
+    return {clave: list(grupo) for clave, grupo in groupby(filas, key=lambda f: getattr(f, campo))}
+
+
+def fila_json(fila):
+    """Fila de resumen o de detalle como dict serializable a JSON."""
+    return {campo: valor.isoformat() if isinstance(valor, datetime) else valor
+            for campo, valor in fila._mapping.items()}
+
+
+# =================================================================
+# --- COLUMNAS DE LAS LÍNEAS ---
+# =================================================================
+
+_COLUMNAS_SALIDA = (
+    Salida.id, Salida.cantidad_salida, Salida.precio_en_bs, Salida.fecha_salida,
+    Salida.nombre_funcionario, Salida.codigo_funcionario, Salida.imagen_salida.label('imagen'),
+    Producto.id.label('producto_id'), Producto.codigo.label('producto_codigo'),
+    Producto.nombre.label('producto_nombre'), Usuario.username.label('registrado_por'),
+)
+
+_COLUMNAS_INGRESO = (
+    Ingreso.id, Ingreso.cantidad_agregada, Ingreso.fecha_ingreso, Ingreso.imagen_ingreso.label('imagen'),
+    Producto.id.label('producto_id'), Producto.codigo.label('producto_codigo'),
+    Producto.nombre.label('producto_nombre'), Usuario.username.label('registrado_por'),
+)
+
+
+def _consulta_salidas():
+    return select(*_COLUMNAS_SALIDA).join(Salida.producto).outerjoin(Salida.usuario)
+
+
+def _consulta_ingresos():
+    return select(*_COLUMNAS_INGRESO).join(Ingreso.producto).outerjoin(Ingreso.usuario)
+
+
+# =================================================================
+# --- RESÚMENES (GROUP BY) ---
+# =================================================================
+# Los resúmenes sin filtro leen todos los movimientos: lo hacen sobre índices
+# cubrientes (funcionario o producto, fecha, cantidad, precio) sin tocar la
+# tabla, y los de producto agregan primero por producto_id y después unen con
+# Producto (una fila por producto, como el ranking).
+
+def _totales_salidas():
+    return (
+        func.count(Salida.id).label('lineas'),
+        func.sum(Salida.cantidad_salida).label('cantidad'),
+        func.sum(Salida.cantidad_salida * Salida.precio_en_bs).label('valor'),
+        func.min(Salida.fecha_salida).label('primera'),
+        func.max(Salida.fecha_salida).label('ultima'),
+    )
+
+
+@en_cache(Salida)
+def resumen_salidas_por_funcionario(funcionario=None):
+    """Una fila por funcionario: funcionario, lineas, cantidad, valor, primera, ultima."""
+    consulta = select(Salida.nombre_funcionario.label('funcionario'), *_totales_salidas()) \
+        .group_by(Salida.nombre_funcionario).order_by(Salida.nombre_funcionario)
+    if funcionario is not None:
+        consulta = consulta.where(Salida.nombre_funcionario == funcionario)
+    return db.session.execute(consulta).all()
+
+
+def _por_producto(totales, *columnas):
+    """Une los totales ya agrupados por producto_id con el código y nombre del producto."""
+    return select(Producto.id.label('producto_id'), Producto.codigo, Producto.nombre,
+                  *(totales.c[columna] for columna in columnas)) \
+        .join(totales, totales.c.producto_id == Producto.id).order_by(Producto.nombre, Producto.id)
+
+
+@en_cache(Producto, Salida)
+def resumen_salidas_por_producto(producto_id=None):
+    """Una fila por producto: producto_id, codigo, nombre, lineas, cantidad, valor, primera, ultima."""
+    totales = select(Salida.producto_id, *_totales_salidas()).group_by(Salida.producto_id)
+    if producto_id is not None:
+        totales = totales.where(Salida.producto_id == producto_id)
+    consulta = _por_producto(totales.subquery('totales'), 'lineas', 'cantidad', 'valor', 'primera', 'ultima')
+    return db.session.execute(consulta).all()
+
+
+@en_cache(Producto, Ingreso)
+def resumen_ingresos_por_producto(producto_id=None):
+    """Una fila por producto: producto_id, codigo, nombre, lineas, cantidad, primera, ultima."""
+    totales = select(Ingreso.producto_id,
+                     func.count(Ingreso.id).label('lineas'),
+                     func.sum(Ingreso.cantidad_agregada).label('cantidad'),
+                     func.min(Ingreso.fecha_ingreso).label('primera'),
+                     func.max(Ingreso.fecha_ingreso).label('ultima')) \
+        .group_by(Ingreso.producto_id)
+    if producto_id is not None:
+        totales = totales.where(Ingreso.producto_id == producto_id)
+    consulta = _por_producto(totales.subquery('totales'), 'lineas', 'cantidad', 'primera', 'ultima')
+    return db.session.execute(consulta).all()
+
+
+# =================================================================
+# --- DETALLE DE UN GRUPO (PAGINADO) ---
+# =================================================================
+
+def lineas_salidas(funcionario=None, producto_id=None, despues=None, antes=None, por_pagina=50):
+    """Salidas de un funcionario o de un producto, de la más reciente a la más antigua."""
+    consulta = db.session.query(*_COLUMNAS_SALIDA).join(Salida.producto).outerjoin(Salida.usuario)
+    if funcionario is not None:
+        consulta = consulta.filter(Salida.nombre_funcionario == funcionario)
+    if producto_id is not None:
+        consulta = consulta.filter(Salida.producto_id == producto_id)
+    return paginar(
+        consulta,
+        orden=[(Salida.fecha_salida, True), (Salida.id, True)],
+        clave=lambda f: (f.fecha_salida, f.id),
+        por_pagina=por_pagina, despues=despues, antes=antes,
+    )
+
+
+def lineas_ingresos(producto_id, despues=None, antes=None, por_pagina=50):
+    """Ingresos de un producto, del más reciente al más antiguo."""
+    consulta = db.session.query(*_COLUMNAS_INGRESO).join(Ingreso.producto).outerjoin(Ingreso.usuario) \
+        .filter(Ingreso.producto_id == producto_id)
+    return paginar(
+        consulta,
+        orden=[(Ingreso.fecha_ingreso, True), (Ingreso.id, True)],
+        clave=lambda f: (f.fecha_ingreso, f.id),
+        por_pagina=por_pagina, despues=despues, antes=antes,
+    )
+
+
+# Reportes agrupados (vistas HTML y /api/reportes/<nombre>):
+# resumen(grupo=None) y lineas(grupo, despues, antes, por_pagina); 'grupo_entero' si el grupo es un id
+Agrupacion = namedtuple('Agrupacion', 'resumen lineas grupo_entero')
+
+AGRUPACIONES = {
+    'salidas': Agrupacion(resumen_salidas_por_funcionario,
+                          lambda grupo, **kw: lineas_salidas(funcionario=grupo, **kw), False),
+    'por_item': Agrupacion(resumen_salidas_por_producto,
+                           lambda grupo, **kw: lineas_salidas(producto_id=grupo, **kw), True),
+    'ingresos': Agrupacion(resumen_ingresos_por_producto, lineas_ingresos, True),
+}
+
+
+# =================================================================
+# --- RANKING DE PRODUCTOS (TOP N) ---
+# =================================================================
+# Primero se agregan los movimientos por producto_id (índices (producto, fecha)
+# y (fecha) de cada tabla) y recién ese resultado se une con Producto: el JOIN
+# y el orden trabajan sobre una fila por producto, no sobre todo el historial.
+
+RANKING_MOVIMIENTOS = {
+    # movimiento: (modelo, fecha, cantidad, valor de la línea o None = cantidad x precio actual)
+    'salidas': (Salida, Salida.fecha_salida, Salida.cantidad_salida, Salida.cantidad_salida * Salida.precio_en_bs),
+    'ingresos': (Ingreso, Ingreso.fecha_ingreso, Ingreso.cantidad_agregada, None),
+}
+RANKING_CRITERIOS = ('cantidad', 'valor')
+
+
+def consulta_ranking(movimiento='salidas', criterio='cantidad', limite=10, desde=None, hasta=None, subalmacen=None):
+    """SELECT del ranking (ver ranking); separado para poder revisar su plan en app/esquema.py."""
+    modelo, fecha, cantidad, valor = RANKING_MOVIMIENTOS[movimiento]
+    columnas = [
+        modelo.producto_id.label('producto_id'),
+        func.count(modelo.id).label('movimientos'),
+        func.sum(cantidad).label('cantidad'),
+    ]
+    if valor is not None:
+        columnas.append(func.sum(valor).label('valor'))
+    totales = select(*columnas).group_by(modelo.producto_id)
+    if desde is not None:
+        totales = totales.where(fecha >= desde)
+    if hasta is not None:
+        totales = totales.where(fecha < hasta)
+    totales = totales.subquery('totales')
+
+    total_valor = totales.c.valor if valor is not None else totales.c.cantidad * Producto.precio
+    consulta = select(
+        Producto.id.label('producto_id'), Producto.codigo, Producto.nombre, Producto.subalmacen,
+        Producto.unidad, Producto.precio, totales.c.movimientos, totales.c.cantidad,
+        total_valor.label('valor'),
+    ).join(totales, totales.c.producto_id == Producto.id)
+    if subalmacen:
+        consulta = consulta.where(Producto.subalmacen == subalmacen)
+    orden = total_valor if criterio == 'valor' else totales.c.cantidad
+    return consulta.order_by(orden.desc(), Producto.id).limit(limite)
+
+
+@en_cache(Producto, Salida, Ingreso)
+def ranking(movimiento='salidas', criterio='cantidad', limite=10, desde=None, hasta=None, subalmacen=None):
+    """
+    Los 'limite' productos con más salidas o ingresos en [desde, hasta) (UTC),
+    ordenados por cantidad o por valor. Una sola consulta; cada fila trae
+    producto_id, codigo, nombre, subalmacen, unidad, precio, movimientos,
+    cantidad y valor. Los ingresos no guardan precio: se valoran al precio actual.
+    """
+    return db.session.execute(
+        consulta_ranking(movimiento, criterio, limite, desde, hasta, subalmacen)
+    ).all()
+
+
+# =================================================================
+# --- LISTADOS COMPLETOS (PDF) ---
+# =================================================================
+
+def salidas_por_funcionario():
+    """{funcionario: [salidas]} en una consulta (orden del índice funcionario + fecha)."""
+    filas = db.session.execute(
+        _consulta_salidas().order_by(Salida.nombre_funcionario, Salida.fecha_salida, Salida.id)
+    ).all()
+    return _agrupar(filas, 'nombre_funcionario')
+
+
+def salidas_por_producto():
+    """{producto_id: [salidas]} en una consulta, en orden alfabético de producto."""
+    filas = db.session.execute(
+        _consulta_salidas().order_by(Producto.nombre, Producto.id, Salida.fecha_salida, Salida.id)
+    ).all()
+    return _agrupar(filas, 'producto_id')
+
+
+def ingresos_por_producto():
+    """{producto_id: [ingresos]} en una consulta, en orden alfabético de producto."""
+    filas = db.session.execute(
+        _consulta_ingresos().order_by(Producto.nombre, Producto.id, Ingreso.fecha_ingreso, Ingreso.id)
+    ).all()
+    return _agrupar(filas, 'producto_id')
+
+
+def productos_por_subalmacen(subalmacenes=SUBALMACENES):
+    """{subalmacén: [productos]} con una sola consulta para todos los subalmacenes."""
+    productos = Producto.query.filter(Producto.subalmacen.in_(subalmacenes)) \
+        .order_by(Producto.subalmacen, Producto.codigo).all()
+    agrupados = _agrupar(productos, 'subalmacen')
+    return {sub: agrupados.get(sub, []) for sub in subalmacenes}
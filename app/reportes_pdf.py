@@ -0,0 +1,432 @@
+# app/reportes_pdf.py
+# Reportes PDF (ReportLab).
+# Cada reporte es una tarea en segundo plano (ver app/tareas.py): recibe la
+# ruta donde escribir el archivo y una función para informar su avance.
+# El encabezado, el pie y el estilo de tabla son comunes a todos los reportes.
+
+import os
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from flask import current_app
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+from reportlab.lib.pagesizes import A4, landscape
+
+from app import kardex, consultas, reportes
+from app.models import Producto
+from app.tipos import DECIMALES_CANTIDAD, DECIMALES_PRECIO, producto_exacto
+from app.tareas import registrar
+
+# Estimación para convertir el número de página en porcentaje de avance
+FILAS_POR_PAGINA_APROX = 25
+
+
+# =================================================================
+# --- FUNCIONES AUXILIARES Y ESTILOS PARA PDF (REPORTLAB) ---
+# =================================================================
+
+# Estilos compartidos: getSampleStyleSheet() crea todos los estilos de nuevo en
+# cada llamada, así que se construyen una sola vez por proceso.
+_ESTILOS = getSampleStyleSheet()
+ESTILO_TEXTO = _ESTILOS['Normal']
+# Celdas que necesitan varias líneas: misma fuente que el resto del cuerpo de la tabla
+ESTILO_CELDA = ParagraphStyle(name='Celda', parent=_ESTILOS['Normal'], fontName='Helvetica', fontSize=9, leading=11)
+ESTILO_SUBTITULO = _ESTILOS['h3']
+ESTILO_GRUPO = ParagraphStyle(name='Grupo', parent=_ESTILOS['h2'], fontName='Helvetica-Bold', fontSize=12, spaceAfter=6, spaceBefore=12)
+ESTILO_GRUPO_COMPACTO = ParagraphStyle(name='GrupoCompacto', parent=_ESTILOS['h2'], fontName='Helvetica-Bold', fontSize=12)
+
+AZUL_CORPORATIVO = colors.HexColor('#00416A')
+ROJO_ALERTA = colors.HexColor('#C0392B')
+GRIS_CEBRA = colors.HexColor('#F4F6F7')
+GRIS_TOTAL = colors.HexColor('#E8E8E8')
+
+FUENTE_CUERPO, TAMANO_CUERPO = 'Helvetica', 9
+RELLENO_HORIZONTAL = 12  # LEFTPADDING + RIGHTPADDING por defecto de cada celda
+
+# Las tablas grandes se dividen en bloques: partir una sola tabla enorme entre
+# páginas obliga a ReportLab a recalcular todas las filas restantes en cada salto.
+FILAS_POR_BLOQUE = 500
+
+# Estilo de tabla corporativo y limpio para los reportes
+_COMANDOS_BASE = (
+    # Cabecera
+    ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,0), 'CENTER'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,0), 10),
+    ('BOTTOMPADDING', (0,0), (-1,0), 10),
+    ('TOPPADDING', (0,0), (-1,0), 10),
+
+    # Cuerpo
+    ('TEXTCOLOR', (0,1), (-1,-1), colors.black),
+    ('FONTNAME', (0,1), (-1,-1), FUENTE_CUERPO),
+    ('FONTSIZE', (0,1), (-1,-1), TAMANO_CUERPO),
+    ('ALIGN', (0,1), (0,-1), 'LEFT'), # Primera columna a la izquierda
+    ('ALIGN', (1,1), (-1,-1), 'RIGHT'), # Resto (números) a la derecha
+    ('BOTTOMPADDING', (0,1), (-1,-1), 8),
+    ('TOPPADDING', (0,1), (-1,-1), 8),
+
+    # Líneas sutiles
+    ('LINEBELOW', (0,0), (-1,0), 1, AZUL_CORPORATIVO), # Debajo del header
+    ('LINEBELOW', (0,1), (-1,-2), 0.5, colors.HexColor('#E0E0E0')), # Entre filas
+)
+
+_COMANDOS_TOTAL = (
+    ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black), # Encima del total
+    ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+    ('BACKGROUND', (0,-1), (-1,-1), GRIS_TOTAL),
+)
+
+
+def _celda(valor, ancho):
+    """
+    Texto simple si cabe en la columna; Paragraph (que sí parte líneas pero es
+    mucho más costoso de medir y dibujar) solo cuando hace falta envolverlo.
+    """
+    texto = '' if valor is None else str(valor)
+    if stringWidth(texto, FUENTE_CUERPO, TAMANO_CUERPO) <= ancho - RELLENO_HORIZONTAL:
+        return texto
+    return Paragraph(escape(texto), ESTILO_CELDA)
+
+
+def tabla(encabezados, filas, anchos, envolver=(), total=None, color_encabezado=AZUL_CORPORATIVO):
+    """
+    Construye la tabla de un reporte y devuelve la lista de flowables.
+
+    - filas: iterable de listas de valores (texto o números ya formateados).
+    - envolver: índices de las columnas de texto libre que pueden necesitar
+      varias líneas (el resto se dibuja como texto simple).
+    - total: fila de totales opcional, resaltada al final.
+
+    La cebra se aplica con un solo ROWBACKGROUNDS y la tabla se divide en
+    LongTable de FILAS_POR_BLOQUE filas que repiten el encabezado.
+    """
+    envolver = [(i, anchos[i]) for i in envolver]
+    datos = []
+    for fila in filas:
+        fila = list(fila)
+        for i, ancho in envolver:
+            fila[i] = _celda(fila[i], ancho)
+        datos.append(fila)
+    if total is not None:
+        datos.append(list(total))
+
+    bloques = [datos[i:i + FILAS_POR_BLOQUE] for i in range(0, len(datos), FILAS_POR_BLOQUE)] or [[]]
+    flowables = []
+    for n, bloque in enumerate(bloques):
+        # Filas pares (contando desde 1 en todo el reporte) en gris
+        cebra = [colors.white, GRIS_CEBRA] if n * FILAS_POR_BLOQUE % 2 == 0 else [GRIS_CEBRA, colors.white]
+        comandos = [('BACKGROUND', (0,0), (-1,0), color_encabezado), *_COMANDOS_BASE,
+                    ('ROWBACKGROUNDS', (0,1), (-1,-1), cebra)]
+        if total is not None and n == len(bloques) - 1:
+            comandos.extend(_COMANDOS_TOTAL)
+        t = LongTable([list(encabezados)] + bloque, colWidths=anchos, repeatRows=1)
+        t.setStyle(TableStyle(comandos))
+        flowables.append(t)
+    return flowables
+
+
+# =================================================================
+# --- ENCABEZADO Y PIE DE PÁGINA ---
+# =================================================================
+
+@lru_cache(maxsize=None)
+def _bytes_logo(ruta):
+    """Lee el archivo del logo una sola vez por proceso (None si no existe o no es una imagen)."""
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        ImageReader(BytesIO(datos)).getSize()  # Verifica que se pueda decodificar
+        return datos
+    except Exception as e:
+        current_app.logger.error(f"Error al cargar el logo para PDF: {e}")
+        return None
+
+
+def _logo(ruta):
+    """
+    ImageReader propio de cada documento: ReportLab mueve la posición del
+    archivo al dibujar, así que no se comparte entre PDFs generados a la vez.
+    """
+    datos = _bytes_logo(ruta)
+    return ImageReader(BytesIO(datos)) if datos is not None else None
+
+
+class PlantillaReporte:
+    """
+    Encabezado y pie de página estándar de un reporte.
+    La parte fija (banner, logo, títulos, fecha de generación y pie) se dibuja
+    una sola vez por documento como form XObject; cada página solo referencia
+    ese form y escribe su número. Se usa como onFirstPage/onLaterPages.
+    """
+
+    def __init__(self, titulo, subtitulo, color=AZUL_CORPORATIVO):
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        self.color = color
+        self.nombre_form = f'Plantilla{id(self)}'
+
+    def _dibujar_fijo(self, canvas, width, height):
+        # 1. Banner superior sutil
+        canvas.setFillColorRGB(0.96, 0.97, 0.98) # Gris/Azulado muy claro de fondo
+        canvas.rect(0, height - (3.0*cm), width, (3.0*cm), fill=1, stroke=0)
+
+        # 2. Logo (leído del disco una vez por proceso)
+        logo = _logo(os.path.join(current_app.root_path, 'static', 'img', 'logo.jpg'))
+        if logo is not None:
+            canvas.drawImage(logo, -3.8*cm, height - 2.2*cm, height=1.8*cm, preserveAspectRatio=True, mask='auto')
+
+        # 3. Títulos
+        canvas.setFillColor(self.color)
+        canvas.setFont("Helvetica-Bold", 22)
+        canvas.drawString(4.0*cm, height - 1.5*cm, self.titulo)
+
+        canvas.setFillColor(colors.gray)
+        canvas.setFont("Helvetica", 12)
+        canvas.drawString(4.0*cm, height - 2.2*cm, self.subtitulo)
+
+        # 4. Fecha de generación (la misma en todas las páginas)
+        canvas.setFont("Helvetica", 9)
+        fecha_str = datetime.now().strftime('%d/%m/%Y %H:%M')
+        canvas.drawRightString(width - 2*cm, height - 2.2*cm, f"Generado: {fecha_str}")
+
+        # Línea decorativa
+        canvas.setStrokeColor(self.color)
+        canvas.setLineWidth(2)
+        canvas.line(0, height - 3.0*cm, width, height - 3.0*cm)
+
+        # Pie: línea separadora y texto
+        canvas.setLineWidth(1)
+        canvas.setStrokeColor(colors.lightgrey)
+        canvas.line(1.5*cm, 1.5*cm, width-1.5*cm, 1.5*cm)
+        canvas.setFont("Helvetica", 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(2*cm, 1*cm, "Sistema de Control de Pozos y Estaciones (SCPE)")
+
+    def __call__(self, canvas, doc):
+        width, height = doc.pagesize
+        dibujadas = canvas.__dict__.setdefault('_plantillas_dibujadas', set())
+        if self.nombre_form not in dibujadas:
+            canvas.beginForm(self.nombre_form, 0, 0, width, height)
+            self._dibujar_fijo(canvas, width, height)
+            canvas.endForm()
+            dibujadas.add(self.nombre_form)
+
+        canvas.saveState()
+        canvas.doForm(self.nombre_form)
+        # Número de página
+        canvas.setFont("Helvetica", 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(width - 2*cm, 1*cm, f"Página {canvas.getPageNumber()}")
+        canvas.restoreState()
+
+
+ENCABEZADO_GENERAL = PlantillaReporte("INVENTARIO GENERAL", "Estado actual del almacén")
+ENCABEZADO_INGRESOS = PlantillaReporte("REPORTE DE INGRESOS", "Historial de entradas al almacén")
+ENCABEZADO_SALIDAS = PlantillaReporte("REPORTE DE SALIDAS", "Historial de retiros por funcionario")
+ENCABEZADO_POR_ITEM = PlantillaReporte("SALIDAS POR PRODUCTO", "Detalle de movimientos por ítem")
+ENCABEZADO_POR_SUBALMACEN = PlantillaReporte("POR SUBALMACÉN", "Inventario valorado por ubicación")
+ENCABEZADO_HISTORIAL = PlantillaReporte("HISTORIAL DE MOVIMIENTOS", "Kardex completo de operaciones")
+ENCABEZADO_CRITICO = PlantillaReporte("REPORTE DE STOCK CRÍTICO", "Productos con existencia bajo el mínimo")
+
+
+def _contar(grupos):
+    """Total de filas de un reporte agrupado ({grupo: [filas]})."""
+    return sum(len(filas) for filas in grupos.values())
+
+
+def _construir(destino, story, encabezado, avance, total_filas, pagesize=landscape(A4), margen=2*cm):
+    """
+    Arma el documento e informa el avance por página generada (la lectura
+    previa de los datos cuenta como el primer 10%). Devuelve el total de páginas.
+    """
+    doc = SimpleDocTemplate(destino, pagesize=pagesize, leftMargin=margen, rightMargin=margen,
+                            topMargin=3.5*cm, bottomMargin=2.5*cm)
+    paginas = max(1, total_filas // FILAS_POR_PAGINA_APROX)
+
+    def progreso(tipo, valor):
+        if tipo == 'PAGE':
+            avance(0.1 + 0.9 * min(valor / paginas, 1.0))
+
+    doc.setProgressCallBack(progreso)
+    avance(0.1)
+    doc.build(story, onFirstPage=encabezado, onLaterPages=encabezado)
+    return doc.page
+
+
+# =================================================================
+# --- REPORTES ---
+# =================================================================
+
+@registrar('pdf_general', 'Reporte_General.pdf', artefacto=True)
+def pdf_general(destino, avance):
+    productos = Producto.query.order_by(Producto.id).all()
+    filas = [[
+        p.codigo,
+        p.nombre,
+        f"{p.cantidad:.1f}",
+        f"{p.precio:.0f}",
+        f"{p.total_value:.0f}",
+        p.subalmacen,
+        p.proveedor,
+    ] for p in productos]
+
+    Story = tabla(["Código", "Nombre", "Cant.", "Precio", "Total", "Subalm.", "Prov."], filas,
+                  [2.5*cm, 8*cm, 1.5*cm, 2*cm, 2*cm, 2.5*cm, 4*cm], envolver=(1, 6))
+    _construir(destino, Story, ENCABEZADO_GENERAL, avance, len(filas))
+
+
+@registrar('pdf_ingresos', 'Reporte_Ingresos.pdf', artefacto=True)
+def pdf_ingresos(destino, avance):
+    reporte = reportes.ingresos_por_producto()
+    totales = {r.producto_id: r for r in reportes.resumen_ingresos_por_producto()}
+
+    Story = []
+    for producto_id, lista_ingresos in reporte.items():
+        Story.append(Paragraph(f"Producto: {escape(lista_ingresos[0].producto_nombre)}", ESTILO_GRUPO))
+        filas = [[f"{ing.cantidad_agregada:.2f}", ing.fecha_ingreso.strftime('%Y-%m-%d %H:%M')] for ing in lista_ingresos]
+        total_prod = totales[producto_id].cantidad
+        Story.extend(tabla(["Cantidad", "Fecha Ingreso"], filas, [4*cm, 6*cm],
+                           total=[f"TOTAL: {total_prod:.2f}", ""]))
+        Story.append(Spacer(1, 0.5*cm))
+
+    _construir(destino, Story, ENCABEZADO_INGRESOS, avance, _contar(reporte) + 4 * len(reporte), pagesize=A4)
+
+
+@registrar('pdf_salidas', 'Reporte_Salidas.pdf', artefacto=True)
+def pdf_salidas(destino, avance):
+    reporte = reportes.salidas_por_funcionario()
+    # Los TOTAL BS salen de SUM(cantidad * precio) en la BD: exactos y iguales a los de pantalla
+    totales = {r.funcionario: r for r in reportes.resumen_salidas_por_funcionario()}
+
+    Story = []
+    for funcionario, lista_salidas in reporte.items():
+        Story.append(Paragraph(f"Funcionario: {escape(funcionario)}", ESTILO_GRUPO))
+        filas = []
+        for sal in lista_salidas:
+            total_linea = producto_exacto(sal.cantidad_salida, DECIMALES_CANTIDAD, sal.precio_en_bs, DECIMALES_PRECIO)
+            filas.append([
+                sal.producto_nombre,
+                f"{sal.cantidad_salida:.2f}",
+                sal.fecha_salida.strftime('%Y-%m-%d'),
+                f"{sal.precio_en_bs:.2f}",
+                f"{total_linea:.2f}"
+            ])
+        total_bs = totales[funcionario].valor
+        Story.extend(tabla(["Producto", "Cantidad", "Fecha", "Precio U.", "Total"], filas,
+                           [10*cm, 2.5*cm, 3*cm, 2.5*cm, 3*cm], envolver=(0,),
+                           total=["", "", "", "TOTAL BS:", f"{total_bs:.2f}"]))
+        Story.append(Spacer(1, 0.5*cm))
+
+    _construir(destino, Story, ENCABEZADO_SALIDAS, avance, _contar(reporte) + 4 * len(reporte))
+
+
+@registrar('pdf_por_item', 'Reporte_Por_Item.pdf', artefacto=True)
+def pdf_por_item(destino, avance):
+    reporte = reportes.salidas_por_producto()
+    totales = {r.producto_id: r for r in reportes.resumen_salidas_por_producto()}
+
+    Story = []
+    for producto_id, lista in reporte.items():
+        Story.append(Paragraph(f"Producto: {escape(lista[0].producto_nombre)}", ESTILO_GRUPO_COMPACTO))
+        filas = [[
+            s.nombre_funcionario,
+            f"{s.cantidad_salida:.2f}",
+            s.fecha_salida.strftime('%Y-%m-%d'),
+            f"{producto_exacto(s.cantidad_salida, DECIMALES_CANTIDAD, s.precio_en_bs, DECIMALES_PRECIO):.2f}"
+        ] for s in lista]
+        total_cant = totales[producto_id].cantidad
+        Story.extend(tabla(["Funcionario", "Cantidad", "Fecha", "Total"], filas,
+                           [8*cm, 3*cm, 4*cm, 4*cm], envolver=(0,),
+                           total=["TOTAL CANTIDAD:", f"{total_cant:.2f}", "", ""]))
+        Story.append(Spacer(1, 0.5*cm))
+
+    _construir(destino, Story, ENCABEZADO_POR_ITEM, avance, _contar(reporte) + 4 * len(reporte))
+
+
+@registrar('pdf_por_subalmacen', 'Reporte_Por_Subalmacen.pdf', artefacto=True)
+def pdf_por_subalmacen(destino, avance):
+    # Subalmacenes de app/exportacion.py (incluye 'ALMACEN CENTRAL')
+    reporte = reportes.productos_por_subalmacen()
+    totales = consultas.totales_por_subalmacen()
+
+    Story = []
+    for sub, lista in reporte.items():
+        if not lista: continue
+        Story.append(Paragraph(f"Subalmacén: {sub}", ESTILO_SUBTITULO))
+        filas = [[
+            p.codigo,
+            p.nombre,
+            f"{p.cantidad:.2f}",
+            f"{p.precio:.2f}",
+            f"{p.total_value:.2f}"
+        ] for p in lista]
+        total_val = totales.get(sub, 0.0)
+        Story.extend(tabla(["Código", "Nombre", "Cant.", "Precio", "Total"], filas,
+                           [3*cm, 10*cm, 3*cm, 3*cm, 4*cm], envolver=(1,),
+                           total=["", "", "", "TOTAL VALOR:", f"{total_val:.2f}"]))
+        Story.append(Spacer(1, 0.5*cm))
+
+    total_filas = _contar(reporte)
+    _construir(destino, Story, ENCABEZADO_POR_SUBALMACEN, avance, total_filas)
+
+
+def filas_historial(movimientos):
+    """Filas del PDF del kardex a partir de los movimientos (dicts de kardex.a_movimiento)."""
+    for m in movimientos:
+        yield [
+            m['fecha'].strftime('%d/%m/%y %H:%M'),
+            m['tipo'],
+            m['producto'],
+            str(m['cantidad']),
+            m['usuario_sistema'],
+            m['detalle'],
+        ]
+
+
+def documento_historial(destino, filas, avance):
+    """Arma el PDF del kardex con filas ya preparadas (ver filas_historial)."""
+    Story = tabla(["Fecha", "Tipo", "Producto", "Cant.", "Usuario", "Detalle"], filas,
+                  [3.5*cm, 2.5*cm, 8*cm, 2*cm, 5*cm, 6*cm], envolver=(2, 4, 5))
+    return _construir(destino, Story, ENCABEZADO_HISTORIAL, avance, len(filas), margen=1.5*cm)
+
+
+@registrar('pdf_historial', 'Historial_Completo.pdf', artefacto=True)
+def pdf_historial(destino, avance, filtros=None):
+    # 'filtros' son los parámetros de texto de la URL del historial
+    movs = kardex.iterar_movimientos(kardex.filtros_desde_args(filtros or {}))
+    documento_historial(destino, list(filas_historial(movs)), avance)
+
+
+@registrar('pdf_stock_critico', 'Alerta_Stock_Critico.pdf', artefacto=True)
+def pdf_stock_critico(destino, avance):
+    criticos = Producto.query.filter(Producto.en_alerta).order_by(Producto.id).all()
+
+    # Texto de advertencia
+    Story = [
+        Paragraph(f"¡ATENCIÓN! Se han detectado {len(criticos)} ítems por debajo del nivel requerido.", ESTILO_TEXTO),
+        Spacer(1, 0.5*cm),
+    ]
+
+    filas = [[
+        p.codigo,
+        p.nombre,
+        f"{p.cantidad:.2f}",
+        f"{p.stock_minimo:.2f}",
+        p.subalmacen
+    ] for p in criticos]
+
+    # Encabezado en rojo suave para indicar alerta
+    Story.extend(tabla(["Código", "Nombre", "Actual", "Mínimo", "Subalmacén"], filas,
+                       [3*cm, 8*cm, 2*cm, 2*cm, 3*cm], envolver=(1,), color_encabezado=ROJO_ALERTA))
+
+    _construir(destino, Story, ENCABEZADO_CRITICO, avance, len(filas), pagesize=A4)
@@ -0,0 +1,129 @@
+# app/respuestas.py
+# Optimización de las respuestas HTTP (enlaces lentos como el de POZO 57).
+# - Compresión de HTML, JSON y CSV según Accept-Encoding: brotli si
+#   el paquete 'brotli' está instalado (dependencia opcional), si no gzip.
+#   Las respuestas en flujo (exportación CSV) se comprimen bloque por bloque,
+#   sin juntarlas en memoria. Los archivos enviados con send_file (Excel, PDF,
+#   imágenes, static/) no se tocan.
+# - Caché del navegador para static/: las fotos de static/uploads/AAAA/MM/DD/
+#   tienen nombre único (marca de tiempo) y nunca cambian, así que se guardan
+#   un año sin revalidar (immutable). El resto (CSS, logo) se revalida con su
+#   ETag pasado STATIC_MAX_AGE segundos.
+# - ETag débil en las páginas HTML de reportes: si la página no cambió, el
+#   navegador recibe un 304 vacío en lugar de descargarla otra vez. Es débil
+#   porque la misma página comprimida o sin comprimir es equivalente.
+
+import gzip
+import re
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRIMIBLES = {'text/html', 'application/json', 'text/csv'}
+
+# Endpoints de las páginas de reportes (ETag débil y revalidación en cada visita)
+VISTAS_REPORTE = ('main.reporte_', 'main.historial', 'main.kardex_producto')
+
+_SUBIDA_FECHADA = re.compile(r'^uploads/\d{4}/\d{2}/\d{2}/')
+
+
+def _codificacion():
+    """'br', 'gzip' o None según lo que acepta el cliente."""
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def _comprimir(datos, codificacion, nivel):
+    if codificacion == 'br':
+        # Calidad de brotli 0-11: se escala el nivel de gzip (1-9)
+        return brotli.compress(datos, quality=min(11, nivel + 1))
+    return gzip.compress(datos, compresslevel=nivel)
+
+
+def _flujo_comprimido(partes, original, codificacion, nivel):
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=min(11, nivel + 1))
+        comprimir, terminar = compresor.process, compresor.finish
+    else:
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # Formato gzip
+        comprimir, terminar = compresor.compress, compresor.flush
+    try:
+        for parte in partes:
+            bloque = comprimir(parte)
+            if bloque:
+                yield bloque
+        yield terminar()
+    finally:
+        if hasattr(original, 'close'):
+            original.close()
+
+
+def _cache_static(respuesta, config):
+    archivo = (request.view_args or {}).get('filename', '')
+    respuesta.cache_control.public = True
+    if _SUBIDA_FECHADA.match(archivo):
+        respuesta.cache_control.max_age = config['UPLOADS_MAX_AGE']
+        respuesta.cache_control.immutable = True
+    else:
+        respuesta.cache_control.max_age = config['STATIC_MAX_AGE']
+    respuesta.cache_control.no_cache = None
+
+
+def _etag_reporte(respuesta):
+    # Se calcula sobre el HTML sin comprimir; make_conditional responde 304 si coincide
+    respuesta.add_etag(weak=True)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
+
+
+def _comprimir_respuesta(respuesta, config):
+    respuesta.vary.add('Accept-Encoding')
+    codificacion = _codificacion()
+    if codificacion is None:
+        return respuesta
+    nivel = config['COMPRESION_NIVEL']
+    if respuesta.is_streamed:
+        original = respuesta.response
+        respuesta.response = _flujo_comprimido(respuesta.iter_encoded(), original, codificacion, nivel)
+        respuesta.headers.pop('Content-Length', None)
+    else:
+        datos = respuesta.get_data()
+        if len(datos) < config['COMPRESION_MINIMA']:
+            return respuesta
+        respuesta.set_data(_comprimir(datos, codificacion, nivel))
+    respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+
+def optimizar(respuesta):
+    """after_request: caché del navegador, ETag de reportes y compresión."""
+    config = current_app.config
+    if request.endpoint == 'static':
+        # Un 404 (ej: miniatura todavía en proceso) no se guarda en la caché del navegador
+        if respuesta.status_code in (200, 304):
+            _cache_static(respuesta, config)
+        return respuesta
+
+    es_reporte = (request.endpoint or '').startswith(VISTAS_REPORTE)
+    if (es_reporte and request.method == 'GET' and respuesta.status_code == 200
+            and respuesta.mimetype == 'text/html' and not respuesta.is_streamed):
+        respuesta = _etag_reporte(respuesta)
+
+    if (respuesta.status_code == 200 and respuesta.mimetype in COMPRIMIBLES and not respuesta.direct_passthrough
+            and 'Content-Encoding' not in respuesta.headers and config['COMPRESION_ACTIVA']):
+        respuesta = _comprimir_respuesta(respuesta, config)
+    return respuesta
+
+
+def registrar(app):
+    app.after_request(optimizar)
@@ -10,9 +10,11 @@
 #    - Visualización de nombres de usuario en Historial
 # 5. Soporte para ALMACEN CENTRAL
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, abort, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, abort, current_app, jsonify
 from app import db
-from app.models import Producto, Usuario, Salida, Ingreso
+from app.models import Producto, Usuario, Salida, Ingreso, Tarea
+from app import consultas, kardex, exportacion, tareas, importacion, stock, salidas, reportes, cache, imagenes, busqueda as busqueda_fts
+from app.fechas import get_bolivia_time, bolivia_a_utc, a_utc, parse_fecha, parse_fecha_hora
 # Importamos todos los formularios necesarios
 from app.forms import (
     ProductoForm, 
@@ -26,220 +28,41 @@ from app.forms import (
 )
 from flask_login import current_user, login_user, logout_user, login_required
 from urllib.parse import urlparse
-import pandas as pd
-from io import BytesIO
 import os
-from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
-from collections import defaultdict
+from uuid import uuid4
 from wtforms.validators import DataRequired
 
-# --- IMPORTS DE REPORTLAB (Para generación de PDF profesional) ---
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-from reportlab.lib.pagesizes import A4, landscape
-
 bp = Blueprint('main', __name__)
 
-# --- AJUSTE DE ZONA HORARIA BOLIVIA (GMT-4) ---
-def get_bolivia_time(utc_dt):
-    """Convierte una fecha UTC a la hora de Bolivia (GMT-4)"""
-    if not utc_dt: return None
-    return utc_dt - timedelta(hours=4)
-
-
 # =================================================================
 # --- FUNCIÓN AUXILIAR PARA GUARDAR IMÁGENES ---
 # =================================================================
 def guardar_imagen(file_storage, subalmacen_actual):
     """
-    Guarda un archivo de imagen en una estructura de carpetas basada en fechas
-    y devuelve la ruta relativa para la base de datos.
+    Valida la imagen y la deja en cola para reducirla, recomprimirla y generar
+    sus miniaturas (app/imagenes.py). Devuelve la ruta relativa para la base
+    de datos (ej: 'uploads/2025/11/07/mi_imagen_130005_310087.webp').
     Requerimiento: Solo guarda si el subalmacen es 'POZO 57'.
     """
-    # 1. Validar que el archivo existe y el subalmacén es el correcto
+    # Validar que el archivo existe y el subalmacén es el correcto
     if not file_storage or subalmacen_actual != 'POZO 57':
         return None
 
     try:
-        # 2. Generar nombres y rutas basadas en la fecha actual
-        now = datetime.now()
-        year = now.strftime('%Y')
-        month = now.strftime('%m')
-        day = now.strftime('%d')
-        
-        original_filename = secure_filename(file_storage.filename)
-        filename_base, ext = os.path.splitext(original_filename)
-        
-        # Timestamp para unicidad
-        timestamp = now.strftime('%H%M%S_%f')
-        unique_filename = f"{filename_base}_{timestamp}{ext}"
-
-        # 3. Definir rutas
-        # Ruta relativa para la BD (ej: 'uploads/2025/11/07/mi_imagen.jpg')
-        relative_dir = os.path.join('uploads', year, month, day)
-        # Reemplazamos separadores de OS por '/' para compatibilidad web
-        relative_filepath = os.path.join(relative_dir, unique_filename).replace(os.path.sep, '/')
-        
-        # Ruta absoluta para guardar en el servidor
-        absolute_dir = os.path.join(current_app.root_path, 'static', relative_dir)
-        os.makedirs(absolute_dir, exist_ok=True) # Crea carpetas si no existen
-        
-        absolute_filepath = os.path.join(absolute_dir, unique_filename)
-        
-        # 4. Guardar el archivo físico
-        file_storage.save(absolute_filepath)
-        
-        current_app.logger.info(f"Imagen guardada en: {absolute_filepath}")
+        relative_filepath = imagenes.guardar(file_storage)
+        current_app.logger.info(f"Imagen en proceso: {relative_filepath}")
         return relative_filepath
 
+    except imagenes.ImagenInvalida as e:
+        flash(f'No se guardó la imagen: {str(e)}', 'warning')
+        return None
     except Exception as e:
         flash(f'Error crítico al guardar la imagen: {str(e)}', 'danger')
         current_app.logger.error(f"Error al guardar imagen: {e}")
         return None
 
 
-# =================================================================
-# --- FUNCIONES AUXILIARES Y ESTILOS PARA PDF (REPORTLAB) ---
-# =================================================================
-
-def get_professional_table_style():
-    """Retorna un estilo de tabla corporativo y limpio para los reportes"""
-    return TableStyle([
-        # Cabecera
-        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#00416A')), # Azul corporativo
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,0), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 10),
-        ('BOTTOMPADDING', (0,0), (-1,0), 10),
-        ('TOPPADDING', (0,0), (-1,0), 10),
-        
-        # Cuerpo
-        ('TEXTCOLOR', (0,1), (-1,-1), colors.black),
-        ('FONTNAME', (0,1), (-1,-1), 'Helvetica'),
-        ('FONTSIZE', (0,1), (-1,-1), 9),
-        ('ALIGN', (0,1), (0,-1), 'LEFT'), # Primera columna a la izquierda
-        ('ALIGN', (1,1), (-1,-1), 'RIGHT'), # Resto (números) a la derecha
-        ('BOTTOMPADDING', (0,1), (-1,-1), 8),
-        ('TOPPADDING', (0,1), (-1,-1), 8),
-        
-        # Líneas sutiles
-        ('LINEBELOW', (0,0), (-1,0), 1, colors.HexColor('#00416A')), # Debajo del header
-        ('LINEBELOW', (0,1), (-1,-2), 0.5, colors.HexColor('#E0E0E0')), # Entre filas
-        ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black), # Encima del total
-    ])
-
-def apply_zebra_striping(table, data):
-    """Aplica fondo alterno a las filas para mejorar lectura"""
-    for i in range(1, len(data)):
-        if i == len(data) - 1: # Fila de TOTALES
-            bg_color = colors.HexColor('#E8E8E8')
-            table.setStyle(TableStyle([
-                ('FONTNAME', (0,i), (-1,i), 'Helvetica-Bold'),
-                ('BACKGROUND', (0,i), (-1,i), bg_color),
-            ]))
-        elif i % 2 == 0:
-            bg_color = colors.HexColor('#F4F6F7')
-            table.setStyle(TableStyle([('BACKGROUND', (0,i), (-1,i), bg_color)]))
-
-
-def _draw_header(canvas, doc, title, subtitle):
-    """Dibuja el encabezado estándar en cada página del PDF"""
-    canvas.saveState()
-    width, height = doc.pagesize
-    
-    # 1. Banner superior sutil
-    canvas.setFillColorRGB(0.96, 0.97, 0.98) # Gris/Azulado muy claro de fondo
-    canvas.rect(0, height - (3.0*cm), width, (3.0*cm), fill=1, stroke=0)
-    
-    # 2. Intentar cargar el logo
-    logo_path = os.path.join(current_app.root_path, 'static', 'img', 'logo.jpg')
-    if os.path.exists(logo_path):
-        logo_height_cm = 1.8 * cm
-        logo_x_cm = -3.8 * cm
-        logo_y_cm = height - 2.2*cm
-        try:
-            canvas.drawImage(
-                logo_path, 
-                logo_x_cm, 
-                logo_y_cm, 
-                height=logo_height_cm, 
-                preserveAspectRatio=True, 
-                mask='auto'
-            )
-        except Exception as e:
-            current_app.logger.error(f"Error al dibujar imagen en PDF: {e}")
-    
-    # 3. Títulos
-    canvas.setFillColor(colors.HexColor('#00416A')) # Azul corporativo
-    canvas.setFont("Helvetica-Bold", 22)
-    canvas.drawString(4.0*cm, height - 1.5*cm, title)
-    
-    canvas.setFillColor(colors.gray)
-    canvas.setFont("Helvetica", 12)
-    canvas.drawString(4.0*cm, height - 2.2*cm, subtitle)
-    
-    # 4. Fecha de generación
-    canvas.setFont("Helvetica", 9)
-    fecha_str = datetime.now().strftime('%d/%m/%Y %H:%M')
-    canvas.drawRightString(width - 2*cm, height - 2.2*cm, f"Generado: {fecha_str}")
-    
-    # Línea decorativa azul
-    canvas.setStrokeColor(colors.HexColor('#00416A'))
-    canvas.setLineWidth(2)
-    canvas.line(0, height - 3.0*cm, width, height - 3.0*cm)
-    
-    canvas.restoreState()
-
-def _draw_footer(canvas, doc):
-    """Dibuja el pie de página estándar"""
-    canvas.saveState()
-    width, height = doc.pagesize
-    
-    # Línea separadora
-    canvas.setStrokeColor(colors.lightgrey)
-    canvas.line(1.5*cm, 1.5*cm, width-1.5*cm, 1.5*cm)
-    
-    # Textos
-    canvas.setFont("Helvetica", 8)
-    canvas.setFillColor(colors.grey)
-    canvas.drawString(2*cm, 1*cm, "Sistema de Control de Pozos y Estaciones (SCPE)")
-    
-    # Número de página
-    canvas.drawRightString(width - 2*cm, 1*cm, f"Página {canvas.getPageNumber()}")
-    canvas.restoreState()
-
-# Wrappers específicos para cada tipo de reporte (para facilitar la llamada en el build)
-def _header_footer_general(canvas, doc):
-    _draw_header(canvas, doc, "INVENTARIO GENERAL", "Estado actual del almacén")
-    _draw_footer(canvas, doc)
-
-def _header_footer_ingresos(canvas, doc):
-    _draw_header(canvas, doc, "REPORTE DE INGRESOS", "Historial de entradas al almacén")
-    _draw_footer(canvas, doc)
-
-def _header_footer_salidas(canvas, doc):
-    _draw_header(canvas, doc, "REPORTE DE SALIDAS", "Historial de retiros por funcionario")
-    _draw_footer(canvas, doc)
-
-def _header_footer_por_item(canvas, doc):
-    _draw_header(canvas, doc, "SALIDAS POR PRODUCTO", "Detalle de movimientos por ítem")
-    _draw_footer(canvas, doc)
-
-def _header_footer_por_subalmacen(canvas, doc):
-    _draw_header(canvas, doc, "POR SUBALMACÉN", "Inventario valorado por ubicación")
-    _draw_footer(canvas, doc)
-
-def _header_footer_historial(canvas, doc):
-    _draw_header(canvas, doc, "HISTORIAL DE MOVIMIENTOS", "Kardex completo de operaciones")
-    _draw_footer(canvas, doc)
-
-
 # =================================================================
 # --- RUTAS DE AUTENTICACIÓN ---
 # =================================================================
@@ -310,29 +133,94 @@ def register():
 @login_required
 def inventario():
     form = BusquedaForm()
-    productos = Producto.query.all()
-    busqueda = None
-    
+
+    # La búsqueda se envía por POST y se redirige a GET para que la URL
+    # (con búsqueda, orden y cursor) se pueda paginar y compartir.
     if form.validate_on_submit():
-        busqueda = form.busqueda.data
-        productos = Producto.query.filter(
-            (Producto.nombre.ilike(f'%{busqueda}%')) | 
-            (Producto.codigo.ilike(f'%{busqueda}%'))
-        ).all()
-        if not productos:
-            flash(f'No se encontraron productos para "{busqueda}".', 'info')
-    
-    alertas_stock = [p for p in productos if p.necesita_alerta()]
-    
+        return redirect(url_for('main.inventario', q=(form.busqueda.data or '').strip() or None))
+
+    busqueda = request.args.get('q', '').strip() or None
+    # Con búsqueda, por defecto se muestran primero los resultados más relevantes
+    orden = request.args.get('orden') or ('relevancia' if busqueda else 'codigo')
+    if orden not in consultas.COLUMNAS_ORDEN and not (orden == 'relevancia' and busqueda):
+        orden = 'codigo'
+    descendente = request.args.get('dir') == 'desc'
+    form.busqueda.data = busqueda
+
+    pagina = consultas.listar_productos(
+        busqueda=busqueda,
+        orden=orden,
+        descendente=descendente,
+        despues=request.args.get('despues'),
+        antes=request.args.get('antes'),
+        por_pagina=current_app.config['PRODUCTOS_POR_PAGINA']
+    )
+    if busqueda and not pagina.items:
+        flash(f'No se encontraron productos para "{busqueda}".', 'info')
+
     return render_template(
         'inventario.html', 
-        productos=productos, 
+        productos=pagina.items,
+        pagina=pagina,
+        total_productos=consultas.contar_productos(busqueda),
+        totales=consultas.totales_por_subalmacen(),
         form=form,
-        alertas=alertas_stock,
+        alertas=consultas.productos_en_alerta(limite=current_app.config['ALERTAS_EN_PANEL']),
+        total_alertas=consultas.contar_alertas(),
         busqueda=busqueda,
+        orden=orden,
+        descendente=descendente,
         current_user=current_user 
     )
 
+@bp.route('/api/productos/buscar')
+@login_required
+def api_buscar_productos():
+    """Autocompletado (buscador del inventario y selector de producto de salidas): JSON con los más relevantes."""
+    termino = request.args.get('q', '').strip()
+    if not termino:
+        return jsonify([])
+    limite = max(1, min(request.args.get('limite', 10, type=int) or 10, 50))
+    subalmacen = request.args.get('subalmacen', '').strip() or None
+    return jsonify([{
+        'id': p.id,
+        'codigo': p.codigo,
+        'nombre': p.nombre,
+        'subalmacen': p.subalmacen,
+        'cantidad': p.cantidad,
+        'unidad': p.unidad
+    } for p in busqueda_fts.sugerencias(termino, limite, subalmacen=subalmacen)])
+
+@bp.route('/api/productos/alertas')
+@login_required
+def api_cambios_alerta():
+    """
+    Productos cuya marca de stock crítico cambió después de ?desde= (ISO, UTC).
+    Sin 'desde' devuelve los que están en alerta ahora. 'hasta' es el 'desde'
+    de la próxima consulta; 'completo' es falso si quedaron cambios por leer.
+    """
+    desde_texto = request.args.get('desde', '').strip()
+    desde = parse_fecha_hora(desde_texto)
+    if desde_texto and desde is None:
+        return jsonify({'error': 'Fecha inválida (use AAAA-MM-DDTHH:MM:SS).'}), 400
+    limite = current_app.config['ALERTAS_CAMBIOS_MAXIMO']
+    productos = consultas.cambios_de_alerta(desde, limite)
+    hasta = max((p.alerta_cambio for p in productos if p.alerta_cambio), default=desde)
+    return jsonify({
+        'productos': [{
+            'id': p.id,
+            'codigo': p.codigo,
+            'nombre': p.nombre,
+            'subalmacen': p.subalmacen,
+            'cantidad': p.cantidad,
+            'stock_minimo': p.stock_minimo,
+            'en_alerta': bool(p.en_alerta),
+            'alerta_cambio': p.alerta_cambio.isoformat() if p.alerta_cambio else None,
+        } for p in productos],
+        'hasta': hasta.isoformat() if hasta else None,
+        'completo': len(productos) < limite,
+    })
+
 @bp.route('/agregar', methods=['GET', 'POST'])
 @bp.route('/editar/<int:producto_id>', methods=['GET', 'POST'])
 @login_required
@@ -350,10 +238,17 @@ def agregar_editar(producto_id=None):
                 # --- Lógica de EDICIÓN ---
                 cantidad_anterior = producto.cantidad
                 form.populate_obj(producto) 
+                cantidad_nueva = producto.cantidad
+
+                # El stock no se guarda con el resto de campos: se cambia con un UPDATE
+                # condicional, que falla si otro movimiento lo modificó mientras tanto
+                db.session.expire(producto, ['cantidad'])
+                if cantidad_nueva != cantidad_anterior:
+                    stock.fijar(producto.id, cantidad_anterior, cantidad_nueva)
                 
-                if producto.cantidad > cantidad_anterior:
+                if cantidad_nueva > cantidad_anterior:
                     # Registrar ingreso automático si aumenta el stock
-                    cantidad_agregada = producto.cantidad - cantidad_anterior
+                    cantidad_agregada = cantidad_nueva - cantidad_anterior
                     imagen_ingreso_path = guardar_imagen(form.imagen_ingreso.data, producto.subalmacen)
                     
                     # Registrar el ingreso con el usuario actual
@@ -422,24 +317,24 @@ def eliminar(producto_id):
 # --- GESTIÓN DE SALIDAS (Registrar, Editar, Eliminar) ---
 # =================================================================
 
+def _producto_seleccionado(form):
+    # Producto que muestra el buscador del formulario (el validado, o el de la salida que se edita)
+    producto = getattr(form, 'producto', None)
+    if producto is None and isinstance(form.producto_id.data, int):
+        producto = db.session.get(Producto, form.producto_id.data)
+    return producto
+
 @bp.route('/salida', methods=['GET', 'POST'])
 @login_required
 def salida():
     form = SalidaForm()
-    
-    # --- CORRECCIÓN: Cargar choices SIEMPRE para evitar error de validación ---
-    form.producto_id.choices = [(p.id, f'{p.nombre} ({p.subalmacen})') for p in Producto.query.all()]
 
     if form.validate_on_submit():
-        producto = Producto.query.get_or_404(form.producto_id.data)
-        
-        if producto.cantidad < form.cantidad_salida.data:
-            flash(f'Cantidad insuficiente en stock. Disponible: {producto.cantidad}', 'danger')
-            return redirect(url_for('main.salida'))
+        producto = form.producto  # Cargado al validar el id elegido en el buscador
 
         try:
-            # Restar del inventario
-            producto.cantidad -= form.cantidad_salida.data
+            # Restar del inventario (UPDATE atómico: falla si no alcanza el stock)
+            stock.descontar(producto.id, form.cantidad_salida.data)
             
             imagen_salida_path = guardar_imagen(form.imagen_salida.data, producto.subalmacen)
 
@@ -459,12 +354,17 @@ def salida():
             flash('Salida registrada con éxito.', 'success')
             return redirect(url_for('main.inventario'))
 
+        except stock.StockInsuficiente as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('main.salida'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error al procesar la salida: {str(e)}', 'danger')
             current_app.logger.error(f"Error en salida: {e}")
 
-    return render_template('salida.html', form=form, titulo="Registrar Salida")
+    return render_template('salida.html', form=form, titulo="Registrar Salida",
+                           producto_seleccionado=_producto_seleccionado(form))
 
 
 # --- RUTA: ELIMINAR SALIDA (CON DEVOLUCIÓN DE STOCK) ---
@@ -476,12 +376,10 @@ def eliminar_salida(salida_id):
         return redirect(url_for('main.reporte_salidas'))
     
     salida = Salida.query.get_or_404(salida_id)
-    producto = Producto.query.get(salida.producto_id)
     
     try:
         # IMPORTANTE: Devolver el stock al inventario antes de borrar
-        if producto:
-            producto.cantidad += salida.cantidad_salida
+        stock.reponer(salida.producto_id, salida.cantidad_salida)
             
         db.session.delete(salida)
         db.session.commit()
@@ -509,9 +407,6 @@ def editar_salida(salida_id):
     salida_obj = Salida.query.get_or_404(salida_id)
     form = SalidaForm(obj=salida_obj)
     
-    # Cargar lista de productos
-    form.producto_id.choices = [(p.id, f'{p.nombre} ({p.subalmacen})') for p in Producto.query.all()]
-    
     # Pre-seleccionar producto en modo GET
     if request.method == 'GET':
         form.producto_id.data = salida_obj.producto_id
@@ -519,30 +414,27 @@ def editar_salida(salida_id):
     if form.validate_on_submit():
         try:
             # 1. REVERTIR: Devolver el stock original como si la salida no hubiera ocurrido
-            prod_ant = Producto.query.get(salida_obj.producto_id)
-            if prod_ant:
-                prod_ant.cantidad += salida_obj.cantidad_salida
+            stock.reponer(salida_obj.producto_id, salida_obj.cantidad_salida)
             
-            # 2. VERIFICAR: ¿Hay stock suficiente para la NUEVA cantidad solicitada?
-            prod_nuevo = Producto.query.get(form.producto_id.data)
+            # 2. VERIFICAR Y APLICAR: Restar la nueva cantidad solo si hay stock suficiente
+            prod_nuevo = form.producto
+            try:
+                stock.descontar(prod_nuevo.id, form.cantidad_salida.data)
+            except stock.StockInsuficiente as e:
+                # El rollback deshace también la reversión del paso 1
+                db.session.rollback()
+                flash(f'Stock insuficiente para la nueva cantidad. Disponible: {e.disponible}', 'danger')
+                return render_template('salida.html', form=form, titulo="Editar Salida",
+                                       producto_seleccionado=_producto_seleccionado(form))
             
-            if prod_nuevo.cantidad < form.cantidad_salida.data:
-                # Si falla, deshacemos la reversión manualmente
-                prod_ant.cantidad -= salida_obj.cantidad_salida 
-                flash(f'Stock insuficiente para la nueva cantidad. Disponible: {prod_nuevo.cantidad}', 'danger')
-                return render_template('salida.html', form=form, titulo="Editar Salida")
-
-            # 3. APLICAR: Restar la nueva cantidad del inventario
-            prod_nuevo.cantidad -= form.cantidad_salida.data
-            
-            # 4. ACTUALIZACIÓN MANUAL DE CAMPOS (Evita error de FileStorage)
+            # 3. ACTUALIZACIÓN MANUAL DE CAMPOS (Evita error de FileStorage)
             salida_obj.producto_id = form.producto_id.data
             salida_obj.cantidad_salida = form.cantidad_salida.data
             salida_obj.nombre_funcionario = form.nombre_funcionario.data
             salida_obj.codigo_funcionario = form.codigo_funcionario.data
             salida_obj.precio_en_bs = prod_nuevo.precio # Actualizar precio si cambió el producto
             
-            # 5. MANEJO SEGURO DE LA IMAGEN
+            # 4. MANEJO SEGURO DE LA IMAGEN
             if form.imagen_salida.data:
                 nueva_imagen = guardar_imagen(form.imagen_salida.data, prod_nuevo.subalmacen)
                 if nueva_imagen:
@@ -559,67 +451,102 @@ def editar_salida(salida_id):
             db.session.rollback()
             flash(f'Error al actualizar el registro: {e}', 'danger')
 
-    return render_template('salida.html', form=form, titulo="Editar Salida")
+    return render_template('salida.html', form=form, titulo="Editar Salida",
+                           producto_seleccionado=_producto_seleccionado(form))
+
+
+# --- API: DOCUMENTO DE SALIDA DE VARIAS LÍNEAS (LISTA DE PICKING) ---
+# Registra todas las líneas en una sola transacción; si alguna falla no se
+# registra ninguna y la respuesta (422) indica el error de cada línea.
+@bp.route('/api/salidas', methods=['POST'])
+@login_required
+def api_registrar_salidas():
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'error': 'Se esperaba un objeto JSON.'}), 400
+    try:
+        documento = salidas.registrar_documento(datos, current_user.id,
+                                                max_lineas=current_app.config['SALIDAS_MAX_LINEAS'])
+        db.session.commit()
+    except salidas.DocumentoInvalido as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'errores': e.errores}), 422
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error en api_registrar_salidas: {e}")
+        return jsonify({'error': 'Error al registrar el documento de salida.'}), 500
+    return jsonify(salidas.documento_json(salidas.obtener_documento(documento.id))), 201
+
+@bp.route('/api/salidas/<int:documento_id>')
+@login_required
+def api_documento_salida(documento_id):
+    documento = salidas.obtener_documento(documento_id)
+    if documento is None:
+        abort(404)
+    return jsonify(salidas.documento_json(documento))
 
 
 # =================================================================
 # --- HISTORIAL DE MOVIMIENTOS (KARDEX) ---
 # =================================================================
 
-def obtener_movimientos():
-    """Función auxiliar para obtener y ordenar todos los movimientos (Kardex)"""
-    ingresos = Ingreso.query.all()
-    salidas = Salida.query.all()
-    movimientos = []
-    
-    def get_user_display(user_obj):
-        if user_obj:
-            role = "Admin" if user_obj.rol == 1 else "Empleado"
-            return f"{user_obj.username} ({role})"
-        else:
-            return "Sistema (Registro Histórico)"
-
-    # Procesar Ingresos
-    for i in ingresos:
-        movimientos.append({
-            'id': i.id,
-            'tipo_raw': 'ingreso',
-            'tipo': 'INGRESO',
-            'fecha': get_bolivia_time(i.fecha_ingreso),
-            'producto': i.producto.nombre,
-            'codigo': i.producto.codigo,
-            'cantidad': i.cantidad_agregada,
-            'usuario_sistema': get_user_display(i.usuario),
-            'detalle': 'Compra / Actualización de Stock',
-            'color': 'success',
-            'icono': 'fa-arrow-down'
-        })
-        
-    # Procesar Salidas
-    for s in salidas:
-        movimientos.append({
-            'id': s.id,
-            'tipo_raw': 'salida',
-            'tipo': 'SALIDA',
-            'fecha': get_bolivia_time(s.fecha_salida),
-            'producto': s.producto.nombre,
-            'codigo': s.producto.codigo,
-            'cantidad': s.cantidad_salida,
-            'usuario_sistema': get_user_display(s.usuario),
-            'detalle': f"Retirado por: {s.nombre_funcionario}",
-            'color': 'danger',
-            'icono': 'fa-arrow-up'
-        })
-    
-    # Ordenar por fecha descendente (lo más reciente primero)
-    movimientos.sort(key=lambda x: x['fecha'], reverse=True)
-    return movimientos
+# Parámetros de la URL que filtran el kardex (se propagan a las exportaciones)
+FILTROS_KARDEX = kardex.PARAMETROS_FILTRO
+
+def obtener_filtros_kardex():
+    """Lee los filtros del kardex desde la URL (fechas en hora de Bolivia)."""
+    args = {k: request.args.get(k, '').strip() for k in FILTROS_KARDEX}
+    args = {k: v for k, v in args.items() if v}
+    return kardex.filtros_desde_args(args), args
 
 @bp.route('/historial')
 @login_required
 def historial():
-    movimientos = obtener_movimientos()
-    return render_template('historial.html', movimientos=movimientos)
+    filtros, filtros_url = obtener_filtros_kardex()
+    pagina = kardex.pagina_movimientos(
+        filtros,
+        despues=request.args.get('despues'),
+        antes=request.args.get('antes'),
+        por_pagina=current_app.config['MOVIMIENTOS_POR_PAGINA']
+    )
+    usuarios = Usuario.query.order_by(Usuario.username).all()
+    return render_template('historial.html', movimientos=pagina.items, pagina=pagina,
+                           filtros=filtros_url, usuarios=usuarios)
+
+
+@bp.route('/kardex/<int:producto_id>')
+@login_required
+def kardex_producto(producto_id):
+    """Kardex de un producto con saldo corrido en un rango de fechas."""
+    producto = Producto.query.get_or_404(producto_id)
+    hoy = get_bolivia_time(datetime.utcnow())
+    desde = parse_fecha(request.args.get('desde')) or datetime(hoy.year, hoy.month, 1)
+    hasta = parse_fecha(request.args.get('hasta')) or datetime(hoy.year, hoy.month, hoy.day)
+
+    pagina, saldo_inicial = kardex.kardex_producto(
+        producto.id,
+        bolivia_a_utc(desde),
+        bolivia_a_utc(hasta + timedelta(days=1)),
+        despues=request.args.get('despues'),
+        por_pagina=current_app.config['MOVIMIENTOS_POR_PAGINA']
+    )
+    return render_template('kardex_producto.html', producto=producto, pagina=pagina,
+                           saldo_inicial=saldo_inicial, desde=desde, hasta=hasta)
+
+@bp.route('/reporte_valorado')
+@login_required
+def reporte_valorado():
+    """
+    Inventario valorado al cierre de una fecha, reconstruido desde los cortes del
+    kardex (generados por 'flask kardex-cortes', no en esta consulta).
+    """
+    if not current_user.is_admin(): return redirect(url_for('main.inventario'))
+    hoy = get_bolivia_time(datetime.utcnow())
+    fecha = parse_fecha(request.args.get('fecha')) or datetime(hoy.year, hoy.month, hoy.day)
+
+    resumen = kardex.inventario_valorado(bolivia_a_utc(fecha + timedelta(days=1)))
+    return render_template('reporte_valorado.html', resumen=resumen, fecha=fecha,
+                           total=sum(r['valor'] for r in resumen.values()))
 
 
 # --- EXPORTACIÓN DEL HISTORIAL ---
@@ -629,39 +556,12 @@ def historial():
 def exportar_historial_excel():
     if not current_user.is_admin(): return redirect(url_for('main.historial'))
     
-    movs = obtener_movimientos()
-    if not movs:
+    filtros, _ = obtener_filtros_kardex()
+    respuesta = exportacion.enviar_excel(exportacion.HISTORIAL, 'Historial_Completo.xlsx', filtros=filtros)
+    if respuesta is None:
         flash('Sin datos para exportar.', 'warning')
         return redirect(url_for('main.historial'))
-    
-    data = []
-    for m in movs:
-        data.append({
-            'Fecha y Hora (Bolivia)': m['fecha'].strftime('%d/%m/%Y %H:%M'),
-            'Tipo': m['tipo'],
-            'Código': m['codigo'],
-            'Producto': m['producto'],
-            'Cantidad': m['cantidad'],
-            'Registrado Por': m['usuario_sistema'],
-            'Detalle': m['detalle']
-        })
-    
-    df = pd.DataFrame(data)
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Historial_Kardex')
-    
-    # Ajustar ancho de columnas
-    worksheet = writer.sheets['Historial_Kardex']
-    worksheet.set_column('A:A', 20)
-    worksheet.set_column('B:B', 10)
-    worksheet.set_column('C:C', 15)
-    worksheet.set_column('D:D', 30)
-    worksheet.set_column('F:G', 25)
-    
-    writer.close()
-    output.seek(0)
-    return send_file(output, download_name='Historial_Completo.xlsx', as_attachment=True)
+    return respuesta
 
 
 @bp.route('/exportar/historial/pdf')
@@ -669,30 +569,46 @@ def exportar_historial_excel():
 def exportar_historial_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.historial'))
     
-    movs = obtener_movimientos()
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=1.5*cm, rightMargin=1.5*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    
-    data = [["Fecha", "Tipo", "Producto", "Cant.", "Usuario", "Detalle"]]
-    for m in movs:
-        data.append([
-            m['fecha'].strftime('%d/%m/%y %H:%M'),
-            m['tipo'],
-            Paragraph(m['producto'], getSampleStyleSheet()['Normal']),
-            str(m['cantidad']),
-            Paragraph(m['usuario_sistema'], getSampleStyleSheet()['Normal']),
-            Paragraph(m['detalle'], getSampleStyleSheet()['Normal'])
-        ])
-    
-    t = Table(data, colWidths=[3.5*cm, 2.5*cm, 8*cm, 2*cm, 5*cm, 6*cm])
-    t.setStyle(get_professional_table_style())
-    apply_zebra_striping(t, data)
-    Story.append(t)
-    
-    doc.build(Story, onFirstPage=_header_footer_historial, onLaterPages=_header_footer_historial)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Historial_Completo.pdf', mimetype='application/pdf', as_attachment=True)
+    _, filtros_url = obtener_filtros_kardex()
+    return _encolar_reporte('pdf_historial', filtros=filtros_url)
+
+
+# --- EXPORTACIÓN DE DATOS (CSV / PARQUET) ---
+# Pensadas para scripts que consumen el historial: admiten exportación
+# incremental con ?desde_id=N (ids mayores a N) o ?desde_ts=AAAA-MM-DDTHH:MM:SS
+# (movimientos posteriores a ese instante). El historial acepta además sus filtros.
+# 'desde_ts' sigue la misma regla en todos los reportes, como los demás filtros
+# de fecha: sin zona es hora de Bolivia; con zona ('Z', '+00:00') se convierte.
+# Las fechas de inventario, ingresos y salidas se exportan en UTC y las del
+# historial en hora de Bolivia: para reanudar desde la última fecha de un
+# archivo de los primeros se le agrega 'Z'.
+
+@bp.route('/exportar/<reporte>/<any(csv, parquet):formato>')
+@login_required
+def exportar_datos(reporte, formato):
+    if not current_user.is_admin(): return redirect(url_for('main.inventario'))
+    definicion = exportacion.REPORTES_DATOS.get(reporte)
+    if definicion is None:
+        abort(404)
+
+    filtros = {}
+    if reporte == 'historial':
+        filtros, _ = obtener_filtros_kardex()
+    else:
+        filtros['desde_id'] = request.args.get('desde_id', type=int)
+    desde_ts = request.args.get('desde_ts', '').strip()
+    filtros['desde_ts'] = a_utc(parse_fecha_hora(desde_ts))
+    if desde_ts and filtros['desde_ts'] is None:
+        flash('Fecha inválida para la exportación incremental (use AAAA-MM-DDTHH:MM:SS, hora de Bolivia, o agregue Z para UTC).', 'danger')
+        return redirect(url_for('main.inventario'))
+
+    nombre = f'{definicion.hoja}.{formato}'
+    if formato == 'csv':
+        return exportacion.enviar_csv(definicion, nombre, filtros)
+    if not exportacion.parquet_disponible():
+        flash('La exportación Parquet requiere el paquete pyarrow.', 'danger')
+        return redirect(url_for('main.inventario'))
+    return exportacion.enviar_parquet(definicion, nombre, filtros)
 
 
 # =================================================================
@@ -706,91 +622,34 @@ def exportar_excel():
         flash('Acceso denegado.', 'danger')
         return redirect(url_for('main.inventario'))
     try:
-        productos = Producto.query.all()
-        datos_exportar = [{
-            'Código': p.codigo,
-            'Nombre': p.nombre,
-            'Cantidad': p.cantidad,
-            'Precio': p.precio,
-            'Valor Total': p.total_value,
-            'Proveedor': p.proveedor,
-            'Fecha Ingreso': p.fecha_ingreso.strftime('%Y-%m-%d'),
-            'Stock Mínimo': p.stock_minimo,
-            'Subalmacén': p.subalmacen,
-            'Unidad': p.unidad,
-            'Diámetro': p.diametro or ''
-        } for p in productos]
-        
-        df = pd.DataFrame(datos_exportar)
-        output = BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter')
-        df.to_excel(writer, index=False, sheet_name='Inventario')
-        writer.close()
-        output.seek(0)
-        
-        return send_file(
-            output,
-            download_name='Reporte_Inventario.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True
-        )
+        respuesta = exportacion.enviar_excel(exportacion.INVENTARIO, 'Reporte_Inventario.xlsx')
     except Exception as e:
         flash(f'Error al generar Excel: {str(e)}', 'danger')
         return redirect(url_for('main.inventario'))
+    if respuesta is None:
+        flash('No hay productos para exportar.', 'warning')
+        return redirect(url_for('main.inventario'))
+    return respuesta
 
 @bp.route('/exportar/reporte_ingresos/excel')
 @login_required
 def exportar_reporte_ingresos_excel():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    ingresos = Ingreso.query.all()
-    if not ingresos:
+    respuesta = exportacion.enviar_excel(exportacion.INGRESOS, 'Reporte_Ingresos.xlsx')
+    if respuesta is None:
         flash('No hay ingresos para exportar.', 'warning')
         return redirect(url_for('main.inventario'))
-    
-    datos_exportar = [{
-        'Producto': i.producto.nombre,
-        'Código Producto': i.producto.codigo,
-        'Cantidad Agregada': i.cantidad_agregada,
-        'Fecha Ingreso': i.fecha_ingreso.strftime('%Y-%m-%d %H:%M:%S')
-    } for i in ingresos]
-    
-    df = pd.DataFrame(datos_exportar)
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Ingresos')
-    writer.close()
-    output.seek(0)
-    
-    return send_file(output, download_name='Reporte_Ingresos.xlsx', as_attachment=True)
+    return respuesta
 
 @bp.route('/exportar/reporte_salidas/excel')
 @login_required
 def exportar_reporte_salidas_excel():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    salidas = Salida.query.all()
-    if not salidas:
+    respuesta = exportacion.enviar_excel(exportacion.SALIDAS, 'Reporte_Salidas.xlsx')
+    if respuesta is None:
         flash('No hay salidas para exportar.', 'warning')
         return redirect(url_for('main.inventario'))
-    
-    datos_exportar = [{
-        'Funcionario': s.nombre_funcionario,
-        'Código Funcionario': s.codigo_funcionario,
-        'Producto': s.producto.nombre,
-        'Código Producto': s.producto.codigo,
-        'Cantidad Salida': s.cantidad_salida,
-        'Fecha Salida': s.fecha_salida.strftime('%Y-%m-%d'),
-        'Precio Bs.': s.precio_en_bs,
-        'Valor Total': s.cantidad_salida * s.precio_en_bs
-    } for s in salidas]
-    
-    df = pd.DataFrame(datos_exportar)
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Salidas')
-    writer.close()
-    output.seek(0)
-    
-    return send_file(output, download_name='Reporte_Salidas.xlsx', as_attachment=True)
+    return respuesta
 
 @bp.route('/exportar/reporte_por_item/excel')
 @login_required
@@ -801,288 +660,253 @@ def exportar_reporte_por_item_excel():
 @login_required
 def exportar_reporte_por_subalmacen_excel():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    datos_exportar = []
-    # ACTUALIZACIÓN: Agregado 'ALMACEN CENTRAL'
-    for sub in ['SCPE', 'POZO 57', 'ALMACEN CENTRAL']:
-        productos = Producto.query.filter_by(subalmacen=sub).all()
-        for p in productos:
-            datos_exportar.append({
-                'Subalmacén': sub,
-                'Código': p.codigo,
-                'Nombre': p.nombre,
-                'Cantidad': p.cantidad,
-                'Precio': p.precio,
-                'Valor Total': p.total_value
-            })
-    if not datos_exportar:
+    respuesta = exportacion.enviar_excel(exportacion.POR_SUBALMACEN, 'Reporte_Por_Subalmacen.xlsx')
+    if respuesta is None:
         flash('No hay datos para exportar.', 'warning')
         return redirect(url_for('main.inventario'))
-    
-    df = pd.DataFrame(datos_exportar)
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Por_Subalmacen')
-    writer.close()
-    output.seek(0)
-    
-    return send_file(output, download_name='Reporte_Por_Subalmacen.xlsx', as_attachment=True)
+    return respuesta
+
+# Los PDF se generan en segundo plano (app/reportes_pdf.py): la ruta solo
+# encola la tarea y redirige a la página que muestra su avance.
+
+def _encolar_reporte(tipo, **parametros):
+    tarea = tareas.enviar(tipo, parametros, usuario_id=current_user.id)
+    return redirect(url_for('main.ver_tarea', tarea_id=tarea.id))
 
 @bp.route('/exportar/pdf')
 @login_required
 def exportar_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    productos = Producto.query.all()
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    
-    data = [["Código", "Nombre", "Cant.", "Precio", "Total", "Subalm.", "Prov."]]
-    for p in productos:
-        data.append([
-            p.codigo, 
-            Paragraph(p.nombre, getSampleStyleSheet()['Normal']),
-            f"{p.cantidad:.1f}", 
-            f"{p.precio:.0f}", 
-            f"{p.total_value:.0f}", 
-            p.subalmacen, 
-            Paragraph(p.proveedor or '', getSampleStyleSheet()['Normal'])
-        ])
-    
-    t = Table(data, colWidths=[2.5*cm, 8*cm, 1.5*cm, 2*cm, 2*cm, 2.5*cm, 4*cm])
-    t.setStyle(get_professional_table_style())
-    apply_zebra_striping(t, data)
-    Story.append(t)
-    
-    doc.build(Story, onFirstPage=_header_footer_general, onLaterPages=_header_footer_general)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Reporte_General.pdf', mimetype='application/pdf', as_attachment=True)
+    return _encolar_reporte('pdf_general')
 
 @bp.route('/exportar/reporte_ingresos/pdf')
 @login_required
 def exportar_reporte_ingresos_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    ingresos = Ingreso.query.all()
-    if not ingresos:
+    if not db.session.query(Ingreso.id).first():
         flash('No hay ingresos para exportar.', 'warning')
         return redirect(url_for('main.inventario'))
-        
-    reporte = defaultdict(list)
-    for i in ingresos:
-        reporte[i.producto.nombre].append(i)
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    styles = getSampleStyleSheet()
-    style_grupo = ParagraphStyle(name='Grupo', parent=styles['h2'], fontName='Helvetica-Bold', fontSize=12, spaceAfter=6, spaceBefore=12)
-    
-    for producto, lista_ingresos in reporte.items():
-        Story.append(Paragraph(f"Producto: {producto}", style_grupo))
-        data = [["Cantidad", "Fecha Ingreso"]]
-        total_prod = 0
-        for ing in lista_ingresos:
-            data.append([f"{ing.cantidad_agregada:.2f}", ing.fecha_ingreso.strftime('%Y-%m-%d %H:%M')])
-            total_prod += ing.cantidad_agregada
-        data.append([f"TOTAL: {total_prod:.2f}", ""])
-        
-        t = Table(data, colWidths=[4*cm, 6*cm])
-        t.setStyle(get_professional_table_style())
-        apply_zebra_striping(t, data)
-        Story.append(t)
-        Story.append(Spacer(1, 0.5*cm))
-        
-    doc.build(Story, onFirstPage=_header_footer_ingresos, onLaterPages=_header_footer_ingresos)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Reporte_Ingresos.pdf', mimetype='application/pdf', as_attachment=True)
+    return _encolar_reporte('pdf_ingresos')
 
 @bp.route('/exportar/reporte_salidas/pdf')
 @login_required
 def exportar_reporte_salidas_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    salidas = Salida.query.all()
-    if not salidas:
+    if not db.session.query(Salida.id).first():
         flash('No hay salidas para exportar.', 'warning')
         return redirect(url_for('main.inventario'))
-        
-    reporte = defaultdict(list)
-    for s in salidas:
-        reporte[s.nombre_funcionario].append(s)
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    styles = getSampleStyleSheet()
-    style_grupo = ParagraphStyle(name='Grupo', parent=styles['h2'], fontName='Helvetica-Bold', fontSize=12, spaceAfter=6, spaceBefore=12)
-    
-    for funcionario, lista_salidas in reporte.items():
-        Story.append(Paragraph(f"Funcionario: {funcionario}", style_grupo))
-        data = [["Producto", "Cantidad", "Fecha", "Precio U.", "Total"]]
-        total_bs = 0
-        for sal in lista_salidas:
-            total_linea = sal.cantidad_salida * sal.precio_en_bs
-            data.append([
-                Paragraph(sal.producto.nombre, styles['Normal']), 
-                f"{sal.cantidad_salida:.2f}",
-                sal.fecha_salida.strftime('%Y-%m-%d'),
-                f"{sal.precio_en_bs:.2f}",
-                f"{total_linea:.2f}"
-            ])
-            total_bs += total_linea
-        data.append(["", "", "", "TOTAL BS:", f"{total_bs:.2f}"])
-        
-        t = Table(data, colWidths=[10*cm, 2.5*cm, 3*cm, 2.5*cm, 3*cm])
-        t.setStyle(get_professional_table_style())
-        apply_zebra_striping(t, data)
-        Story.append(t)
-        Story.append(Spacer(1, 0.5*cm))
-        
-    doc.build(Story, onFirstPage=_header_footer_salidas, onLaterPages=_header_footer_salidas)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Reporte_Salidas.pdf', mimetype='application/pdf', as_attachment=True)
+    return _encolar_reporte('pdf_salidas')
 
 @bp.route('/exportar/reporte_por_item/pdf')
 @login_required
 def exportar_reporte_por_item_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    salidas = Salida.query.all()
-    reporte = defaultdict(list)
-    for s in salidas:
-        reporte[s.producto.nombre].append(s)
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    styles = getSampleStyleSheet()
-    style_grupo = ParagraphStyle(name='Grupo', parent=styles['h2'], fontName='Helvetica-Bold', fontSize=12)
-    
-    for producto, lista in reporte.items():
-        Story.append(Paragraph(f"Producto: {producto}", style_grupo))
-        data = [["Funcionario", "Cantidad", "Fecha", "Total"]]
-        total_cant = 0
-        for s in lista: 
-            data.append([
-                s.nombre_funcionario, 
-                f"{s.cantidad_salida:.2f}", 
-                s.fecha_salida.strftime('%Y-%m-%d'), 
-                f"{(s.cantidad_salida * s.precio_en_bs):.2f}"
-            ])
-            total_cant += s.cantidad_salida
-        data.append(["TOTAL CANTIDAD:", f"{total_cant:.2f}", "", ""])
-        
-        t = Table(data, colWidths=[8*cm, 3*cm, 4*cm, 4*cm])
-        t.setStyle(get_professional_table_style())
-        apply_zebra_striping(t, data)
-        Story.append(t)
-        Story.append(Spacer(1, 0.5*cm))
-
-    doc.build(Story, onFirstPage=_header_footer_por_item, onLaterPages=_header_footer_por_item)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Reporte_Por_Item.pdf', mimetype='application/pdf', as_attachment=True)
+    return _encolar_reporte('pdf_por_item')
 
 @bp.route('/exportar/reporte_por_subalmacen/pdf')
 @login_required
 def exportar_reporte_por_subalmacen_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    # ACTUALIZACIÓN: Agregado 'ALMACEN CENTRAL'
-    reporte = {}
-    subalmacenes = ['SCPE', 'POZO 57', 'ALMACEN CENTRAL']
-    for sub in subalmacenes: 
-        reporte[sub] = Producto.query.filter_by(subalmacen=sub).all()
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    styles = getSampleStyleSheet()
-    
-    for sub, lista in reporte.items():
-        if not lista: continue
-        Story.append(Paragraph(f"Subalmacén: {sub}", styles['h3']))
-        data = [["Código", "Nombre", "Cant.", "Precio", "Total"]]
-        total_val = 0
-        for p in lista: 
-            data.append([
-                p.codigo, 
-                Paragraph(p.nombre, getSampleStyleSheet()['Normal']), 
-                f"{p.cantidad:.2f}", 
-                f"{p.precio:.2f}", 
-                f"{p.total_value:.2f}"
-            ])
-            total_val += p.total_value
-        data.append(["", "", "", "TOTAL VALOR:", f"{total_val:.2f}"])
-        
-        t = Table(data, colWidths=[3*cm, 10*cm, 3*cm, 3*cm, 4*cm])
-        t.setStyle(get_professional_table_style())
-        apply_zebra_striping(t, data)
-        Story.append(t)
-        Story.append(Spacer(1, 0.5*cm))
-        
-    doc.build(Story, onFirstPage=_header_footer_por_subalmacen, onLaterPages=_header_footer_por_subalmacen)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Reporte_Por_Subalmacen.pdf', mimetype='application/pdf', as_attachment=True)
+    return _encolar_reporte('pdf_por_subalmacen')
+
+
+# =================================================================
+# --- TAREAS EN SEGUNDO PLANO (ESTADO Y DESCARGA) ---
+# =================================================================
+
+def _tarea_o_404(tarea_id):
+    tarea = Tarea.query.get_or_404(tarea_id)
+    if not current_user.is_admin() and tarea.usuario_id != current_user.id:
+        abort(403)
+    return tarea
+
+@bp.route('/tareas/<int:tarea_id>')
+@login_required
+def ver_tarea(tarea_id):
+    tarea = _tarea_o_404(tarea_id)
+    return render_template('tarea.html', tarea=tarea, registro=tareas.registro(tarea.tipo))
+
+@bp.route('/api/tareas/<int:tarea_id>')
+@login_required
+def api_estado_tarea(tarea_id):
+    tarea = _tarea_o_404(tarea_id)
+    return jsonify({
+        'id': tarea.id,
+        'estado': tarea.estado,
+        'progreso': round(tarea.progreso * 100),
+        'mensaje': tarea.mensaje,
+        'descarga': url_for('main.descargar_tarea', tarea_id=tarea.id) if tarea.estado == 'terminada' else None,
+    })
+
+@bp.route('/tareas/<int:tarea_id>/descargar')
+@login_required
+def descargar_tarea(tarea_id):
+    tarea = _tarea_o_404(tarea_id)
+    ruta, nombre, mimetype = tareas.descarga(tarea)
+    if tarea.estado == 'terminada' and ruta and not os.path.exists(ruta):
+        # La caché de reportes descartó el archivo: se genera de nuevo con los datos actuales
+        nueva = tareas.regenerar(tarea, current_user.id)
+        if nueva is None:
+            abort(410)
+        flash('El archivo ya no estaba guardado; se está generando de nuevo.', 'info')
+        return redirect(url_for('main.ver_tarea', tarea_id=nueva.id))
+    if tarea.estado != 'terminada' or not ruta:
+        flash('El archivo todavía no está disponible.', 'warning')
+        return redirect(url_for('main.ver_tarea', tarea_id=tarea.id))
+    # El nombre del archivo identifica su contenido (en la caché de reportes, su hash): sirve de ETag
+    etag = os.path.splitext(os.path.basename(ruta))[0]
+    return send_file(ruta, download_name=nombre, mimetype=mimetype, as_attachment=True, etag=etag)
 
 
 # =================================================================
 # --- VISTAS HTML DE REPORTES ---
 # =================================================================
 
+# Las vistas de ingresos y salidas muestran un resumen por grupo (GROUP BY en la
+# BD, app/reportes.py); las líneas de cada grupo se ven en su página de detalle,
+# paginadas por cursor.
+
 @bp.route('/reporte_ingresos')
 @login_required
 def reporte_ingresos():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    reporte = defaultdict(list)
-    for i in Ingreso.query.all(): reporte[i.producto.nombre].append(i)
-    return render_template('reporte_ingresos.html', reporte=reporte)
+    return render_template('reporte_ingresos.html', resumen=reportes.resumen_ingresos_por_producto())
+
+@bp.route('/reporte_ingresos/<int:producto_id>')
+@login_required
+def reporte_ingresos_detalle(producto_id):
+    if not current_user.is_admin(): return redirect(url_for('main.inventario'))
+    return _detalle_reporte('ingresos', producto_id, 'main.reporte_ingresos', 'main.reporte_ingresos_detalle',
+                            {'producto_id': producto_id})
 
 @bp.route('/reporte_salidas')
 @login_required
 def reporte_salidas():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    reporte = defaultdict(list)
-    for s in Salida.query.all(): reporte[s.nombre_funcionario].append(s)
-    return render_template('reporte_salidas.html', reporte=reporte)
+    return render_template('reporte_salidas.html', resumen=reportes.resumen_salidas_por_funcionario())
+
+@bp.route('/reporte_salidas/detalle')
+@login_required
+def reporte_salidas_detalle():
+    if not current_user.is_admin(): return redirect(url_for('main.inventario'))
+    funcionario = request.args.get('funcionario', '')
+    return _detalle_reporte('salidas', funcionario, 'main.reporte_salidas', 'main.reporte_salidas_detalle',
+                            {'funcionario': funcionario})
 
 @bp.route('/reporte_por_item')
 @login_required
 def reporte_por_item():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    reporte = defaultdict(list)
-    for s in Salida.query.all(): reporte[s.producto.nombre].append(s)
-    return render_template('reporte_por_item.html', reporte=reporte)
+    return render_template('reporte_por_item.html', resumen=reportes.resumen_salidas_por_producto())
+
+@bp.route('/reporte_por_item/<int:producto_id>')
+@login_required
+def reporte_por_item_detalle(producto_id):
+    if not current_user.is_admin(): return redirect(url_for('main.inventario'))
+    return _detalle_reporte('por_item', producto_id, 'main.reporte_por_item', 'main.reporte_por_item_detalle',
+                            {'producto_id': producto_id})
+
+def _detalle_reporte(nombre, grupo, volver, endpoint, parametros):
+    """Página de detalle de un grupo: su fila de resumen y una página de líneas."""
+    agrupacion = reportes.AGRUPACIONES[nombre]
+    resumen = agrupacion.resumen(grupo)
+    if not resumen:
+        flash('No hay movimientos para el elemento seleccionado.', 'warning')
+        return redirect(url_for(volver))
+    pagina = agrupacion.lineas(
+        grupo,
+        despues=request.args.get('despues'),
+        antes=request.args.get('antes'),
+        por_pagina=current_app.config['LINEAS_REPORTE_POR_PAGINA']
+    )
+    return render_template('reporte_detalle.html', reporte=nombre, grupo=resumen[0], pagina=pagina,
+                           volver=volver, endpoint=endpoint, parametros=parametros)
+
+@bp.route('/api/reportes/<nombre>')
+@login_required
+def api_resumen_reporte(nombre):
+    """Resumen por grupo de un reporte (salidas, por_item, ingresos) en JSON."""
+    if not current_user.is_admin(): abort(403)
+    agrupacion = reportes.AGRUPACIONES.get(nombre)
+    if agrupacion is None:
+        abort(404)
+    return jsonify([reportes.fila_json(fila) for fila in agrupacion.resumen()])
+
+@bp.route('/api/reportes/<nombre>/lineas')
+@login_required
+def api_lineas_reporte(nombre):
+    """Líneas de un grupo (?grupo=funcionario o id de producto), paginadas con ?despues= / ?antes=."""
+    if not current_user.is_admin(): abort(403)
+    agrupacion = reportes.AGRUPACIONES.get(nombre)
+    if agrupacion is None:
+        abort(404)
+    grupo = request.args.get('grupo', type=int) if agrupacion.grupo_entero else request.args.get('grupo')
+    if grupo is None:
+        return jsonify({'error': 'Falta el parámetro grupo.'}), 400
+    limite = max(1, min(request.args.get('limite', current_app.config['LINEAS_REPORTE_POR_PAGINA'], type=int) or 1, 500))
+    pagina = agrupacion.lineas(grupo, despues=request.args.get('despues'), antes=request.args.get('antes'),
+                               por_pagina=limite)
+    return jsonify({
+        'lineas': [reportes.fila_json(fila) for fila in pagina],
+        'siguiente': pagina.siguiente,
+        'anterior': pagina.anterior,
+    })
+
+@bp.route('/api/cache')
+@login_required
+def api_estado_cache():
+    """Aciertos, fallos e invalidaciones de la caché de resúmenes de este proceso."""
+    if not current_user.is_admin(): abort(403)
+    actual = cache.actual()
+    return jsonify(actual.estadisticas() if actual else {'activa': False})
+
+# Ranking de productos (app/reportes.py): ?n=, ?por=cantidad|valor, ?desde= / ?hasta=
+# (fechas de Bolivia, 'hasta' inclusivo) y ?subalmacen=
 
 @bp.route('/reporte_top_productos_in')
 @login_required
 def reporte_top_productos_in():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    return render_template('reporte_top_productos.html', productos=Producto.query.order_by(Producto.cantidad.desc()).limit(10).all(), tipo='agregados')
+    return _reporte_ranking('ingresos', 'main.reporte_top_productos_in')
 
 @bp.route('/reporte_top_productos_out')
 @login_required
 def reporte_top_productos_out():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    from sqlalchemy import func
-    top_salidas = db.session.query(
-        Salida.producto_id,
-        func.sum(Salida.cantidad_salida).label('total_salida')
-    ).group_by(Salida.producto_id).order_by(func.sum(Salida.cantidad_salida).desc()).limit(10).all()
-    
-    productos = []
-    for salida in top_salidas:
-        producto = Producto.query.get(salida.producto_id)
-        if producto:
-            producto.total_salida = salida.total_salida
-            productos.append(producto)
-            
-    return render_template('reporte_top_productos.html', productos=productos, tipo='salidos')
+    return _reporte_ranking('salidas', 'main.reporte_top_productos_out')
+
+def _reporte_ranking(movimiento, endpoint):
+    maximo = current_app.config['RANKING_MAXIMO']
+    limite = max(1, min(request.args.get('n', current_app.config['RANKING_POR_DEFECTO'], type=int) or 1, maximo))
+    criterio = request.args.get('por', 'cantidad')
+    if criterio not in reportes.RANKING_CRITERIOS:
+        criterio = 'cantidad'
+    desde = parse_fecha(request.args.get('desde'))
+    hasta = parse_fecha(request.args.get('hasta'))
+    subalmacen = request.args.get('subalmacen') or None
+
+    productos = reportes.ranking(
+        movimiento, criterio, limite,
+        desde=bolivia_a_utc(desde),
+        hasta=bolivia_a_utc(hasta + timedelta(days=1)) if hasta else None,
+        subalmacen=subalmacen,
+    )
+    filtros = {
+        'n': limite, 'por': criterio, 'subalmacen': subalmacen or '',
+        'desde': desde.strftime('%Y-%m-%d') if desde else '',
+        'hasta': hasta.strftime('%Y-%m-%d') if hasta else '',
+    }
+    return render_template('reporte_top_productos.html', productos=productos, endpoint=endpoint,
+                           tipo='agregados' if movimiento == 'ingresos' else 'salidos',
+                           filtros=filtros, subalmacenes=exportacion.SUBALMACENES, maximo=maximo)
 
 @bp.route('/reporte_por_subalmacen')
 @login_required
 def reporte_por_subalmacen():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
-    reporte = {}
-    # ACTUALIZACIÓN: Agregado 'ALMACEN CENTRAL'
-    for sub in ['SCPE', 'POZO 57', 'ALMACEN CENTRAL']:
-        ps = Producto.query.filter_by(subalmacen=sub).all()
-        reporte[sub] = {'productos': ps, 'total_value': sum(p.total_value for p in ps)}
+    totales = consultas.totales_por_subalmacen()
+    reporte = {sub: {'productos': ps, 'total_value': totales.get(sub, 0.0)}
+               for sub, ps in reportes.productos_por_subalmacen().items()}
     return render_template('reporte_por_subalmacen.html', reporte=reporte)
 
 
@@ -1090,6 +914,9 @@ def reporte_por_subalmacen():
 # --- IMPORTACIÓN MASIVA ---
 # =================================================================
 
+# Errores de importación que se muestran en el mensaje (el resto se resume)
+MAX_ERRORES_FLASH = 20
+
 @bp.route('/importar/excel', methods=['GET', 'POST'])
 @login_required
 def importar_excel():
@@ -1097,44 +924,40 @@ def importar_excel():
     form = ImportForm()
     if form.validate_on_submit():
         file = form.file.data
-        if not file.filename.endswith('.xlsx'):
-            flash('El archivo debe ser un Excel (.xlsx).', 'danger')
+        nombre = file.filename.lower()
+        if not nombre.endswith(('.xlsx', '.csv')):
+            flash('El archivo debe ser un Excel (.xlsx) o un CSV (.csv).', 'danger')
             return redirect(request.url)
+        formato = 'csv' if nombre.endswith('.csv') else 'xlsx'
+
+        # Archivos grandes (y todo CSV): se guardan en disco y se importan por lotes en segundo plano
+        file.stream.seek(0, os.SEEK_END)
+        tamano = file.stream.tell()
+        file.stream.seek(0)
+        if formato == 'csv' or tamano > current_app.config['IMPORTACION_LIMITE_DIRECTA']:
+            origen = os.path.join(tareas.directorio(), f'subida_{uuid4().hex}.{formato}')
+            file.save(origen)
+            tarea = tareas.enviar('importacion', {
+                'origen': origen, 'formato': formato, 'usuario_id': current_user.id, 'modo': form.modo.data,
+            }, usuario_id=current_user.id)
+            return redirect(url_for('main.ver_tarea', tarea_id=tarea.id))
+
         try:
-            df = pd.read_excel(file)
-            productos_importados = 0
-            errores = []
-            for index, row in df.iterrows():
-                try:
-                    if pd.isna(row.get('Código')) or pd.isna(row.get('Nombre')): continue
-                    
-                    # Verificar duplicados
-                    if Producto.query.filter_by(codigo=str(row['Código']).strip()).first():
-                        errores.append(f"Fila {index+2}: Código '{row['Código']}' repetido.")
-                        continue
-                        
-                    nuevo_producto = Producto(
-                        codigo=str(row['Código']).strip(),
-                        nombre=str(row['Nombre']).strip(),
-                        cantidad=float(row['Cantidad']),
-                        precio=float(row['Precio']),
-                        proveedor=str(row.get('Proveedor', '')).strip(),
-                        stock_minimo=float(row.get('Stock Mínimo', 0.0)),
-                        subalmacen=str(row['Subalmacén']).strip(),
-                        unidad=str(row['Unidad']).strip(),
-                        diametro=str(row.get('Diámetro', '')).strip()
-                    )
-                    db.session.add(nuevo_producto)
-                    productos_importados += 1
-                    
-                except Exception as ex:
-                    errores.append(f"Fila {index+2}: {str(ex)}")
-            
-            db.session.commit()
-            flash(f'Importación completada. {productos_importados} productos importados.', 'success')
-            if errores:
+            df = importacion.leer_excel(file)
+            resultado = importacion.importar(df, current_user.id, modo=form.modo.data)
+            mensaje = f'Importación completada. {resultado.creados} productos importados.'
+            if resultado.actualizados:
+                mensaje += f' {resultado.actualizados} productos actualizados.'
+            flash(mensaje, 'success')
+            if resultado.errores:
+                errores = [f'Fila {fila}: {texto}' for fila, texto in resultado.errores[:MAX_ERRORES_FLASH]]
+                restantes = len(resultado.errores) - len(errores)
+                if restantes > 0:
+                    errores.append(f'y {restantes} errores más')
                 flash(f'Errores encontrados: {"; ".join(errores)}', 'warning')
-                
+
+        except importacion.ErrorImportacion as e:
+            flash(str(e), 'danger')
         except Exception as e:
             flash(f'Error al procesar el archivo: {str(e)}', 'danger')
             
@@ -1232,94 +1055,26 @@ def manage_users():
     return render_template('manage_users.html', form=form, users=users, edit_user=edit_user)
 # --- AGREGAR EN app/routes.py ---
 
-# 1. Definimos el encabezado específico para este reporte
-def _header_footer_critico(canvas, doc):
-    _draw_header(canvas, doc, "REPORTE DE STOCK CRÍTICO", "Productos con existencia bajo el mínimo")
-    _draw_footer(canvas, doc)
-
-# 2. Ruta para Excel
+# Ruta para Excel
 @bp.route('/exportar/stock_critico/excel')
 @login_required
 def exportar_stock_critico_excel():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
     
-    # Filtramos usando la lógica de tu modelo (Pythonic way)
-    todos = Producto.query.all()
-    criticos = [p for p in todos if p.necesita_alerta()]
-    
-    if not criticos:
+    # Filtra por la marca materializada Producto.en_alerta (índice parcial)
+    respuesta = exportacion.enviar_excel(exportacion.STOCK_CRITICO, 'Alerta_Stock_Critico.xlsx')
+    if respuesta is None:
         flash('Excelente noticia: No hay productos en stock crítico.', 'success')
         return redirect(url_for('main.inventario'))
-    
-    datos_exportar = [{
-        'Código': p.codigo,
-        'Nombre': p.nombre,
-        'Cantidad Actual': p.cantidad,
-        'Stock Mínimo': p.stock_minimo,
-        'Déficit': p.stock_minimo - p.cantidad, # Dato útil para compras
-        'Proveedor': p.proveedor,
-        'Subalmacén': p.subalmacen
-    } for p in criticos]
-    
-    df = pd.DataFrame(datos_exportar)
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Stock_Critico')
-    
-    # Ajuste cosmético de columnas
-    worksheet = writer.sheets['Stock_Critico']
-    worksheet.set_column('B:B', 30) # Columna Nombre más ancha
-    
-    writer.close()
-    output.seek(0)
-    
-    return send_file(output, download_name='Alerta_Stock_Critico.xlsx', as_attachment=True)
+    return respuesta
 
-# 3. Ruta para PDF
+# Ruta para PDF
 @bp.route('/exportar/stock_critico/pdf')
 @login_required
 def exportar_stock_critico_pdf():
     if not current_user.is_admin(): return redirect(url_for('main.inventario'))
     
-    todos = Producto.query.all()
-    criticos = [p for p in todos if p.necesita_alerta()]
-    
-    if not criticos:
+    if not consultas.contar_alertas():
         flash('No hay productos en riesgo para generar reporte.', 'info')
         return redirect(url_for('main.inventario'))
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=3.5*cm, bottomMargin=2.5*cm)
-    Story = []
-    
-    # Texto de advertencia
-    styles = getSampleStyleSheet()
-    Story.append(Paragraph(f"¡ATENCIÓN! Se han detectado {len(criticos)} ítems por debajo del nivel requerido.", styles['Normal']))
-    Story.append(Spacer(1, 0.5*cm))
-
-    data = [["Código", "Nombre", "Actual", "Mínimo", "Subalmacén"]]
-    for p in criticos:
-        data.append([
-            p.codigo,
-            Paragraph(p.nombre, styles['Normal']),
-            f"{p.cantidad:.2f}",
-            f"{p.stock_minimo:.2f}",
-            p.subalmacen
-        ])
-    
-    # Usamos tu estilo profesional, pero podríamos cambiar el color de fondo del header a rojo si quisiéramos ser dramáticos
-    t = Table(data, colWidths=[3*cm, 8*cm, 2*cm, 2*cm, 3*cm])
-    t.setStyle(get_professional_table_style())
-    
-    # Sobrescribimos el header a un color ROJO suave para indicar alerta
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#C0392B')), # Rojo Alerta
-        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-    ]))
-    
-    apply_zebra_striping(t, data)
-    Story.append(t)
-    
-    doc.build(Story, onFirstPage=_header_footer_critico, onLaterPages=_header_footer_critico)
-    buffer.seek(0)
-    return send_file(buffer, download_name='Alerta_Stock_Critico.pdf', mimetype='application/pdf', as_attachment=True)
\ No newline at end of file
+    return _encolar_reporte('pdf_stock_critico')
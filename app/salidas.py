@@ -0,0 +1,167 @@
+# app/salidas.py
+# Documentos de salida de varias líneas (lista de picking).
+# Todas las líneas se validan juntas: los productos y su stock se leen con una
+# sola consulta, las cantidades del mismo producto se suman y, si todo es
+# válido, el stock se descuenta con los UPDATE condicionales de app/stock.py.
+# O se registran todas las líneas o ninguna; los errores se informan por línea.
+
+import math
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import selectinload
+
+from app import db, stock
+from app.models import Producto, Salida, DocumentoSalida
+from app.tipos import VALOR_MAXIMO
+
+
+class DocumentoInvalido(Exception):
+    """El documento no se registró. 'errores' es una lista de {'linea', 'error'} (linea None = cabecera)."""
+
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__('El documento de salida tiene errores; no se registró ninguna línea.')
+
+
+def _texto(datos, campo, largo):
+    valor = datos.get(campo)
+    return str(valor).strip()[:largo] if valor is not None else ''
+
+
+def _numero(valor):
+    """Número finito o None (NaN e infinito no se pueden guardar en punto fijo)."""
+    if isinstance(valor, bool):
+        return None
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def _leer_lineas(lineas, max_lineas):
+    """Valida el formato de cada línea. Devuelve ([(n, producto_id, codigo, cantidad)], errores)."""
+    leidas, errores = [], []
+    if not isinstance(lineas, list) or not lineas:
+        return leidas, [{'linea': None, 'error': 'El documento no tiene líneas.'}]
+    if len(lineas) > max_lineas:
+        return leidas, [{'linea': None, 'error': f'El documento supera el máximo de {max_lineas} líneas.'}]
+
+    for n, linea in enumerate(lineas, start=1):
+        if not isinstance(linea, dict):
+            errores.append({'linea': n, 'error': 'Formato de línea inválido.'})
+            continue
+        producto_id = linea.get('producto_id')
+        codigo = _texto(linea, 'codigo', 50)
+        cantidad = _numero(linea.get('cantidad'))
+        if producto_id is None and not codigo:
+            errores.append({'linea': n, 'error': 'Indique producto_id o codigo.'})
+        elif producto_id is not None and (isinstance(producto_id, bool) or not isinstance(producto_id, int)):
+            errores.append({'linea': n, 'error': 'producto_id debe ser un número entero.'})
+        elif cantidad is None or cantidad <= 0:
+            errores.append({'linea': n, 'error': 'La cantidad debe ser un número mayor a 0.'})
+        elif cantidad > VALOR_MAXIMO:
+            errores.append({'linea': n, 'error': f'La cantidad no puede superar {VALOR_MAXIMO}.'})
+        else:
+            leidas.append((n, producto_id, codigo, cantidad))
+    return leidas, errores
+
+
+def _productos(leidas):
+    """Una sola consulta para todos los productos del documento (por id o por código)."""
+    ids = {producto_id for _, producto_id, _, _ in leidas if producto_id is not None}
+    codigos = {codigo for _, producto_id, codigo, _ in leidas if producto_id is None}
+    condiciones = []
+    if ids:
+        condiciones.append(Producto.id.in_(ids))
+    if codigos:
+        condiciones.append(Producto.codigo.in_(codigos))
+    filas = db.session.query(Producto.id, Producto.codigo, Producto.nombre, Producto.cantidad, Producto.precio) \
+        .filter(or_(*condiciones)).all()
+    return {f.id: f for f in filas}, {f.codigo: f for f in filas}
+
+
+def registrar_documento(datos, usuario_id, max_lineas=200):
+    """
+    Valida y registra un documento de salida:
+      {"nombre_funcionario", "codigo_funcionario", "observacion" (opcional),
+       "lineas": [{"producto_id" o "codigo", "cantidad"}, ...]}
+    Devuelve el DocumentoSalida (sin commit) o lanza DocumentoInvalido.
+    """
+    errores = []
+    nombre_funcionario = _texto(datos, 'nombre_funcionario', 100)
+    codigo_funcionario = _texto(datos, 'codigo_funcionario', 50)
+    if not nombre_funcionario:
+        errores.append({'linea': None, 'error': 'Falta el nombre del funcionario.'})
+    if not codigo_funcionario:
+        errores.append({'linea': None, 'error': 'Falta el código del funcionario.'})
+
+    leidas, errores_lineas = _leer_lineas(datos.get('lineas'), max_lineas)
+    errores.extend(errores_lineas)
+
+    # Producto de cada línea y cantidad total pedida por producto
+    por_id, por_codigo = _productos(leidas) if leidas else ({}, {})
+    lineas, pedido = [], {}
+    for n, producto_id, codigo, cantidad in leidas:
+        producto = por_id.get(producto_id) if producto_id is not None else por_codigo.get(codigo)
+        if producto is None:
+            errores.append({'linea': n, 'error': f"Producto no encontrado: {producto_id if producto_id is not None else codigo}."})
+            continue
+        lineas.append((n, producto, cantidad))
+        pedido[producto.id] = pedido.get(producto.id, 0.0) + cantidad
+
+    for n, producto, cantidad in lineas:
+        if pedido[producto.id] > (producto.cantidad or 0.0):
+            errores.append({'linea': n, 'error': f'Stock insuficiente de {producto.codigo}. '
+                                                 f'Disponible: {producto.cantidad}, pedido en el documento: {pedido[producto.id]}.'})
+    if errores:
+        raise DocumentoInvalido(sorted(errores, key=lambda e: e['linea'] or 0))
+
+    # Descuento atómico por producto: si otro movimiento ganó la carrera, falla esa línea
+    for producto_id, cantidad in pedido.items():
+        try:
+            stock.descontar(producto_id, cantidad)
+        except stock.StockInsuficiente as e:
+            raise DocumentoInvalido([
+                {'linea': n, 'error': f'Stock insuficiente de {producto.codigo}. Disponible: {e.disponible}.'}
+                for n, producto, _ in lineas if producto.id == producto_id
+            ])
+
+    documento = DocumentoSalida(nombre_funcionario=nombre_funcionario, codigo_funcionario=codigo_funcionario,
+                                observacion=_texto(datos, 'observacion', 255) or None, usuario_id=usuario_id)
+    db.session.add(documento)
+    db.session.flush()
+
+    # Líneas con un solo executemany (fecha actual: no afectan cortes del kardex ya cerrados)
+    db.session.execute(insert(Salida), [
+        {'producto_id': producto.id, 'cantidad_salida': cantidad, 'nombre_funcionario': nombre_funcionario,
+         'codigo_funcionario': codigo_funcionario, 'precio_en_bs': producto.precio, 'usuario_id': usuario_id,
+         'documento_id': documento.id}
+        for _, producto, cantidad in lineas
+    ])
+    return documento
+
+
+def obtener_documento(documento_id):
+    """Documento con sus líneas y productos cargados en dos consultas (no una por línea)."""
+    return DocumentoSalida.query.options(
+        selectinload(DocumentoSalida.lineas).joinedload(Salida.producto)
+    ).filter(DocumentoSalida.id == documento_id).first()
+
+
+def documento_json(documento):
+    return {
+        'id': documento.id,
+        'fecha': documento.fecha.isoformat() if documento.fecha else None,
+        'nombre_funcionario': documento.nombre_funcionario,
+        'codigo_funcionario': documento.codigo_funcionario,
+        'observacion': documento.observacion,
+        'lineas': [{
+            'salida_id': s.id,
+            'producto_id': s.producto_id,
+            'codigo': s.producto.codigo,
+            'nombre': s.producto.nombre,
+            'cantidad': s.cantidad_salida,
+            'precio_en_bs': s.precio_en_bs,
+        } for s in documento.lineas],
+    }
@@ -0,0 +1,156 @@
+# app/stock.py
+# Servicio de movimientos de stock.
+# Todo cambio de Producto.cantidad pasa por aquí como un UPDATE atómico en la
+# BD (cantidad = cantidad ± q), nunca como "leer en Python, calcular y
+# escribir": con varios almaceneros registrando salidas a la vez, la versión
+# leer-modificar-escribir pierde actualizaciones y puede dejar stock negativo.
+# El descuento es condicional (WHERE cantidad >= q) y se verifica la cantidad
+# de filas afectadas. En PostgreSQL el UPDATE bloquea la fila y vuelve a
+# evaluar la condición, así que no hace falta SELECT ... FOR UPDATE.
+# Las funciones no hacen commit: el cambio se confirma junto con el registro
+# (Salida / Ingreso) que lo origina.
+# Cada UPDATE de stock mantiene también la marca de alerta materializada
+# (Producto.en_alerta = cantidad <= stock_minimo) y la fecha de su último
+# cambio, así las alertas se leen con el índice parcial en lugar de comparar
+# columnas fila por fila. Los cambios hechos con el ORM (alta y edición de
+# productos) se recalculan al final del flush; los de otras sentencias
+# masivas, con actualizar_alertas().
+
+from datetime import datetime
+
+from sqlalchemy import update, bindparam, case, false, func, literal, event, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Producto
+
+
+class StockInsuficiente(Exception):
+    """No hay stock suficiente para descontar la cantidad pedida."""
+
+    def __init__(self, producto_id, disponible):
+        self.producto_id = producto_id
+        self.disponible = disponible
+        super().__init__(f'Cantidad insuficiente en stock. Disponible: {disponible}')
+
+
+class StockModificado(Exception):
+    """El stock cambió (otro movimiento) entre la lectura y la actualización."""
+
+    def __init__(self, producto_id, actual):
+        self.producto_id = producto_id
+        self.actual = actual
+        super().__init__(f'El stock del producto cambió mientras se editaba (actual: {actual}). Intente de nuevo.')
+
+
+def condicion_alerta(cantidad=Producto.cantidad, stock_minimo=Producto.stock_minimo):
+    """Expresión SQL de 'necesita alerta' (un stock mínimo vacío no genera alerta)."""
+    return func.coalesce(cantidad <= stock_minimo, false())
+
+
+def _valores_stock(nueva):
+    """
+    Valores del UPDATE que lleva el stock a 'nueva' (expresión SQL). En el lado
+    derecho de un UPDATE las columnas tienen su valor anterior: la fecha de
+    cambio solo avanza si la marca de alerta pasa de un estado al otro.
+    """
+    alerta = condicion_alerta(nueva)
+    return {
+        'cantidad': nueva,
+        'en_alerta': alerta,
+        'alerta_cambio': case((Producto.en_alerta == alerta, Producto.alerta_cambio), else_=datetime.utcnow()),
+    }
+
+
+def _ejecutar(sentencia):
+    # RETURNING: la nueva cantidad sin una consulta extra; 'fetch' actualiza el
+    # objeto Producto que ya esté cargado en la sesión con ese valor
+    return db.session.execute(
+        sentencia.returning(Producto.cantidad).execution_options(synchronize_session='fetch')
+    ).scalar()
+
+
+def disponible(producto_id):
+    return db.session.query(Producto.cantidad).filter(Producto.id == producto_id).scalar()
+
+
+def descontar(producto_id, cantidad):
+    """Resta 'cantidad' solo si alcanza el stock. Devuelve el nuevo stock o lanza StockInsuficiente."""
+    nueva = _ejecutar(
+        update(Producto)
+        .where(Producto.id == producto_id, Producto.cantidad >= cantidad)
+        .values(_valores_stock(Producto.cantidad - cantidad))
+    )
+    if nueva is None:
+        raise StockInsuficiente(producto_id, disponible(producto_id))
+    return nueva
+
+
+def reponer(producto_id, cantidad):
+    """Suma 'cantidad' al stock (ingreso o devolución). Devuelve el nuevo stock (None si el producto no existe)."""
+    return _ejecutar(
+        update(Producto)
+        .where(Producto.id == producto_id)
+        .values(_valores_stock(Producto.cantidad + cantidad))
+    )
+
+
+def fijar(producto_id, anterior, nueva):
+    """
+    Cambia el stock de 'anterior' a 'nueva' (edición manual del producto) solo si
+    nadie lo modificó desde que se leyó; si no, lanza StockModificado.
+    """
+    resultado = _ejecutar(
+        update(Producto)
+        .where(Producto.id == producto_id, Producto.cantidad == anterior)
+        .values(_valores_stock(literal(nueva, Producto.cantidad.type)))
+    )
+    if resultado is None:
+        raise StockModificado(producto_id, disponible(producto_id))
+    return resultado
+
+
+def sumar_lote(diferencias):
+    """
+    Aplica varias diferencias de stock [(producto_id, diferencia), ...] con un
+    solo executemany (importación masiva). Una diferencia negativa no verifica
+    el stock: la usa la importación para llevar el stock al valor del archivo.
+    """
+    if not diferencias:
+        return
+    tabla = Producto.__table__
+    db.session.execute(
+        update(tabla).where(tabla.c.id == bindparam('b_id'))
+        .values(_valores_stock(tabla.c.cantidad + bindparam('b_diferencia'))),
+        [{'b_id': producto_id, 'b_diferencia': diferencia} for producto_id, diferencia in diferencias],
+    )
+
+
+def actualizar_alertas(producto_ids, conexion=None):
+    """
+    Recalcula la marca de alerta de esos productos (alta o cambio de stock
+    mínimo fuera de este módulo). Solo toca las filas cuya marca cambió.
+    """
+    if not producto_ids:
+        return
+    alerta = condicion_alerta()
+    sentencia = update(Producto.__table__) \
+        .where(Producto.id.in_(producto_ids), or_(Producto.en_alerta.is_(None), Producto.en_alerta != alerta)) \
+        .values(en_alerta=alerta, alerta_cambio=datetime.utcnow())
+    (conexion or db.session).execute(sentencia)
+
+
+@event.listens_for(Session, 'after_flush')
+def _alertas_del_flush(session, flush_context):
+    # Productos creados con el ORM o con cantidad / stock mínimo editados en este flush
+    ids = [obj.id for obj in session.new if isinstance(obj, Producto)]
+    for obj in session.dirty:
+        if isinstance(obj, Producto) and session.is_modified(obj, include_collections=False):
+            estado = db.inspect(obj)
+            if any(estado.attrs[campo].history.has_changes() for campo in ('cantidad', 'stock_minimo')):
+                ids.append(obj.id)
+    if ids:
+        actualizar_alertas(ids, session.connection())
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, Producto) and obj.id in ids:
+                session.expire(obj, ['en_alerta', 'alerta_cambio'])
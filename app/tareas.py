@@ -0,0 +1,282 @@
+# app/tareas.py
+# Cola de trabajos en segundo plano (dentro del mismo proceso).
+# Los reportes pesados (PDF) ya no se generan en el hilo de la petición: se
+# registra una Tarea en la BD, un pool de hilos la ejecuta y el navegador
+# consulta su progreso hasta que el archivo está listo para descargar.
+# Las solicitudes idénticas (mismo tipo y parámetros) mientras una tarea sigue
+# activa se unen a esa tarea en lugar de generar el reporte otra vez.
+# Con varios procesos (gunicorn -w N) sobre la misma BD cada tarea guarda su
+# propietario (host:pid:token del proceso que la ejecuta) y un hilo de cada
+# proceso renueva el latido de sus tareas activas. Una tarea solo se da por
+# perdida (error) cuando su latido venció o su proceso ya no existe en este
+# host: el reinicio de un proceso no interrumpe las tareas de los demás.
+# Los tipos registrados con artefacto=True (reportes PDF) guardan su archivo en
+# la caché de reportes (app/artefactos.py): si los datos no cambiaron desde la
+# última vez, la tarea termina reutilizando ese archivo.
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app import db, artefactos
+from app.models import Tarea
+
+ESTADOS_ACTIVOS = ('pendiente', 'en_proceso')
+
+# El progreso se guarda en la BD solo cuando avanza al menos este paso
+PASO_PROGRESO = 0.02
+
+# Cómo se ejecuta y se presenta cada tipo de tarea
+Registro = namedtuple('Registro', 'funcion nombre_descarga mimetype titulo descarga_automatica artefacto')
+
+# tipo -> Registro
+_REGISTRO = {}
+
+# El token distingue este proceso de uno anterior con el mismo pid (ej: reinicio de un contenedor)
+_TOKEN = uuid.uuid4().hex[:8]
+
+
+def registrar(tipo, nombre_descarga, mimetype='application/pdf',
+              titulo='Generando reporte', descarga_automatica=True, artefacto=False):
+    """
+    Decorador que registra la función que genera el resultado de un tipo de tarea.
+    La función recibe (ruta_destino, avance, **parametros) y escribe el archivo;
+    si devuelve un texto, se guarda como mensaje de la tarea (ej: un resumen).
+    Con artefacto=True el resultado depende solo de los parámetros y de los
+    datos, y se reutiliza mientras estos no cambien.
+    """
+    def decorador(funcion):
+        _REGISTRO[tipo] = Registro(funcion, nombre_descarga, mimetype, titulo, descarga_automatica, artefacto)
+        return funcion
+    return decorador
+
+
+def registro(tipo):
+    return _REGISTRO[tipo]
+
+
+def directorio(app=None):
+    app = app or current_app
+    return app.config.get('TAREAS_DIRECTORIO') or os.path.join(app.instance_path, 'tareas')
+
+
+def iniciar(app):
+    """
+    Crea el pool de workers y el hilo de latidos. Las tareas activas de un
+    proceso que ya no existe se marcan como fallidas para no bloquear nuevas
+    solicitudes idénticas. Requiere contexto de aplicación.
+    """
+    app.extensions['tareas'] = ThreadPoolExecutor(
+        max_workers=app.config['TAREAS_WORKERS'], thread_name_prefix='tarea'
+    )
+    os.makedirs(directorio(app), exist_ok=True)
+    reclamar()
+    threading.Thread(target=_latidos, args=(app,), name='tarea-latido', daemon=True).start()
+
+
+# === --- Propietario y latido --- ===
+
+def propietario():
+    """Identificador del proceso actual: 'host:pid:token'."""
+    return f'{socket.gethostname()}:{os.getpid()}:{_TOKEN}'
+
+
+def proceso_vivo(dueno):
+    """False solo si el propietario es un proceso de este host que ya terminó."""
+    if not dueno:
+        return False
+    partes = dueno.split(':')
+    if len(partes) != 3 or partes[0] != socket.gethostname():
+        return True  # Otro host: solo cuenta su latido
+    if partes[2] == _TOKEN:
+        return True
+    try:
+        os.kill(int(partes[1]), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError, OSError):
+        pass  # Existe (de otro usuario) o no se puede saber
+    # Un pid reutilizado por otro proceso parece vivo: el latido vencido lo resuelve
+    return True
+
+
+def reclamar():
+    """
+    Marca como fallidas las tareas activas cuyo latido venció o cuyo proceso
+    ya no existe. Devuelve cuántas se marcaron.
+    """
+    vence = datetime.utcnow() - timedelta(seconds=current_app.config['TAREAS_LATIDO_VENCE'])
+    activas = db.session.query(Tarea.id, Tarea.propietario, Tarea.latido) \
+        .filter(Tarea.estado.in_(ESTADOS_ACTIVOS)).all()
+    reclamadas = 0
+    for id_, dueno, latido in activas:
+        if latido is not None and latido >= vence and proceso_vivo(dueno):
+            continue
+        # Condicionado al mismo latido: si el propietario late justo ahora, no se toca
+        resultado = db.session.execute(
+            update(Tarea).where(Tarea.id == id_, Tarea.estado.in_(ESTADOS_ACTIVOS),
+                                Tarea.latido == latido if latido is not None else Tarea.latido.is_(None))
+            .values(estado='error', mensaje='Interrumpida: el proceso que la ejecutaba se detuvo.',
+                    terminada_en=datetime.utcnow())
+        )
+        reclamadas += resultado.rowcount
+    db.session.commit()
+    return reclamadas
+
+
+def _latir(app):
+    """Renueva el latido de las tareas activas de este proceso y reclama las perdidas de otros."""
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(update(Tarea)
+                             .where(Tarea.propietario == propietario(), Tarea.estado.in_(ESTADOS_ACTIVOS))
+                             .values(latido=datetime.utcnow()))
+            reclamar()
+        finally:
+            db.session.remove()
+
+
+def _latidos(app):
+    while True:
+        time.sleep(app.config['TAREAS_LATIDO_SEGUNDOS'])
+        try:
+            _latir(app)
+        except Exception:
+            app.logger.exception('Error al renovar el latido de las tareas')
+
+
+def _clave(tipo, parametros):
+    crudo = json.dumps([tipo, parametros], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+
+def _activa(clave):
+    return Tarea.query.filter(Tarea.clave == clave, Tarea.estado.in_(ESTADOS_ACTIVOS)).first()
+
+
+def enviar(tipo, parametros=None, usuario_id=None):
+    """
+    Encola una tarea y devuelve su registro. Si ya hay una tarea activa con el
+    mismo tipo y parámetros, devuelve esa en lugar de crear otra.
+    """
+    if tipo not in _REGISTRO:
+        raise KeyError(f'Tipo de tarea desconocido: {tipo}')
+    parametros = parametros or {}
+    clave = _clave(tipo, parametros)
+
+    existente = _activa(clave)
+    if existente and reclamar():
+        # Alguna tarea activa era de un proceso detenido: se vuelve a buscar
+        existente = _activa(clave)
+    if existente:
+        return existente
+
+    limpiar()
+    tarea = Tarea(tipo=tipo, clave=clave, parametros=json.dumps(parametros), usuario_id=usuario_id,
+                  propietario=propietario(), latido=datetime.utcnow())
+    db.session.add(tarea)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otra solicitud idéntica se encoló entre la consulta y el INSERT (índice único parcial)
+        db.session.rollback()
+        return _activa(clave) or enviar(tipo, parametros, usuario_id)
+
+    app = current_app._get_current_object()
+    app.extensions['tareas'].submit(_ejecutar, app, tarea.id)
+    return tarea
+
+
+def limpiar():
+    """Borra las tareas terminadas más antiguas que la retención configurada (y sus archivos)."""
+    limite = datetime.utcnow() - timedelta(hours=current_app.config['TAREAS_RETENCION_HORAS'])
+    viejas = Tarea.query.filter(Tarea.creada_en < limite, Tarea.estado.notin_(ESTADOS_ACTIVOS)).all()
+    propios = os.path.abspath(directorio())
+    for tarea in viejas:
+        # Los archivos de la caché de reportes los descarta app/artefactos.py
+        if tarea.archivo and os.path.dirname(os.path.abspath(tarea.archivo)) == propios \
+                and os.path.exists(tarea.archivo):
+            os.remove(tarea.archivo)
+        db.session.delete(tarea)
+
+
+def _actualizar(tarea_id, **valores):
+    # Conexión propia: no interfiere con la sesión (ni los objetos) que usa el generador
+    with db.engine.begin() as conn:
+        conn.execute(update(Tarea).where(Tarea.id == tarea_id).values(**valores))
+
+
+class Avance:
+    """Función de progreso (0.0 a 1.0) que recibe cada generador de tareas."""
+
+    def __init__(self, tarea_id):
+        self.tarea_id = tarea_id
+        self.ultimo = 0.0
+
+    def __call__(self, fraccion):
+        # El 100% solo se informa al terminar de escribir el archivo
+        fraccion = max(0.0, min(fraccion, 0.99))
+        if fraccion - self.ultimo >= PASO_PROGRESO:
+            self.ultimo = fraccion
+            _actualizar(self.tarea_id, progreso=fraccion)
+
+
+def _ejecutar(app, tarea_id):
+    with app.app_context():
+        try:
+            tarea = db.session.get(Tarea, tarea_id)
+            registro = _REGISTRO[tarea.tipo]
+            funcion = registro.funcion
+            parametros = json.loads(tarea.parametros)
+            extension = os.path.splitext(registro.nombre_descarga)[1]
+            ruta = os.path.join(directorio(app), f'{tarea.id}_{tarea.clave[:16]}{extension}')
+            db.session.rollback()
+
+            _actualizar(tarea_id, estado='en_proceso')
+            if registro.artefacto:
+                # La versión y el reporte se leen en la misma transacción de lectura
+                clave_artefacto = artefactos.clave(tarea.tipo, parametros, artefactos.version_instantanea())
+                resumen = None
+                ruta = artefactos.buscar(clave_artefacto, extension) or artefactos.guardar(
+                    clave_artefacto, extension, lambda destino: funcion(destino, Avance(tarea_id), **parametros))
+            else:
+                resumen = funcion(ruta, Avance(tarea_id), **parametros)
+            _actualizar(tarea_id, estado='terminada', progreso=1.0, archivo=ruta, terminada_en=datetime.utcnow(),
+                        mensaje=resumen[:255] if isinstance(resumen, str) else None)
+        except Exception as e:
+            app.logger.exception(f'Error en la tarea {tarea_id}')
+            db.session.rollback()
+            _actualizar(tarea_id, estado='error', mensaje=str(e)[:255], terminada_en=datetime.utcnow())
+        finally:
+            db.session.remove()
+
+
+def descarga(tarea):
+    """(ruta, nombre de descarga, mimetype) del resultado de una tarea terminada."""
+    registro = _REGISTRO[tarea.tipo]
+    return tarea.archivo, registro.nombre_descarga, registro.mimetype
+
+
+def regenerar(tarea, usuario_id=None):
+    """
+    Tarea terminada cuyo archivo ya no existe: si era de la caché de reportes
+    (descartado por tamaño en app/artefactos.py) la vuelve a encolar con los
+    mismos parámetros y devuelve la nueva; si no, None.
+    """
+    if tarea.estado != 'terminada' or not tarea.archivo or os.path.exists(tarea.archivo):
+        return None
+    if not _REGISTRO[tarea.tipo].artefacto:
+        return None
+    return enviar(tarea.tipo, json.loads(tarea.parametros), usuario_id)
@@ -0,0 +1,93 @@
+# app/tipos.py
+# Números de punto fijo para cantidades y precios.
+# Se guardan como enteros (milésimas de unidad, centavos) en lugar de Float:
+# SUM(...) y SUM(cantidad * precio) en la BD son exactos y coinciden con los
+# totales de los PDF, sin la deriva acumulada de sumar flotantes.
+# En Python los valores siguen siendo float (formularios, pandas, plantillas);
+# la conversión a entero ocurre al escribir y al comparar en SQL, y la escala
+# del resultado de una expresión se deduce sola (precio * cantidad: 1e-5 Bs).
+# El redondeo al escalar es el del número escrito, con la mitad lejos de cero
+# (1.005 Bs -> 101 centavos, -0.125 -> -13), y es el mismo en la migración 3.
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger, Integer, Numeric
+from sqlalchemy.sql import operators
+from sqlalchemy.types import TypeDecorator
+
+DECIMALES_CANTIDAD = 3  # Milésimas de unidad (ej: 2.5 m de tubería)
+DECIMALES_PRECIO = 2    # Centavos de boliviano
+
+# Mayor cantidad o precio admitido: escalado (1e12 milésimas) entra en BIGINT y
+# un float lo representa exacto. Los formularios y la importación lo validan.
+VALOR_MAXIMO = 10 ** 9
+
+
+def escalar(valor, decimales):
+    """Entero valor * 10**decimales, redondeado sobre la representación decimal del float."""
+    # repr() da el decimal más corto que representa al float (1.005, no 1.00499999...)
+    return int(Decimal(repr(float(valor))).scaleb(decimales).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class Fijo(TypeDecorator):
+    """Número decimal guardado como entero escalado por 10**decimales."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def __init__(self, decimales):
+        super().__init__()
+        self.decimales = decimales
+        self.factor = 10 ** decimales
+
+    def process_bind_param(self, valor, dialect):
+        if valor is None:
+            return None
+        return escalar(valor, self.decimales)
+
+    def process_result_value(self, valor, dialect):
+        if valor is None:
+            return None
+        return valor / self.factor
+
+    def coerce_compared_value(self, op, valor):
+        # En "columna * 2" o "columna / 2" el literal es un número puro, sin escalar;
+        # en sumas, restas y comparaciones tiene la misma escala que la columna
+        if op in (operators.mul, operators.truediv):
+            return Integer() if isinstance(valor, int) else Numeric()
+        return self
+
+    class Comparator(TypeDecorator.Comparator):
+        def _adapt_expression(self, op, otro, **kw):
+            # Tipo (escala) del resultado de la operación en SQL:
+            #   cantidad ± cantidad, cantidad * 2, cantidad / 2 -> misma escala
+            #   precio * cantidad -> la suma de las escalas (centavos x milésimas = 1e-5)
+            tipo_otro = otro.type
+            if op in (operators.add, operators.sub) and isinstance(tipo_otro, Fijo):
+                if tipo_otro.decimales == self.type.decimales:
+                    return op, self.type
+            elif op is operators.mul:
+                if isinstance(tipo_otro, Fijo):
+                    return op, Fijo(self.type.decimales + tipo_otro.decimales)
+                return op, self.type
+            elif op is operators.truediv and not isinstance(tipo_otro, Fijo):
+                return op, self.type
+            return super()._adapt_expression(op, otro, **kw)
+
+    comparator_factory = Comparator
+
+
+def Cantidad():
+    return Fijo(DECIMALES_CANTIDAD)
+
+
+def Precio():
+    return Fijo(DECIMALES_PRECIO)
+
+
+def producto_exacto(a, decimales_a, b, decimales_b):
+    """a * b en Python con la misma aritmética entera de la BD (ej: precio * cantidad)."""
+    if a is None or b is None:
+        return 0.0
+    entero = escalar(a, decimales_a) * escalar(b, decimales_b)
+    return entero / 10 ** (decimales_a + decimales_b)
@@ -16,5 +16,71 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite (app/basedatos.py): PRAGMA aplicados a cada conexión. None = valor por defecto de SQLite
+    SQLITE_JOURNAL_MODE = 'WAL'          # Lectores y escritor en paralelo
+    SQLITE_SYNCHRONOUS = 'NORMAL'        # Seguro con WAL, menos fsync por commit
+    SQLITE_BUSY_TIMEOUT = 5000           # ms que espera un escritor si la BD está bloqueada
+    SQLITE_CACHE_SIZE = -65536           # Negativo = KiB (64 MB de caché de páginas)
+    SQLITE_MMAP_SIZE = 268435456         # 256 MB leídos por memoria mapeada
+    SQLITE_TEMP_STORE = 'MEMORY'         # Tablas temporales (ORDER BY / GROUP BY grandes) en memoria
+
+    # Pool de conexiones cuando DATABASE_URL apunta a PostgreSQL u otro servidor
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_PRE_PING = True              # Descarta conexiones cortadas por el servidor
+    DB_POOL_RECYCLE = 1800               # Segundos
+
     # Configuración personalizada
-    STOCK_MINIMO = 10
\ No newline at end of file
+    STOCK_MINIMO = 10
+
+    # Paginación de listados (inventario, kardex y detalle de reportes)
+    PRODUCTOS_POR_PAGINA = 50
+    ALERTAS_EN_PANEL = 20
+    ALERTAS_CAMBIOS_MAXIMO = 500  # Productos por respuesta de /api/productos/alertas
+    MOVIMIENTOS_POR_PAGINA = 100
+    LINEAS_REPORTE_POR_PAGINA = 50
+
+    # Ranking de productos (reportes Top): cantidad por defecto y máxima
+    RANKING_POR_DEFECTO = 10
+    RANKING_MAXIMO = 100
+
+    # Caché en memoria de resúmenes (totales, alertas, reportes; app/cache.py).
+    # Se invalida al confirmar cambios; el TTL limita lo que tarda en verse un
+    # cambio hecho por otro proceso. CACHE_RESUMENES_MAXIMO = 0 la desactiva
+    CACHE_RESUMENES_MAXIMO = 256  # Entradas
+    CACHE_RESUMENES_TTL = 300     # Segundos
+
+    # Periodicidad de los cortes de saldo del kardex: 'mensual' o 'diario'
+    KARDEX_PERIODO_CORTE = 'mensual'
+
+    # Tareas en segundo plano (reportes PDF): hilos de trabajo y retención de resultados
+    TAREAS_WORKERS = 2
+    TAREAS_RETENCION_HORAS = 24
+    TAREAS_DIRECTORIO = None  # Por defecto: instance/tareas
+    TAREAS_LATIDO_SEGUNDOS = 30   # Cada proceso marca así sus tareas activas como vivas
+    TAREAS_LATIDO_VENCE = 120     # Sin latido en este tiempo, la tarea se da por perdida
+
+    # Fotos de ingresos y salidas (app/imagenes.py): se reducen, se recomprimen
+    # (WebP) sin metadatos EXIF y se generan miniaturas en segundo plano
+    IMAGENES_WORKERS = 2                 # 0 = se procesan en la misma petición
+    IMAGENES_LADO_MAXIMO = 1600          # Píxeles del lado mayor de la imagen guardada
+    IMAGENES_MINIATURAS = (160, 640)     # Lados de las miniaturas (tablas y vista previa)
+    IMAGENES_CALIDAD = 80                # 1-100
+    IMAGENES_MAX_PIXELES = 50_000_000    # Rechaza imágenes más grandes (ej: 8000 x 6000 = 48 MP)
+
+    # Respuestas HTTP (app/respuestas.py): compresión gzip/brotli y caché del navegador
+    COMPRESION_ACTIVA = True
+    COMPRESION_MINIMA = 500        # Bytes; las respuestas más chicas se envían sin comprimir
+    COMPRESION_NIVEL = 6           # 1 (rápido) a 9 (más chico)
+    STATIC_MAX_AGE = 3600          # Segundos de caché de CSS y logo antes de revalidar
+    UPLOADS_MAX_AGE = 31536000     # Fotos de static/uploads/AAAA/MM/DD/ (nombre único): un año
+
+    # Caché en disco de reportes Excel y PDF (app/artefactos.py)
+    ARTEFACTOS_DIRECTORIO = None  # Por defecto: instance/artefactos
+    ARTEFACTOS_MAXIMO_MB = 500
+
+    # Máximo de líneas por documento de salida (API /api/salidas)
+    SALIDAS_MAX_LINEAS = 200
+
+    # Importación: los Excel más grandes que esto (bytes) y todos los CSV se importan en segundo plano
+    IMPORTACION_LIMITE_DIRECTA = 1024 * 1024
@@ -0,0 +1,85 @@
+# scripts/bench_pdf.py
+# Benchmark del PDF del historial (kardex): páginas por segundo.
+# Uso (desde la raíz del proyecto): python -m scripts.bench_pdf [filas] [filas_metodo_anterior]
+#   (por defecto 50000 filas, y 2000 para el método anterior)
+# Los movimientos son sintéticos (no se lee la BD), así se mide solo ReportLab.
+# El "método anterior" reproduce la tabla previa: getSampleStyleSheet() y
+# Paragraph en cada celda de texto y un setStyle por fila para la cebra.
+
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Table, TableStyle, Paragraph
+
+from app import create_app
+from app import reportes_pdf
+from config import Config
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    TAREAS_DIRECTORIO = tempfile.mkdtemp()
+
+
+def movimientos(cantidad):
+    inicio = datetime(2024, 1, 1)
+    for i in range(cantidad):
+        salida = i % 3 == 0
+        yield {
+            'fecha': inicio + timedelta(minutes=i),
+            'tipo': 'SALIDA' if salida else 'INGRESO',
+            'producto': f'TUBERÍA DE ACERO SIN COSTURA {i % 97} PULGADAS' + (' CON ROSCA Y CUPLA API 5L' if i % 5 == 0 else ''),
+            'cantidad': float(i % 50),
+            'usuario_sistema': 'admin (Admin)' if salida else 'empleado (Empleado)',
+            'detalle': f'Retirado por: Funcionario {i % 13}' if salida else 'Compra / Actualización de Stock',
+        }
+
+
+def sin_avance(fraccion):
+    pass
+
+
+def metodo_anterior(filas):
+    data = [["Fecha", "Tipo", "Producto", "Cant.", "Usuario", "Detalle"]]
+    for f in filas:
+        data.append([f[0], f[1],
+                     Paragraph(f[2], getSampleStyleSheet()['Normal']), f[3],
+                     Paragraph(f[4], getSampleStyleSheet()['Normal']),
+                     Paragraph(f[5], getSampleStyleSheet()['Normal'])])
+    t = Table(data, colWidths=[3.5*cm, 2.5*cm, 8*cm, 2*cm, 5*cm, 6*cm])
+    t.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), reportes_pdf.AZUL_CORPORATIVO), *reportes_pdf._COMANDOS_BASE]))
+    for i in range(1, len(data)):
+        if i % 2 == 0:
+            t.setStyle(TableStyle([('BACKGROUND', (0,i), (-1,i), colors.HexColor('#F4F6F7'))]))
+    return [t]
+
+
+def medir(nombre, filas, construir):
+    inicio = time.perf_counter()
+    paginas = construir(BytesIO(), filas)
+    segundos = time.perf_counter() - inicio
+    print(f"{nombre:<18} {len(filas):>7} filas  {paginas:>5} páginas  {segundos:7.2f} s  {paginas / segundos:7.1f} páginas/s")
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    muestra = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        filas = list(reportes_pdf.filas_historial(movimientos(total)))
+
+        medir('tabla actual', filas,
+              lambda destino, f: reportes_pdf.documento_historial(destino, f, sin_avance))
+        if muestra:
+            medir('método anterior', filas[:muestra],
+                  lambda destino, f: reportes_pdf._construir(destino, metodo_anterior(f), reportes_pdf.ENCABEZADO_HISTORIAL,
+                                                             sin_avance, len(f), margen=1.5*cm))
+            medir('tabla actual', filas[:muestra],
+                  lambda destino, f: reportes_pdf.documento_historial(destino, f, sin_avance))
@@ -0,0 +1,47 @@
+# tests/conftest.py
+# Fixtures comunes: cada aplicación de prueba usa su propia BD SQLite y sus
+# directorios de tareas, artefactos en un directorio temporal.
+
+import pytest
+
+from app import create_app, db, basedatos
+from config import Config
+
+
+@pytest.fixture(scope='session')
+def crear_app(tmp_path_factory):
+    """Fábrica de aplicaciones de prueba; los argumentos reemplazan valores de Config."""
+    def crear(**config):
+        directorio = tmp_path_factory.mktemp('app')
+
+        class PruebasConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{directorio / 'pruebas.db'}"
+            TAREAS_DIRECTORIO = str(directorio / 'tareas')
+            ARTEFACTOS_DIRECTORIO = str(directorio / 'artefactos')
+            IMAGENES_WORKERS = 0
+            WTF_CSRF_ENABLED = False
+            TESTING = True
+
+        for clave, valor in config.items():
+            setattr(PruebasConfig, clave, valor)
+        return create_app(PruebasConfig)
+    return crear
+
+
+@pytest.fixture
+def app(crear_app):
+    return crear_app()
+
+
+@pytest.fixture
+def contador_consultas():
+    """
+    Cuenta las sentencias SQL que ejecuta una aplicación dentro de un bloque:
+        with contador_consultas(app) as contador: ...
+        contador.total
+    """
+    def contador(aplicacion):
+        with aplicacion.app_context():
+            motor = db.engine
+        return basedatos.ContadorConsultas(motor)
+    return contador
@@ -0,0 +1,103 @@
+# tests/test_artefactos.py
+# Caché en disco de reportes (app/artefactos.py) y descarga de tareas: un
+# reporte sin cambios se reutiliza y responde 304 al ETag; un archivo
+# descartado por la caché se vuelve a generar.
+
+import os
+import time
+
+import pytest
+from sqlalchemy import insert
+
+from app import artefactos, db
+from app.models import Producto, Tarea, Usuario
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add_all([admin, Producto(codigo='P1', nombre='Codo', cantidad=10, precio=5,
+                                             subalmacen='SCPE', unidad='pza')])
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente
+
+
+def _archivos(app):
+    return sorted(os.listdir(app.config['ARTEFACTOS_DIRECTORIO']))
+
+
+def test_excel_reutilizado_y_304(app, cliente, monkeypatch):
+    escritos = []
+    original = artefactos.guardar
+    monkeypatch.setattr(artefactos, 'guardar', lambda *args: escritos.append(args[0]) or original(*args))
+
+    primera = cliente.get('/exportar/excel')
+    segunda = cliente.get('/exportar/excel')
+    assert primera.status_code == segunda.status_code == 200
+    assert primera.headers['ETag'] == segunda.headers['ETag']
+    assert primera.data == segunda.data
+    assert len(escritos) == 1 and len(_archivos(app)) == 1
+
+    etag = primera.headers['ETag']
+    revalidada = cliente.get('/exportar/excel', headers={'If-None-Match': etag})
+    assert revalidada.status_code == 304 and not revalidada.data
+
+    # Un cambio en los datos da otra versión: otro ETag y otro archivo
+    with app.app_context():
+        db.session.add(Producto(codigo='P2', nombre='Te', cantidad=1, precio=1, subalmacen='SCPE', unidad='pza'))
+        db.session.commit()
+    tercera = cliente.get('/exportar/excel', headers={'If-None-Match': etag})
+    assert tercera.status_code == 200 and tercera.headers['ETag'] != etag
+    assert len(escritos) == 2
+
+
+def test_version_instantanea(app):
+    with app.app_context():
+        version = artefactos.version_instantanea()
+        # Otro proceso confirma un producto nuevo mientras se genera el reporte
+        with db.engine.begin() as conexion:
+            conexion.execute(insert(Producto), {'codigo': 'X', 'nombre': 'X', 'subalmacen': 'SCPE', 'unidad': 'pza'})
+        assert Producto.query.count() == 0
+        assert artefactos.version() == version
+        db.session.rollback()
+        assert Producto.query.count() == 1
+
+
+def _esperar(app, tarea_id):
+    for _ in range(200):
+        with app.app_context():
+            tarea = db.session.get(Tarea, tarea_id)
+            if tarea.estado not in ('pendiente', 'en_proceso'):
+                return tarea
+        time.sleep(0.05)
+    raise AssertionError(f'La tarea {tarea_id} no terminó')
+
+
+def _tarea_de(respuesta):
+    assert respuesta.status_code == 302
+    return int(respuesta.headers['Location'].rstrip('/').split('/')[-1])
+
+
+def test_pdf_descartado_por_la_cache_se_regenera(app, cliente):
+    primera = _esperar(app, _tarea_de(cliente.get('/exportar/reporte_por_subalmacen/pdf')))
+    assert primera.estado == 'terminada'
+    descarga = cliente.get(f'/tareas/{primera.id}/descargar')
+    assert descarga.status_code == 200 and descarga.data.startswith(b'%PDF')
+
+    # Mismos datos: la segunda tarea usa el mismo artefacto
+    segunda = _esperar(app, _tarea_de(cliente.get('/exportar/reporte_por_subalmacen/pdf')))
+    assert segunda.id != primera.id and segunda.archivo == primera.archivo
+
+    # El recorte LRU borra el archivo: la descarga encola otra tarea en lugar de quedar colgada
+    with app.app_context():
+        artefactos.recortar(maximo=0)
+    assert not os.path.exists(primera.archivo)
+    tercera = _tarea_de(cliente.get(f'/tareas/{primera.id}/descargar'))
+    assert tercera not in (primera.id, segunda.id)
+    assert _esperar(app, tercera).estado == 'terminada'
+    descarga = cliente.get(f'/tareas/{tercera}/descargar')
+    assert descarga.status_code == 200 and descarga.data.startswith(b'%PDF')
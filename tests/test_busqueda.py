@@ -0,0 +1,69 @@
+# tests/test_busqueda.py
+# Autocompletado de productos (/api/productos/buscar) sobre el índice FTS5.
+
+import pytest
+from sqlalchemy import insert
+
+from app import db
+from app.busqueda import CANDIDATOS_AUTOCOMPLETADO
+from app.models import Producto, Usuario
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add(admin)
+        db.session.execute(insert(Producto), [
+            dict(codigo='TB-57-012', nombre='Tubo PVC 2"', subalmacen='SCPE', unidad='pza'),
+            dict(codigo='VL-100', nombre='Válvula de compuerta', subalmacen='SCPE', unidad='pza'),
+            dict(codigo='VL-200', nombre='Válvula check', subalmacen='ALMACEN', unidad='pza'),
+            dict(codigo='CO-001', nombre='Codo 90°', subalmacen='SCPE', unidad='pza'),
+        ])
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente
+
+
+def _codigos(cliente, **parametros):
+    respuesta = cliente.get('/api/productos/buscar', query_string=parametros)
+    assert respuesta.status_code == 200
+    return [p['codigo'] for p in respuesta.get_json()]
+
+
+def test_fragmento_de_codigo_por_trigramas(cliente):
+    assert _codigos(cliente, q='57-0') == ['TB-57-012']
+
+
+def test_prefijo_corto_sin_fts(cliente):
+    # Menos de 3 caracteres: prefijo de código o nombre, ordenado por código
+    assert _codigos(cliente, q='VL') == ['VL-100', 'VL-200']
+    assert _codigos(cliente, q='co') == ['CO-001']
+
+
+def test_acentos_y_mayusculas(cliente):
+    assert sorted(_codigos(cliente, q='VÁLVULA')) == ['VL-100', 'VL-200']
+    assert _codigos(cliente, q='90°') == ['CO-001']
+
+
+def test_filtro_de_subalmacen(cliente):
+    assert _codigos(cliente, q='válvula', subalmacen='ALMACEN', unidad='pza') == ['VL-200']
+
+
+@pytest.mark.parametrize('limite, esperados', [(-1, 1), (0, 2), (1, 1), (500, 2)])
+def test_limite_acotado(cliente, limite, esperados):
+    # 0 toma el valor por defecto; negativos no pueden pedir "sin límite"
+    assert len(_codigos(cliente, q='válvula', limite=limite)) == esperados
+
+
+def test_candidatos_por_relevancia(app, cliente):
+    # Más coincidencias que candidatos; la más relevante es la última en rowid
+    with app.app_context():
+        db.session.execute(insert(Producto), [
+            dict(codigo=f'X-{i:04d}', nombre=f'Accesorio galvanizado para instalación externa de riego y bombeo {i} tubo',
+                 subalmacen='SCPE', unidad='pza') for i in range(CANDIDATOS_AUTOCOMPLETADO + 100)
+        ] + [dict(codigo='TUBO-1', nombre='Tubo tubo', subalmacen='SCPE', unidad='pza')])
+        db.session.commit()
+    assert _codigos(cliente, q='tubo', limite=1) == ['TUBO-1']
@@ -0,0 +1,67 @@
+# tests/test_cache.py
+# Caché de resúmenes (app/cache.py): un resumen guardado se descarta cuando se
+# confirma una salida o una importación que escribe sus tablas.
+
+import pandas as pd
+import pytest
+from sqlalchemy import update
+
+from app import cache, consultas, db, importacion, reportes
+from app.models import Producto, Usuario
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add_all([admin, Producto(codigo='P1', nombre='Codo', cantidad=10, precio=5, stock_minimo=2,
+                                             subalmacen='SCPE', unidad='pza')])
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente
+
+
+def _resumenes():
+    return (
+        [(f.funcionario, f.cantidad) for f in reportes.resumen_salidas_por_funcionario()],
+        consultas.totales_por_subalmacen(),
+        consultas.contar_alertas(),
+    )
+
+
+def test_resumen_se_actualiza_despues_de_una_salida(app, cliente):
+    with app.app_context():
+        assert _resumenes() == ([], {'SCPE': 50.0}, 0)
+        assert _resumenes() == ([], {'SCPE': 50.0}, 0)
+        assert cache.actual().estadisticas()['aciertos'] == 3
+
+    respuesta = cliente.post('/salida', data={'producto_id': 1, 'cantidad_salida': 9,
+                                              'nombre_funcionario': 'Juan', 'codigo_funcionario': 'F1'})
+    assert respuesta.status_code == 302
+
+    with app.app_context():
+        assert _resumenes() == ([('Juan', 9.0)], {'SCPE': 5.0}, 1)
+
+
+def test_resumen_se_actualiza_despues_de_una_importacion(app, cliente):
+    with app.app_context():
+        assert _resumenes() == ([], {'SCPE': 50.0}, 0)
+        df = pd.DataFrame({'Código': ['P1', 'P2'], 'Nombre': ['Codo', 'Te'], 'Cantidad': [1, 4], 'Precio': [5, 2],
+                           'Subalmacén': ['SCPE', 'POZO 57'], 'Unidad': ['pza', 'pza'], 'Stock Mínimo': [None, 10]})
+        resultado = importacion.importar(df, usuario_id=1, modo='actualizar')
+        assert (resultado.creados, resultado.actualizados) == (1, 1)
+        assert _resumenes() == ([], {'SCPE': 5.0, 'POZO 57': 8.0}, 2)
+
+
+def test_escritura_fuera_de_la_sesion_no_invalida(app, cliente):
+    # Limitación documentada en app/cache.py: session.connection().execute no
+    # pasa por los eventos de la sesión y el resumen queda hasta el TTL
+    with app.app_context():
+        assert consultas.totales_por_subalmacen() == {'SCPE': 50.0}
+        db.session.connection().execute(update(Producto.__table__).values(cantidad=Producto.cantidad - 1))
+        db.session.commit()
+        assert consultas.totales_por_subalmacen() == {'SCPE': 50.0}
+        cache.actual().invalidar({'producto'})
+        assert consultas.totales_por_subalmacen() == {'SCPE': 45.0}
@@ -0,0 +1,111 @@
+# tests/test_consultas.py
+# Los reportes no hacen una consulta por fila (N+1): con 10 veces más datos
+# cada página HTML y cada PDF ejecuta la misma cantidad de sentencias SQL, y
+# nunca más de MAXIMO_CONSULTAS.
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app import db, kardex, tareas
+from app.models import Producto, Salida, Ingreso, Usuario
+
+MAXIMO_CONSULTAS = 10
+
+RUTAS = [
+    '/',
+    '/reporte_ingresos',
+    '/reporte_ingresos/1',
+    '/reporte_salidas',
+    '/reporte_salidas/detalle?funcionario=Funcionario+0',
+    '/reporte_por_item',
+    '/reporte_por_item/1',
+    '/api/reportes/salidas',
+    '/api/reportes/por_item/lineas?grupo=1',
+    '/reporte_top_productos_in',
+    '/reporte_top_productos_out',
+    '/reporte_top_productos_out?por=valor&n=5&subalmacen=SCPE&desde=2020-01-01&hasta=2100-01-01',
+    '/reporte_por_subalmacen',
+    '/reporte_valorado',
+    '/historial',
+]
+PDFS = ['pdf_general', 'pdf_ingresos', 'pdf_salidas', 'pdf_por_item', 'pdf_por_subalmacen', 'pdf_stock_critico']
+FACTORES = (1, 10)
+
+
+def cargar_datos(factor):
+    """Usuarios, productos y movimientos en proporción a 'factor'."""
+    admin = Usuario(username='admin', email='admin@example.com', rol=1)
+    admin.set_password('admin')
+    db.session.add(admin)
+    almaceneros = [Usuario(username=f'almacen{n}', email=f'almacen{n}@example.com', rol=2) for n in range(3)]
+    db.session.add_all(almaceneros)
+    db.session.flush()
+    usuarios = [admin.id] + [u.id for u in almaceneros]
+
+    subalmacenes = ['SCPE', 'POZO 57', 'ALMACEN CENTRAL']
+    # Con el ORM, como el alta de productos: el flush calcula la marca en_alerta
+    # (un tercio queda con stock crítico y aparece en alertas y reportes)
+    db.session.add_all([
+        Producto(codigo=f'P{n:05d}', nombre=f'Producto {n}', cantidad=1000.0, precio=1.5 + n % 7,
+                 stock_minimo=5.0 + n % 3 * 500, subalmacen=subalmacenes[n % 3], unidad='pza')
+        for n in range(20 * factor)
+    ])
+    db.session.flush()
+    productos = [p for p, in db.session.query(Producto.id)]
+    assert db.session.query(Producto).filter(Producto.en_alerta).count() == len(productos) // 3
+    inicio = datetime.utcnow() - timedelta(days=60)
+    db.session.execute(insert(Ingreso), [
+        {'producto_id': productos[n % len(productos)], 'cantidad_agregada': 10.0 + n % 5,
+         'fecha_ingreso': inicio + timedelta(hours=n), 'usuario_id': usuarios[n % len(usuarios)]}
+        for n in range(100 * factor)
+    ])
+    db.session.execute(insert(Salida), [
+        {'producto_id': productos[n % len(productos)], 'cantidad_salida': 1.0 + n % 3,
+         'nombre_funcionario': f'Funcionario {n % (5 * factor)}', 'codigo_funcionario': f'F{n % (5 * factor)}',
+         'precio_en_bs': 2.25, 'fecha_salida': inicio + timedelta(hours=n, minutes=30),
+         'usuario_id': usuarios[n % len(usuarios)]}
+        for n in range(200 * factor)
+    ])
+    db.session.commit()
+    # Cortes del kardex al día, como los deja 'flask kardex-cortes'
+    kardex.generar_cortes()
+
+
+@pytest.fixture(scope='module')
+def apps(crear_app):
+    """{factor: (app, cliente con sesión de administrador)}."""
+    resultado = {}
+    for factor in FACTORES:
+        # Se mide el costo real de cada reporte, sin la caché de resúmenes
+        app = crear_app(CACHE_RESUMENES_MAXIMO=0)
+        with app.app_context():
+            cargar_datos(factor)
+        cliente = app.test_client()
+        cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+        resultado[factor] = (app, cliente)
+    return resultado
+
+
+@pytest.mark.parametrize('ruta', RUTAS)
+def test_consultas_de_pagina_constantes(apps, contador_consultas, ruta):
+    conteo = {}
+    for factor, (app, cliente) in apps.items():
+        with contador_consultas(app) as contador:
+            respuesta = cliente.get(ruta)
+        assert respuesta.status_code == 200
+        conteo[factor] = contador.total
+    assert max(conteo.values()) <= MAXIMO_CONSULTAS, conteo
+    assert len(set(conteo.values())) == 1, f'Las consultas crecen con los datos: {conteo}'
+
+
+@pytest.mark.parametrize('tipo', PDFS)
+def test_consultas_de_pdf_constantes(apps, contador_consultas, tmp_path, tipo):
+    conteo = {}
+    for factor, (app, _) in apps.items():
+        with app.app_context(), contador_consultas(app) as contador:
+            tareas.registro(tipo).funcion(str(tmp_path / f'{tipo}_{factor}.pdf'), lambda valor: None)
+        conteo[factor] = contador.total
+    assert max(conteo.values()) <= MAXIMO_CONSULTAS, conteo
+    assert len(set(conteo.values())) == 1, f'Las consultas crecen con los datos: {conteo}'
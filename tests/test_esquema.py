@@ -0,0 +1,145 @@
+# tests/test_esquema.py
+# Migraciones y planes de las consultas de reportes y kardex (app/esquema.py).
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, inspect, text
+
+from app import db, esquema, stock
+from app.models import Producto, Salida, Ingreso, Usuario
+
+
+@pytest.fixture
+def app_con_datos(app):
+    """Movimientos de varios usuarios, funcionarios y productos, con estadísticas (ANALYZE)."""
+    with app.app_context():
+        usuarios = [Usuario(username=f'usuario{n}', email=f'usuario{n}@example.com', rol=2) for n in range(20)]
+        productos = [Producto(codigo=f'P{n:04d}', nombre=f'Producto {n}', cantidad=100, precio=2,
+                              stock_minimo=n % 10 * 20, subalmacen=['SCPE', 'POZO 57'][n % 2], unidad='pza')
+                     for n in range(200)]
+        db.session.add_all(usuarios + productos)
+        db.session.flush()
+        inicio = datetime.utcnow() - timedelta(days=90)
+        for n in range(2000):
+            fecha = inicio + timedelta(hours=n)
+            db.session.add(Salida(producto_id=productos[n % 200].id, cantidad_salida=1, precio_en_bs=2,
+                                  nombre_funcionario=f'Funcionario {n % 40}', codigo_funcionario=f'F{n % 40}',
+                                  fecha_salida=fecha, usuario_id=usuarios[n % 20].id))
+            db.session.add(Ingreso(producto_id=productos[n % 200].id, cantidad_agregada=1,
+                                   fecha_ingreso=fecha, usuario_id=usuarios[n % 20].id))
+        db.session.commit()
+        with db.engine.begin() as conexion:
+            conexion.execute(text('ANALYZE'))
+    return app
+
+
+def test_consultas_vigiladas_usan_indices(app_con_datos):
+    with app_con_datos.app_context():
+        resultados = esquema.verificar_planes()
+    assert len(resultados) == len(esquema._consultas_vigiladas())
+    assert all(lineas for _, lineas, _ in resultados)
+    fallas = {nombre: lineas for nombre, lineas, recorridos in resultados if recorridos}
+    assert not fallas, f'Consultas que recorren tablas completas: {fallas}'
+
+
+def test_solo_search_o_recorridos_permitidos():
+    cubriente = 'SCAN salida USING COVERING INDEX ix_salida_fecha'
+    lineas = [
+        'SEARCH salida USING INDEX ix_salida_fecha (fecha_salida>?)',
+        'SCAN salida USING INDEX ix_salida_fecha',
+        cubriente,
+        'SCAN producto',
+        'SCAN usuario USING COVERING INDEX ix_usuario_username LEFT-JOIN',
+        'SCAN totales',
+        'USE TEMP B-TREE FOR ORDER BY',
+    ]
+    assert esquema.recorridos_completos(lineas, {cubriente}) == [
+        'SCAN salida USING INDEX ix_salida_fecha',
+        'SCAN producto',
+        'SCAN usuario USING COVERING INDEX ix_usuario_username LEFT-JOIN',
+    ]
+
+
+def test_migraciones_se_aplican_una_vez(app):
+    with app.app_context():
+        assert esquema.actualizar() == []
+        with db.engine.connect() as conexion:
+            assert esquema.version_actual(conexion) == max(esquema.MIGRACIONES)
+
+
+def test_migracion_reconstruye_indices_cubrientes(app):
+    with app.app_context():
+        with db.engine.begin() as conexion:
+            conexion.execute(text('DROP INDEX ix_salida_producto_fecha'))
+            conexion.execute(text('CREATE INDEX ix_salida_producto_fecha ON salida (producto_id, fecha_salida)'))
+            conexion.execute(text('DROP INDEX ix_producto_en_alerta'))
+            conexion.execute(text('CREATE INDEX ix_producto_en_alerta ON producto (id) WHERE en_alerta = 1'))
+            conexion.execute(text('DELETE FROM esquema_version WHERE version = 6'))
+        assert esquema.actualizar() == [6]
+        with db.engine.connect() as conexion:
+            indices = {i['name']: i for i in inspect(conexion).get_indexes('salida') + inspect(conexion).get_indexes('producto')}
+            sql = conexion.execute(text("SELECT sql FROM sqlite_master WHERE name = 'ix_producto_en_alerta'")).scalar()
+        assert indices['ix_salida_producto_fecha']['column_names'] == [
+            'producto_id', 'fecha_salida', 'id', 'cantidad_salida', 'precio_en_bs']
+        assert indices['ix_producto_en_alerta']['column_names'] == ['alerta_cambio', 'id']
+        assert sql.endswith('WHERE en_alerta = 1')
+
+
+# Tablas de la versión anterior a las migraciones (cantidades y precios en FLOAT)
+_ESQUEMA_ANTERIOR = """
+CREATE TABLE usuario (id INTEGER NOT NULL, username VARCHAR(64), email VARCHAR(120), password_hash VARCHAR(256),
+    rol INTEGER, PRIMARY KEY (id));
+CREATE UNIQUE INDEX ix_usuario_email ON usuario (email);
+CREATE UNIQUE INDEX ix_usuario_username ON usuario (username);
+CREATE TABLE producto (id INTEGER NOT NULL, codigo VARCHAR(50) NOT NULL, nombre VARCHAR(100) NOT NULL,
+    cantidad FLOAT, precio FLOAT, proveedor VARCHAR(100), fecha_ingreso DATETIME, stock_minimo FLOAT,
+    subalmacen VARCHAR(50) NOT NULL, unidad VARCHAR(50) NOT NULL, diametro VARCHAR(50),
+    PRIMARY KEY (id), UNIQUE (codigo));
+CREATE TABLE salida (id INTEGER NOT NULL, producto_id INTEGER NOT NULL, cantidad_salida FLOAT NOT NULL,
+    nombre_funcionario VARCHAR(100) NOT NULL, codigo_funcionario VARCHAR(50) NOT NULL, fecha_salida DATETIME,
+    precio_en_bs FLOAT NOT NULL, imagen_salida VARCHAR(255), usuario_id INTEGER, PRIMARY KEY (id),
+    FOREIGN KEY(producto_id) REFERENCES producto (id), FOREIGN KEY(usuario_id) REFERENCES usuario (id));
+CREATE TABLE ingreso (id INTEGER NOT NULL, producto_id INTEGER NOT NULL, cantidad_agregada FLOAT NOT NULL,
+    fecha_ingreso DATETIME, imagen_ingreso VARCHAR(255), usuario_id INTEGER, PRIMARY KEY (id),
+    FOREIGN KEY(producto_id) REFERENCES producto (id), FOREIGN KEY(usuario_id) REFERENCES usuario (id));
+"""
+
+
+def test_migracion_a_punto_fijo_sobre_datos_float(crear_app, tmp_path):
+    ruta = tmp_path / 'anterior.db'
+    with sqlite3.connect(ruta) as conexion:
+        conexion.executescript(_ESQUEMA_ANTERIOR)
+        conexion.executemany(
+            'INSERT INTO producto (id, codigo, nombre, cantidad, precio, stock_minimo, subalmacen, unidad) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(1, 'A', 'Suma', 0.1 + 0.2, 1.005, 10.0, 'SCPE', 'm'),
+             (2, 'B', 'Empate', 2.0005, 0.125, 1.0, 'SCPE', 'm'),
+             (3, 'C', 'Sin precio', 12.5, None, None, 'SCPE', 'pza')])
+        conexion.executemany(
+            'INSERT INTO salida (producto_id, cantidad_salida, nombre_funcionario, codigo_funcionario, '
+            'fecha_salida, precio_en_bs) VALUES (?, ?, ?, ?, ?, ?)',
+            [(1, 0.1, 'Juan', 'F1', '2024-01-02 10:00:00', 1.005), (1, 0.2, 'Juan', 'F1', '2024-01-03 10:00:00', 2.675)])
+        conexion.execute('INSERT INTO ingreso (producto_id, cantidad_agregada, fecha_ingreso) '
+                         "VALUES (2, 0.7, '2024-01-01 09:00:00')")
+
+    app = crear_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{ruta}')
+    with app.app_context():
+        with db.engine.connect() as conexion:
+            assert esquema.version_actual(conexion) == max(esquema.MIGRACIONES)
+            crudos = conexion.execute(text('SELECT cantidad, precio, stock_minimo FROM producto ORDER BY id')).all()
+        # Mismo redondeo que app/tipos.py al escribir desde la aplicación
+        assert [tuple(fila) for fila in crudos] == [(300, 101, 10000), (2001, 13, 1000), (12500, None, None)]
+        productos = Producto.query.order_by(Producto.id).all()
+        assert [(p.cantidad, p.precio) for p in productos] == [(0.3, 1.01), (2.001, 0.13), (12.5, None)]
+        assert [p.en_alerta for p in productos] == [True, False, False]
+        # 0.1 x 1.01 + 0.2 x 2.68, exacto en enteros
+        assert db.session.query(func.sum(Salida.cantidad_salida * Salida.precio_en_bs)).scalar() == 0.637
+        assert db.session.query(Ingreso.cantidad_agregada).scalar() == 0.7
+
+        # Volver a aplicar no reescala: la migración ya está registrada
+        assert esquema.actualizar() == []
+        stock.descontar(1, 0.1)
+        db.session.commit()
+        assert db.session.get(Producto, 1).cantidad == 0.2
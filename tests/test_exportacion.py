@@ -0,0 +1,52 @@
+# tests/test_exportacion.py
+# Exportación incremental: 'desde_ts' se interpreta igual en todos los reportes.
+
+import csv
+import io
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import Producto, Salida, Usuario
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        producto = Producto(codigo='P1', nombre='Codo', cantidad=10, precio=5, subalmacen='SCPE', unidad='pza')
+        db.session.add_all([admin, producto])
+        db.session.flush()
+        # Fechas en UTC, como se guardan: 06:00, 10:00 y 14:00 en Bolivia
+        for hora in (10, 14, 18):
+            db.session.add(Salida(producto_id=producto.id, cantidad_salida=1, nombre_funcionario='Juan',
+                                  codigo_funcionario='F1', precio_en_bs=5,
+                                  fecha_salida=datetime(2025, 3, 1, hora), usuario_id=admin.id))
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente
+
+
+def _ids(cliente, reporte, desde_ts):
+    respuesta = cliente.get(f'/exportar/{reporte}/csv', query_string={'desde_ts': desde_ts})
+    assert respuesta.status_code == 200
+    filas = list(csv.DictReader(io.StringIO(respuesta.get_data(as_text=True))))
+    return sorted(int(f['id']) for f in filas if reporte == 'reporte_salidas' or f['tipo'] == 'SALIDA')
+
+
+@pytest.mark.parametrize('desde_ts, esperados', [
+    ('2025-03-01T10:00:00', [3]),           # hora de Bolivia = 14:00 UTC
+    ('2025-03-01T10:00:00Z', [2, 3]),       # UTC explícito
+    ('2025-03-01T10:00:00-04:00', [3]),     # misma hora de Bolivia con zona
+])
+def test_desde_ts_igual_en_salidas_e_historial(cliente, desde_ts, esperados):
+    assert _ids(cliente, 'reporte_salidas', desde_ts) == esperados
+    assert _ids(cliente, 'historial', desde_ts) == esperados
+
+
+def test_desde_ts_invalido_redirige(cliente):
+    respuesta = cliente.get('/exportar/reporte_salidas/csv', query_string={'desde_ts': '01/03/2025'})
+    assert respuesta.status_code == 302
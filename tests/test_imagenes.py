@@ -0,0 +1,117 @@
+# tests/test_imagenes.py
+# Procesamiento de fotos (app/imagenes.py): reducción sin metadatos, miniaturas,
+# reclamo atómico de las pendientes y limpieza de la BD si el proceso falla.
+
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app import db, imagenes, tareas
+from app.models import Producto, Salida
+
+
+@pytest.fixture
+def static(app, tmp_path, monkeypatch):
+    """Directorio static/ temporal (no se escribe en app/static/uploads)."""
+    monkeypatch.setattr(imagenes, 'directorio_static', lambda app=None: str(tmp_path))
+    return tmp_path
+
+
+def _jpeg(ancho=3000, alto=2000, exif=True):
+    imagen = Image.new('RGB', (ancho, alto), 'red')
+    datos = Image.Exif()
+    if exif:
+        datos[0x0112] = 6  # Orientación: rotar 90°
+        datos[0x0110] = 'Celular de prueba'
+    archivo = io.BytesIO()
+    imagen.save(archivo, 'JPEG', exif=datos)
+    archivo.seek(0)
+    return archivo
+
+
+def _ruta(static, relativa):
+    return os.path.join(static, *relativa.split('/'))
+
+
+def test_guardar_reduce_sin_metadatos_y_genera_miniaturas(app, static):
+    with app.test_request_context():
+        relativa = imagenes.guardar(FileStorage(_jpeg(), filename='foto de celular.jpg'))
+        extension = imagenes._formato_salida()[1]
+        assert relativa.startswith('uploads/') and relativa.endswith(extension)
+        with Image.open(_ruta(static, relativa)) as procesada:
+            # Orientación aplicada (vertical) y lado mayor reducido, sin EXIF
+            ancho, alto = procesada.size
+            assert alto == app.config['IMAGENES_LADO_MAXIMO'] and ancho == pytest.approx(alto * 2 / 3, abs=1)
+            assert not procesada.getexif()
+        for lado in app.config['IMAGENES_MINIATURAS']:
+            url = imagenes.miniatura(relativa, lado)
+            assert url.endswith(f'_{lado}{extension}')
+            with Image.open(_ruta(static, url.split('/static/', 1)[1])) as miniatura:
+                assert max(miniatura.size) == lado
+        assert imagenes.miniatura(relativa).endswith(relativa)
+        base = _ruta(static, relativa)[:-len(extension)]
+        assert not os.path.exists(base + imagenes.PENDIENTE)
+
+
+def test_miniatura_sin_archivo(app, static):
+    with app.test_request_context():
+        assert imagenes.miniatura(None) is None
+        assert imagenes.miniatura('') is None
+        assert imagenes.miniatura('uploads/2024/01/01/no_existe.webp', 160) is None
+
+
+def test_archivo_que_no_es_imagen(app, static):
+    with app.test_request_context(), pytest.raises(imagenes.ImagenInvalida):
+        imagenes.guardar(FileStorage(io.BytesIO(b'no soy una imagen'), filename='foto.jpg'))
+
+
+def _pendiente(static, nombre='foto', contenido=None):
+    carpeta = static / 'uploads' / '2024' / '01' / '01'
+    carpeta.mkdir(parents=True, exist_ok=True)
+    base = str(carpeta / nombre)
+    with open(base + imagenes.PENDIENTE, 'wb') as archivo:
+        archivo.write(contenido if contenido is not None else _jpeg(400, 300, exif=False).getvalue())
+    return base
+
+
+def test_pendiente_se_procesa_una_sola_vez(app, static):
+    base = _pendiente(static)
+    assert imagenes.pendientes(app) == [base]
+    assert imagenes.procesar(base, app.config) is True
+    # Otro proceso que la había encolado al arrancar ya no la encuentra
+    assert imagenes.procesar(base, app.config) is False
+    assert imagenes.pendientes(app) == []
+
+
+def test_reclamada_por_proceso_vivo_o_terminado(app, static):
+    vivo = _pendiente(static, 'vivo')
+    muerto = _pendiente(static, 'muerto')
+    os.rename(vivo + imagenes.PENDIENTE, vivo + imagenes.EN_PROCESO + tareas.propietario().replace(':', '+'))
+    host = tareas.propietario().split(':')[0]
+    os.rename(muerto + imagenes.PENDIENTE, f'{muerto}{imagenes.EN_PROCESO}{host}+999999999+x')
+    # Solo vuelve a quedar pendiente la del proceso que ya no existe
+    assert imagenes.pendientes(app) == [muerto]
+    assert os.path.exists(muerto + imagenes.PENDIENTE)
+    assert imagenes.procesar(vivo, app.config) is False
+
+
+def test_falla_en_segundo_plano_deja_la_salida_sin_foto(app, static):
+    base = _pendiente(static, contenido=b'GIF89a truncado')
+    relativa = 'uploads/2024/01/01/foto' + imagenes._formato_salida()[1]
+    with app.app_context():
+        producto = Producto(codigo='P1', nombre='Codo', cantidad=1, precio=1, subalmacen='POZO 57', unidad='pza')
+        db.session.add(producto)
+        db.session.flush()
+        db.session.add(Salida(producto_id=producto.id, cantidad_salida=1, precio_en_bs=1, nombre_funcionario='Juan',
+                              codigo_funcionario='F1', imagen_salida=relativa))
+        db.session.commit()
+
+    imagenes._procesar_en_segundo_plano(app, base)
+
+    with app.app_context():
+        assert db.session.query(Salida.imagen_salida).scalar() is None
+    assert os.path.exists(base + imagenes.FALLIDA)
+    assert os.listdir(os.path.dirname(base)) == ['foto' + imagenes.FALLIDA]
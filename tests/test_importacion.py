@@ -0,0 +1,88 @@
+# tests/test_importacion.py
+# Validación e importación masiva de productos (app/importacion.py).
+
+import io
+
+import pandas as pd
+import pytest
+
+from app import db, importacion
+from app.models import Producto, Usuario
+from config import Config
+
+
+@pytest.fixture
+def usuario_id(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add(admin)
+        db.session.commit()
+        return admin.id
+
+
+def _df(**columnas):
+    base = {'Código': ['A1'], 'Nombre': ['Codo'], 'Cantidad': [5], 'Precio': [2.5],
+            'Subalmacén': ['SCPE'], 'Unidad': ['pza']}
+    base.update(columnas)
+    return pd.DataFrame(base)
+
+
+@pytest.mark.parametrize('columna, valor, mensaje', [
+    ('Cantidad', float('inf'), 'Cantidad no es un número.'),
+    ('Cantidad', 'inf', 'Cantidad no es un número.'),
+    ('Cantidad', 'nan', 'Cantidad no es un número.'),
+    ('Precio', 1e20, 'Precio no puede superar'),
+    ('Stock Mínimo', float('-inf'), 'Stock Mínimo no es un número.'),
+    ('Cantidad', -1, 'Cantidad no puede ser negativo.'),
+])
+def test_numero_no_valido_es_error_de_la_fila(app, usuario_id, columna, valor, mensaje):
+    df = pd.concat([_df(), _df(**{'Código': ['A2'], columna: [valor]})], ignore_index=True)
+    with app.app_context():
+        resultado = importacion.importar(df, usuario_id)
+        assert resultado.creados == 1
+        assert [fila for fila, _ in resultado.errores] == [3]
+        assert resultado.errores[0][1].startswith(mensaje)
+        assert db.session.query(Producto.codigo).scalar() == 'A1'
+
+
+def test_actualizar_conserva_columnas_ausentes_o_vacias(app, usuario_id):
+    with app.app_context():
+        db.session.add(Producto(codigo='A1', nombre='Codo', cantidad=30, precio=5, subalmacen='SCPE', unidad='pza',
+                                proveedor='ACME', diametro='2"', stock_minimo=25))
+        db.session.commit()
+        df = _df(**{'Código': ['A1', 'N1'], 'Nombre': ['Codo', 'Nuevo'], 'Cantidad': [20, 4], 'Precio': [6, 1],
+                    'Subalmacén': ['SCPE'] * 2, 'Unidad': ['pza'] * 2, 'Proveedor': [None, None]})
+        resultado = importacion.importar(df, usuario_id, modo='actualizar')
+        assert (resultado.creados, resultado.actualizados, resultado.errores) == (1, 1, [])
+        existente = Producto.query.filter_by(codigo='A1').one()
+        assert (existente.cantidad, existente.precio, existente.proveedor, existente.diametro,
+                existente.stock_minimo, existente.en_alerta) == (20.0, 6.0, 'ACME', '2"', 25.0, True)
+        assert Producto.query.filter_by(codigo='N1').one().stock_minimo == Config.STOCK_MINIMO
+
+
+def _excel(filas, encabezados):
+    archivo = io.BytesIO()
+    pd.DataFrame(filas, columns=encabezados).to_excel(archivo, index=False)
+    archivo.seek(0)
+    return archivo
+
+
+ENCABEZADOS_CON_ESPACIOS = ['Código ', ' Nombre', 'Cantidad', 'Precio ', 'Subalmacén', 'Unidad']
+FILAS = [['0012', 'Codo', 5, 2.5, 'SCPE', 'pza'], [34, 'Te', 1, 1, 'SCPE', 'pza']]
+
+
+def test_encabezados_con_espacios_en_los_tres_lectores(tmp_path):
+    directo = importacion.leer_excel(_excel(FILAS, ENCABEZADOS_CON_ESPACIOS))
+    ruta_xlsx = tmp_path / 'productos.xlsx'
+    ruta_xlsx.write_bytes(_excel(FILAS, ENCABEZADOS_CON_ESPACIOS).getvalue())
+    ruta_csv = tmp_path / 'productos.csv'
+    ruta_csv.write_text(';'.join(ENCABEZADOS_CON_ESPACIOS) + '\n0012;Codo;5;2.5;SCPE;pza\n34;Te;1;1;SCPE;pza\n',
+                        encoding='utf-8')
+    lecturas = [directo] + [df for ruta, formato in ((ruta_xlsx, 'xlsx'), (ruta_csv, 'csv'))
+                            for df, _ in importacion.leer_lotes(str(ruta), formato)]
+    for df in lecturas:
+        validos, errores = importacion.validar(df)
+        assert errores == []
+        assert validos['codigo'].tolist() == ['0012', '34']
+        assert validos['cantidad'].tolist() == [5.0, 1.0]
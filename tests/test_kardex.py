@@ -0,0 +1,123 @@
+# tests/test_kardex.py
+# Cortes de saldo del kardex (app/kardex.py): el saldo corrido coincide con el
+# stock, los saldos son los mismos con y sin cortes, y un movimiento
+# retroactivo ajusta los cortes posteriores (_actualizar_cortes).
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, kardex, stock
+from app.models import Producto, Salida, Ingreso, SaldoProducto, Usuario
+
+INICIO = datetime.utcnow() - timedelta(days=100)
+
+
+def _ingreso(producto_id, cantidad, fecha, usuario_id):
+    stock.reponer(producto_id, cantidad)
+    db.session.add(Ingreso(producto_id=producto_id, cantidad_agregada=cantidad, fecha_ingreso=fecha,
+                           usuario_id=usuario_id))
+
+
+def _salida(producto_id, cantidad, fecha, usuario_id):
+    stock.descontar(producto_id, cantidad)
+    db.session.add(Salida(producto_id=producto_id, cantidad_salida=cantidad, fecha_salida=fecha,
+                          nombre_funcionario='Juan', codigo_funcionario='F1', precio_en_bs=2.0,
+                          usuario_id=usuario_id))
+
+
+@pytest.fixture
+def productos(app):
+    """Dos productos con 100 días de movimientos (cantidades con decimales) y sus cortes."""
+    with app.app_context():
+        usuario = Usuario(username='almacen', email='almacen@example.com', rol=2)
+        productos = [Producto(codigo=f'K{n}', nombre=f'Kardex {n}', cantidad=0, precio=2,
+                              subalmacen='SCPE', unidad='m') for n in range(2)]
+        db.session.add_all([usuario] + productos)
+        db.session.flush()
+        for dia in range(100):
+            fecha = INICIO + timedelta(days=dia)
+            for producto in productos:
+                _ingreso(producto.id, 10.125, fecha, usuario.id)
+                if dia % 3:
+                    _salida(producto.id, 4.5 + producto.id, fecha + timedelta(hours=1), usuario.id)
+        db.session.commit()
+        assert kardex.generar_cortes() >= 3
+        return [p.id for p in productos], usuario.id
+
+
+def _saldo_final(producto_id):
+    """Saldo corrido del último movimiento, recorriendo todas las páginas del kardex."""
+    saldo, despues = None, None
+    while True:
+        pagina, _ = kardex.kardex_producto(producto_id, INICIO - timedelta(days=1), datetime.utcnow(),
+                                           despues=despues, por_pagina=40)
+        if pagina.items:
+            saldo = pagina.items[-1]['saldo']
+        if not pagina.siguiente:
+            return saldo
+        despues = pagina.siguiente
+
+
+def _sin_cortes(funcion, *args):
+    """Resultado de 'funcion' calculado solo con los movimientos (se descartan los cortes)."""
+    punto = db.session.begin_nested()
+    db.session.query(SaldoProducto).delete()
+    try:
+        return funcion(*args)
+    finally:
+        punto.rollback()
+
+
+def test_saldo_corrido_coincide_con_stock(app, productos):
+    ids, _ = productos
+    with app.app_context():
+        for producto_id in ids:
+            cantidad = db.session.get(Producto, producto_id).cantidad
+            assert _saldo_final(producto_id) == pytest.approx(cantidad)
+            assert kardex.saldo_en_fecha(producto_id, datetime.utcnow()) == pytest.approx(cantidad)
+
+
+def test_saldos_iguales_con_y_sin_cortes(app, productos):
+    with app.app_context():
+        for dias in (0, 15, 31, 45, 61, 90, 101):
+            fecha = INICIO + timedelta(days=dias, hours=12)
+            con_cortes = kardex.saldos_en_fecha(fecha)
+            assert con_cortes == pytest.approx(_sin_cortes(kardex.saldos_en_fecha, fecha))
+
+
+def test_movimiento_retroactivo_ajusta_cortes_posteriores(app, productos):
+    (primero, segundo), usuario_id = productos
+    with app.app_context():
+        antes = dict(db.session.query(SaldoProducto.fecha_corte, SaldoProducto.cantidad)
+                     .filter_by(producto_id=primero).all())
+        # Una salida entre el primer y el último corte
+        salida = Salida.query.filter(Salida.producto_id == primero, Salida.fecha_salida > min(antes),
+                                     Salida.fecha_salida < max(antes)).order_by(Salida.fecha_salida).first()
+        fecha = salida.fecha_salida
+
+        # Edición de una salida antigua (como editar_salida) y un ingreso con fecha pasada
+        salida.cantidad_salida += 3
+        db.session.add(Ingreso(producto_id=segundo, cantidad_agregada=7.25, fecha_ingreso=INICIO,
+                               usuario_id=usuario_id))
+        db.session.commit()
+
+        despues = dict(db.session.query(SaldoProducto.fecha_corte, SaldoProducto.cantidad)
+                       .filter_by(producto_id=primero).all())
+        for corte, cantidad in antes.items():
+            esperado = cantidad - 3 if corte > fecha else cantidad
+            assert despues[corte] == pytest.approx(esperado)
+        for dias in (10, 25, 50, 80, 101):
+            momento = INICIO + timedelta(days=dias)
+            assert kardex.saldos_en_fecha(momento) == pytest.approx(_sin_cortes(kardex.saldos_en_fecha, momento))
+
+
+def test_eliminar_movimiento_retroactivo(app, productos):
+    (primero, _), _ = productos
+    with app.app_context():
+        ingreso = Ingreso.query.filter_by(producto_id=primero).order_by(Ingreso.fecha_ingreso).first()
+        db.session.delete(ingreso)
+        db.session.commit()
+        momento = INICIO + timedelta(days=70)
+        assert kardex.saldo_en_fecha(primero, momento) == \
+            pytest.approx(_sin_cortes(kardex.saldo_en_fecha, primero, momento))
@@ -0,0 +1,44 @@
+# tests/test_paginacion.py
+# Cursores de la paginación keyset (app/paginacion.py).
+
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import Usuario
+from app.paginacion import codificar_cursor, decodificar_cursor
+
+
+def _token(valores):
+    crudo = json.dumps(valores).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def test_cursor_ida_y_vuelta():
+    valores = [datetime(2025, 11, 7, 13, 0, 5), 'salida', 42]
+    assert decodificar_cursor(codificar_cursor(valores)) == valores
+
+
+@pytest.mark.parametrize('token', [
+    'no es base64!',
+    _token({'a': 1}),
+    _token([{'$dt': 'x'}]),
+    _token([{'$dt': 5}]),
+])
+def test_cursor_manipulado_es_invalido(token):
+    assert decodificar_cursor(token) is None
+
+
+def test_historial_con_cursor_manipulado(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add(admin)
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    assert cliente.get('/historial?despues=' + _token([{'$dt': 'x'}, 'salida', 1])).status_code == 200
+    assert cliente.get('/?despues=' + _token([{'$dt': 'x'}, 1])).status_code == 200
@@ -0,0 +1,57 @@
+# tests/test_salidas.py
+# Validación de cantidades de salida: formulario /salida y API de documentos.
+
+import pytest
+
+from app import db
+from app.models import Producto, Salida, Usuario
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        admin = Usuario(username='admin', email='admin@example.com', rol=1)
+        admin.set_password('admin')
+        db.session.add_all([admin, Producto(codigo='P1', nombre='Codo', cantidad=10, precio=5,
+                                             subalmacen='SCPE', unidad='pza')])
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente
+
+
+def _salidas(app):
+    with app.app_context():
+        return Salida.query.count(), db.session.query(Producto.cantidad).scalar()
+
+
+@pytest.mark.parametrize('cantidad, mensaje', [
+    ('nan', 'Ingrese un número válido.'),
+    ('inf', 'Ingrese un número válido.'),
+    ('-inf', 'Ingrese un número válido.'),
+    ('1e20', 'Number must be between'),
+])
+def test_formulario_rechaza_cantidad_no_valida(app, cliente, cantidad, mensaje):
+    respuesta = cliente.post('/salida', data={'producto_id': 1, 'cantidad_salida': cantidad,
+                                              'nombre_funcionario': 'Juan', 'codigo_funcionario': 'F1'})
+    # Se vuelve a mostrar el formulario con el error del campo
+    assert respuesta.status_code == 200
+    assert mensaje in respuesta.get_data(as_text=True)
+    assert _salidas(app) == (0, 10.0)
+
+
+def test_formulario_registra_cantidad_valida(app, cliente):
+    respuesta = cliente.post('/salida', data={'producto_id': 1, 'cantidad_salida': '2.5',
+                                              'nombre_funcionario': 'Juan', 'codigo_funcionario': 'F1'})
+    assert respuesta.status_code == 302
+    assert _salidas(app) == (1, 7.5)
+
+
+@pytest.mark.parametrize('cantidad', ['NaN', 'Infinity', '"nan"', '1e20', '0'])
+def test_api_rechaza_cantidad_no_valida_por_linea(app, cliente, cantidad):
+    cuerpo = ('{"nombre_funcionario": "Juan", "codigo_funcionario": "F1", '
+              '"lineas": [{"producto_id": 1, "cantidad": 1}, {"producto_id": 1, "cantidad": %s}]}' % cantidad)
+    respuesta = cliente.post('/api/salidas', data=cuerpo, content_type='application/json')
+    assert respuesta.status_code == 422
+    assert [e['linea'] for e in respuesta.get_json()['errores']] == [2]
+    assert _salidas(app) == (0, 10.0)
@@ -0,0 +1,60 @@
+# tests/test_stock.py
+# Salidas concurrentes (app/stock.py): varios hilos descuentan del mismo
+# producto, cada uno con su sesión, como lo hace la ruta /salida. No se pierde
+# ninguna actualización y el stock nunca queda negativo.
+
+import threading
+
+from app import db, stock
+from app.models import Producto, Salida, Usuario
+
+HILOS = 8
+SALIDAS_POR_HILO = 50
+STOCK_INICIAL = 300.0
+
+
+def _trabajador(app, producto_id, usuario_id, conteo, candado):
+    with app.app_context():
+        registradas = rechazadas = 0
+        for _ in range(SALIDAS_POR_HILO):
+            try:
+                stock.descontar(producto_id, 1)
+                db.session.add(Salida(producto_id=producto_id, cantidad_salida=1, nombre_funcionario='Prueba',
+                                      codigo_funcionario='P1', precio_en_bs=1.0, usuario_id=usuario_id))
+                db.session.commit()
+                registradas += 1
+            except stock.StockInsuficiente:
+                db.session.rollback()
+                rechazadas += 1
+        db.session.remove()
+        with candado:
+            conteo['registradas'] += registradas
+            conteo['rechazadas'] += rechazadas
+
+
+def test_salidas_concurrentes_sin_actualizaciones_perdidas(app):
+    with app.app_context():
+        usuario = Usuario(username='prueba', email='prueba@example.com', rol=2)
+        usuario.set_password('prueba')
+        producto = Producto(codigo='CONC', nombre='Producto de prueba', cantidad=STOCK_INICIAL, precio=1.0,
+                            subalmacen='SCPE', unidad='pza')
+        db.session.add_all([usuario, producto])
+        db.session.commit()
+        producto_id, usuario_id = producto.id, usuario.id
+
+    conteo = {'registradas': 0, 'rechazadas': 0}
+    candado = threading.Lock()
+    hilos = [threading.Thread(target=_trabajador, args=(app, producto_id, usuario_id, conteo, candado))
+             for _ in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    with app.app_context():
+        final = db.session.get(Producto, producto_id).cantidad
+        salidas = Salida.query.filter_by(producto_id=producto_id).count()
+
+    assert conteo['registradas'] == salidas == STOCK_INICIAL
+    assert conteo['rechazadas'] == HILOS * SALIDAS_POR_HILO - STOCK_INICIAL
+    assert final == STOCK_INICIAL - salidas == 0
@@ -0,0 +1,53 @@
+# tests/test_tipos.py
+# Punto fijo (app/tipos.py): redondeo al escalar y ida y vuelta por la BD.
+
+import pytest
+from sqlalchemy import func, text
+
+from app import db
+from app.models import Producto
+from app.tipos import VALOR_MAXIMO, escalar, producto_exacto
+
+
+@pytest.mark.parametrize('valor, decimales, entero', [
+    (0.1 + 0.2, 2, 30),           # 0.30000000000000004
+    (0.1 + 0.2, 3, 300),
+    (1.005, 2, 101),              # el float es 1.00499999..., se redondea el número escrito
+    (2.675, 2, 268),
+    (0.125, 2, 13),               # mitad lejos de cero, no al par
+    (-0.125, 2, -13),
+    (-1.005, 2, -101),
+    (0.0004, 3, 0),
+    (0.0005, 3, 1),
+    (VALOR_MAXIMO, 3, 10 ** 12),
+    (VALOR_MAXIMO - 0.001, 3, 10 ** 12 - 1),
+    (123456789.125, 3, 123456789125),
+    ('7.5', 3, 7500),
+])
+def test_escalar(valor, decimales, entero):
+    assert escalar(valor, decimales) == entero
+
+
+def test_producto_exacto():
+    assert producto_exacto(0.1, 3, 0.1, 2) == 0.01
+    assert producto_exacto(3, 3, 1.005, 2) == 3.03
+    assert producto_exacto(None, 3, 1, 2) == 0.0
+
+
+def test_ida_y_vuelta_por_la_bd(app):
+    valores = [(0.1 + 0.2, 1.005), (-2.5, 0.125), (VALOR_MAXIMO, VALOR_MAXIMO), (0.0005, 0.0)]
+    with app.app_context():
+        db.session.add_all([Producto(codigo=f'F{n}', nombre='Fijo', cantidad=cantidad, precio=precio,
+                                     subalmacen='SCPE', unidad='m') for n, (cantidad, precio) in enumerate(valores)])
+        db.session.commit()
+        db.session.expunge_all()
+        guardados = db.session.execute(text('SELECT cantidad, precio FROM producto ORDER BY id')).all()
+        assert [tuple(fila) for fila in guardados] == [(300, 101), (-2500, 13), (10 ** 12, 10 ** 11), (1, 0)]
+        leidos = [(p.cantidad, p.precio) for p in Producto.query.order_by(Producto.id)]
+        assert leidos == [(0.3, 1.01), (-2.5, 0.13), (VALOR_MAXIMO, VALOR_MAXIMO), (0.001, 0.0)]
+        # Comparaciones y sumas en SQL con la escala de la columna
+        assert Producto.query.filter(Producto.cantidad == 0.1 + 0.2).count() == 1
+        assert db.session.query(func.sum(Producto.cantidad)).filter(Producto.cantidad < 1).scalar() == -2.199
+        valor = db.session.query(func.sum(Producto.cantidad * Producto.precio)).filter(Producto.cantidad < 1).scalar()
+        # 0.303 - 0.325 en flotantes da -0.021999999999999964
+        assert valor == -0.022